@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from account.models import rebuild_networth
+
+
+class Command(BaseCommand):
+    help = "Recomputes accounts' latest amount and today's net worth from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--username",
+            nargs="*",
+            help="only rebuild net worth of these users, all users by default",
+        )
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(account_names__isnull=False).distinct()
+        if options["username"]:
+            users = users.filter(username__in=options["username"])
+
+        for user in users.iterator():
+            rebuild_networth(user)
+            self.stdout.write(f"{user}: net worth rebuilt")
+        self.stdout.write(self.style.SUCCESS("Net worth rebuilt successfully!"))
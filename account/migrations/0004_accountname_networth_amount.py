@@ -0,0 +1,35 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:27
+
+from django.db import migrations, models
+from django.db.models import Case, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+
+def set_networth_amount(apps, schema_editor):
+    AccountName = apps.get_model("account", "AccountName")
+    AccountNameAmount = apps.get_model("account", "AccountNameAmount")
+    latest_amount = (
+        AccountNameAmount.objects.filter(account_name=OuterRef("pk"))
+        .order_by("-date")
+        .values("amount")[:1]
+    )
+    AccountName.objects.update(
+        networth_amount=Coalesce(Subquery(latest_amount), Value(0))
+        * Case(When(type=0, then=Value(-1)), default=Value(1))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_add_indexes_to_account_models'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountname',
+            name='networth_amount',
+            field=models.BigIntegerField(default=0, editable=False, help_text='latest amount as counted in net worth, negative for liability'),
+        ),
+        migrations.RunPython(set_networth_amount, migrations.RunPython.noop),
+    ]
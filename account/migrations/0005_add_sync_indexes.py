@@ -0,0 +1,34 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Now
+
+
+def fill_last_modified_at(apps, schema_editor):
+    # sync pages by (last_modified_at, id), so it can't be NULL
+    for model_name in ('accountname', 'accountnameamount'):
+        model = apps.get_model('account', model_name)
+        model.objects.filter(last_modified_at__isnull=True).update(
+            last_modified_at=Coalesce('created_at', Now())
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_accountname_networth_amount'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_last_modified_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='accountname',
+            index=models.Index(fields=['user', 'last_modified_at'], name='account_acc_user_id_af6031_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountnameamount',
+            index=models.Index(fields=['account_name', 'last_modified_at'], name='account_acc_account_e62feb_idx'),
+        ),
+    ]
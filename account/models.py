@@ -1,15 +1,47 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
 
 from utils.base_model import BaseModel
-from utils.helpers import get_ist_datetime
+from utils.helpers import bump_ledger_generation, get_ist_datetime
+from utils.models import is_restoring, record_tombstone
 
 User = get_user_model()
 
 # Create your models here.
 
 
+class AccountNameQuerySet(models.QuerySet):
+    def with_latest_amount(self):
+        """
+        annotates latest_amount, latest_date and latest_created_at
+        of every account, None if account has no amount yet.
+        """
+        latest = AccountNameAmount.objects.filter(
+            account_name=OuterRef("pk")
+        ).order_by("-date")
+        return self.annotate(
+            latest_amount=Subquery(latest.values("amount")[:1]),
+            latest_date=Subquery(latest.values("date")[:1]),
+            latest_created_at=Subquery(latest.values("created_at")[:1]),
+        )
+
+    def update_networth_amount(self):
+        """recomputes networth_amount of the accounts from their latest amount"""
+        latest_amount = (
+            AccountNameAmount.objects.filter(account_name=OuterRef("pk"))
+            .order_by("-date")
+            .values("amount")[:1]
+        )
+        return self.update(
+            networth_amount=Coalesce(Subquery(latest_amount), Value(0))
+            * Case(When(type=0, then=Value(-1)), default=Value(1))
+        )
+
+
 class AccountName(BaseModel):
     TYPES = [
         (0, "Liability"),
@@ -20,10 +52,28 @@ class AccountName(BaseModel):
     )
     name = models.CharField(max_length=128)
     type = models.IntegerField(choices=TYPES)
+    networth_amount = models.BigIntegerField(
+        default=0,
+        editable=False,
+        help_text="latest amount as counted in net worth, negative for liability",
+    )
+
+    objects = AccountNameQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.user} - {self.name}"
 
+    def save(self, *args, **kwargs):
+        # networth_amount is only updated by sync_account_networth(),
+        # saving a stale instance must not overwrite it
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "networth_amount"
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = (
             "name",
@@ -36,6 +86,8 @@ class AccountName(BaseModel):
         )
         indexes = [
             models.Index(fields=["user", "name"]),
+            # changes since last sync, see utils.sync
+            models.Index(fields=["user", "last_modified_at"]),
         ]
 
 
@@ -65,31 +117,129 @@ class AccountNameAmount(BaseModel):
                     "-date",
                 )
             ),
+            # has no user, changes since last sync are found per account
+            models.Index(fields=("account_name", "last_modified_at")),
         ]
 
 
-def _save_networth(instance, *args, **kwargs):
+def _save_today_networth(user_id, delta):
+    # account amounts changed even if net worth didn't
+    bump_ledger_generation(user_id)
     today_date = get_ist_datetime().date()
-    user = instance.account_name.user
-    account_names = user.account_names.all()
-    networth_amount = 0
-    for account in account_names:
-        account_amount = account.amounts.order_by("-date").first()
-        if account_amount:
-            if account.type == 0:
-                networth_amount -= account_amount.amount
-            else:
-                networth_amount += account_amount.amount
+    networth = NetWorth.objects.filter(user_id=user_id, date=today_date)
+    # update() skips auto_now, incremental backups need last_modified_at
+    if networth.update(amount=F("amount") + delta, last_modified_at=timezone.now()):
+        return
+
+    networth_amount = (
+        AccountName.objects.filter(user_id=user_id).aggregate(
+            Sum("networth_amount")
+        )["networth_amount__sum"]
+        or 0
+    )
     try:
-        networth = NetWorth.objects.get(user=user, date=today_date)
-        networth.amount = networth_amount
-        networth.save()
-    except NetWorth.DoesNotExist:
-        NetWorth.objects.create(user=user, amount=networth_amount, date=today_date)
+        with transaction.atomic():
+            NetWorth.objects.create(
+                user_id=user_id, amount=networth_amount, date=today_date
+            )
+    except IntegrityError:
+        # created by a concurrent update in the meantime
+        networth.update(amount=F("amount") + delta, last_modified_at=timezone.now())
+
+
+def sync_account_networth(account_name_id, save_unchanged=True):
+    """
+    applies the change in account's latest amount to today's net worth.
+    account row is locked till commit, so concurrent updates of
+    the same account can't apply the same change twice.
+    """
+    with transaction.atomic():
+        account = (
+            AccountName.objects.select_for_update()
+            .filter(pk=account_name_id)
+            .first()
+        )
+        if account is None:
+            return
+
+        latest_amount = (
+            account.amounts.order_by("-date").values_list("amount", flat=True).first()
+            or 0
+        )
+        networth_amount = -latest_amount if account.type == 0 else latest_amount
+        delta = networth_amount - account.networth_amount
+        if not delta and not save_unchanged:
+            return
+        if delta:
+            AccountName.objects.filter(pk=account.pk).update(
+                networth_amount=networth_amount
+            )
+        _save_today_networth(account.user_id, delta)
+
+
+def rebuild_networth(user):
+    """
+    recomputes latest amount of all the user's accounts
+    and today's net worth from scratch.
+    """
+    with transaction.atomic():
+        AccountName.objects.filter(user=user).update_networth_amount()
+        networth_amount = (
+            AccountName.objects.filter(user=user).aggregate(
+                Sum("networth_amount")
+            )["networth_amount__sum"]
+            or 0
+        )
+        NetWorth.objects.update_or_create(
+            user=user,
+            date=get_ist_datetime().date(),
+            defaults={"amount": networth_amount},
+        )
+    bump_ledger_generation(user.id)
+
+
+def _save_networth(instance, *args, **kwargs):
+    # user is being deleted, nothing to update
+    origin = kwargs.get("origin")
+    if getattr(origin, "model", type(origin)) is User or is_restoring():
+        return
+    sync_account_networth(instance.account_name_id)
+
+
+def _update_account_networth(instance, created, *args, **kwargs):
+    # account type may have changed from asset to liability or vice versa
+    if not created:
+        sync_account_networth(instance.pk, save_unchanged=False)
 
 
 post_save.connect(_save_networth, sender=AccountNameAmount)
 post_delete.connect(_save_networth, sender=AccountNameAmount)
+post_save.connect(_update_account_networth, sender=AccountName)
+
+
+def _invalidate_account_name_cache(instance, *args, **kwargs):
+    # name and type are shown on net worth dashboard
+    bump_ledger_generation(instance.user_id)
+
+
+post_save.connect(_invalidate_account_name_cache, sender=AccountName)
+post_delete.connect(_invalidate_account_name_cache, sender=AccountName)
+
+
+def _record_amount_tombstone(instance, *args, **kwargs):
+    # account is already loaded if it's being deleted with its amounts
+    origin = kwargs.get("origin")
+    if isinstance(origin, AccountName):
+        user_id = origin.user_id
+    else:
+        user_id = AccountName.objects.values_list("user_id", flat=True).get(
+            pk=instance.account_name_id
+        )
+    record_tombstone(instance, *args, user_id=user_id, **kwargs)
+
+
+post_delete.connect(record_tombstone, sender=AccountName)
+post_delete.connect(_record_amount_tombstone, sender=AccountNameAmount)
 
 
 class NetWorth(BaseModel):
@@ -117,3 +267,11 @@ class NetWorth(BaseModel):
                 ]
             ),
         ]
+
+
+def _invalidate_networth_cache(instance, *args, **kwargs):
+    bump_ledger_generation(instance.user_id)
+
+
+post_save.connect(_invalidate_networth_cache, sender=NetWorth)
+post_delete.connect(_invalidate_networth_cache, sender=NetWorth)
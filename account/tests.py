@@ -1,3 +1,145 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from account.models import AccountName, AccountNameAmount, NetWorth
+from utils.helpers import get_ist_datetime
 
 # Create your tests here.
+
+
+class NetWorthTestCase(TestCase):
+    """
+    Test cases for net worth maintained on account amount writes.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.today = get_ist_datetime().date()
+        self.bank = AccountName.objects.create(user=self.user, name='bank', type=1)
+        self.loan = AccountName.objects.create(user=self.user, name='loan', type=0)
+
+    def get_networth(self):
+        return NetWorth.objects.get(user=self.user, date=self.today).amount
+
+    def test_networth_follows_latest_amounts(self):
+        """
+        Net worth is adjusted by the change in account's latest amount.
+        """
+        AccountNameAmount.objects.create(
+            account_name=self.bank, amount=1000, date=self.today
+        )
+        self.assertEqual(self.get_networth(), 1000)
+
+        loan_amount = AccountNameAmount.objects.create(
+            account_name=self.loan, amount=300, date=self.today
+        )
+        self.assertEqual(self.get_networth(), 700)
+
+        # older amounts don't change the latest amount
+        AccountNameAmount.objects.create(
+            account_name=self.bank,
+            amount=50,
+            date=self.today.replace(year=self.today.year - 1),
+        )
+        self.assertEqual(self.get_networth(), 700)
+
+        loan_amount.amount = 100
+        loan_amount.save()
+        self.assertEqual(self.get_networth(), 900)
+
+        self.loan.type = 1
+        self.loan.save()
+        self.assertEqual(self.get_networth(), 1100)
+
+        self.bank.delete()
+        self.assertEqual(self.get_networth(), 100)
+
+    def test_rebuild_networth_command(self):
+        """
+        The rebuild_networth command recomputes net worth from scratch.
+        """
+        AccountNameAmount.objects.create(
+            account_name=self.bank, amount=1000, date=self.today
+        )
+        AccountNameAmount.objects.create(
+            account_name=self.loan, amount=300, date=self.today
+        )
+        NetWorth.objects.update(amount=0)
+        AccountName.objects.update(networth_amount=0)
+
+        call_command('rebuild_networth', stdout=StringIO())
+        self.assertEqual(self.get_networth(), 700)
+        self.assertEqual(
+            AccountName.objects.get(pk=self.loan.pk).networth_amount, -300
+        )
+
+
+class NetWorthDashboardTestCase(TestCase):
+    """
+    Test cases for net worth dashboard.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+        self.today = get_ist_datetime().date()
+
+    def add_account(self, name, type, amount=None):
+        account = AccountName.objects.create(user=self.user, name=name, type=type)
+        if amount is not None:
+            AccountNameAmount.objects.create(
+                account_name=account, amount=amount, date=self.today
+            )
+        return account
+
+    def get_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('account:networth-dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_account_without_amount(self):
+        """
+        Accounts without any amount are shown with 0 and not as updated.
+        """
+        self.add_account('bank', 1, 1000)
+        self.add_account('cash', 1)
+        self.add_account('loan', 0, 300)
+
+        response, _ = self.get_dashboard()
+        assets = {
+            row['account_name'].name: row for row in response.context['assets']
+        }
+        self.assertEqual(assets['bank']['amount'], 1000)
+        self.assertEqual(assets['cash']['amount'], 0)
+        self.assertFalse(assets['cash']['updated'])
+        self.assertEqual(response.context['asset_amount'], 1000)
+        self.assertEqual(response.context['liability_amount'], 300)
+
+    def test_query_count_independent_of_accounts(self):
+        """
+        Dashboard runs the same number of queries for any number of accounts.
+        """
+        self.add_account('bank', 1, 1000)
+        self.add_account('loan', 0, 300)
+        _, few_queries = self.get_dashboard()
+
+        for i in range(10):
+            self.add_account(f'fund {i}', i % 2, 100 * i)
+        _, many_queries = self.get_dashboard()
+
+        self.assertEqual(few_queries, many_queries)
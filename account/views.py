@@ -13,15 +13,14 @@ from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.generic import DeleteView
 
+from utils.expense_profile import ExpenseProfile
 from utils.helpers import (
-    aggregate_sum,
-    cal_avg_expense,
     cal_networth_x,
     calculate_cagr,
-    fetch_year_expenses,
     get_client_ip,
     get_ist_datetime,
-    get_paginator_object,
+    get_keyset_paginator_object,
+    ledger_condition,
 )
 
 from .forms import (
@@ -131,6 +130,7 @@ class ChangePassword(LoginRequiredMixin, View):
 """
 
 
+@method_decorator(ledger_condition, name="dispatch")
 class NetWorthDashboard(LoginRequiredMixin, View):
     template_name = "networth.html"
 
@@ -139,9 +139,10 @@ class NetWorthDashboard(LoginRequiredMixin, View):
         prev_updated_date = get_ist_datetime() - timedelta(days=90)
         networths = user.net_worth.order_by("-date")
         networth = networths.first()
+        expense_profile = ExpenseProfile.get(user)
 
         if networth:
-            avg_expense = cal_avg_expense(user)
+            avg_expense = expense_profile.mean
             x = cal_networth_x(networth.amount, avg_expense)
         else:
             x = avg_expense = 0
@@ -150,22 +151,23 @@ class NetWorthDashboard(LoginRequiredMixin, View):
         assets = []
         liability_amount = 0
         asset_amount = 0
-        account_names = user.account_names.all()
+        account_names = user.account_names.with_latest_amount()
         for account in account_names:
-            amount = account.amounts.order_by("-date").first()
+            amount = account.latest_amount or 0
+            updated_at = account.latest_created_at
             data = {
                 "account_name": account,
-                "amount": amount.amount if amount and amount.amount else 0,
-                "updated": True if amount.created_at >= prev_updated_date else False,
+                "amount": amount,
+                "updated": bool(updated_at and updated_at >= prev_updated_date),
             }
             if account.type == 0:
                 liabilities.append(data)
-                liability_amount += amount.amount if amount else 0
+                liability_amount += amount
             else:
                 assets.append(data)
-                asset_amount += amount.amount if amount else 0
+                asset_amount += amount
 
-        total_saved_amount = aggregate_sum(user.incomes) - aggregate_sum(user.expenses)
+        total_saved_amount = expense_profile.total_saved_amount
         # lambda function to sort by amount value
         desc_amount_sort = lambda li: sorted(
             li, key=lambda x: x["amount"], reverse=True
@@ -209,16 +211,12 @@ class NetworthXView(LoginRequiredMixin, View):
             networth_amount = networth.amount
 
         data = []
-        last_12m_expense = cal_avg_expense(user, YEARS=1)
-        year_expenses = fetch_year_expenses(user, YEARS=3)
+        expense_profile = ExpenseProfile.get(user)
+        last_12m_expense = expense_profile.last_12m_expense
 
         methods = ["mean", "median", "max", "min"]
         for method in methods:
-            expense = cal_avg_expense(
-                user,
-                method=method,
-                year_expenses=year_expenses,
-            )
+            expense = expense_profile.avg_expense(method)
             if expense == last_12m_expense:
                 method += " (last 12 months')"
             nw_data = self.fetch_networth_x(
@@ -232,9 +230,10 @@ class NetworthXView(LoginRequiredMixin, View):
         emergency_fund = median_year_expense  # 1 year
 
         fire_amount = median_year_expense * 30
-        fire_amount_coverage = networth_amount / fire_amount
         fat_fire_amount = median_year_expense * 100
-        fat_fire_coverage = networth_amount / fat_fire_amount
+        # no expense yet i.e. new user
+        fire_amount_coverage = networth_amount / fire_amount if fire_amount else 0
+        fat_fire_coverage = networth_amount / fat_fire_amount if fat_fire_amount else 0
 
         context = {
             "title": "Networth X",
@@ -262,11 +261,10 @@ class NetWorthHistoryView(LoginRequiredMixin, View):
             years = (final.date - start.date).days / 365
             history_cagr = calculate_cagr(final.amount, start.amount, years)
 
-        objects = get_paginator_object(request, networth, 25)
+        objects = get_keyset_paginator_object(request, networth, 25, ("-date",))
         context = {
             "title": "NetWorth",
             "objects": objects,
-            "is_paginated": True,
             "history_cagr": history_cagr,
         }
         return render(request, self.template_name, context)
@@ -415,15 +413,14 @@ class AccountNameAccountHistory(LoginRequiredMixin, View):
             years = (latest.date - start.date).days / 365
             latest_amount = latest.amount
             history_cagr = calculate_cagr(latest_amount, start.amount, years)
-            x = cal_networth_x(latest_amount, cal_avg_expense(request.user))
+            x = cal_networth_x(latest_amount, ExpenseProfile.get(request.user).mean)
         else:
             history_cagr = x = 0
 
-        objects = get_paginator_object(request, history, 25)
+        objects = get_keyset_paginator_object(request, history, 25, ("-date",))
         context = {
             "title": f"{instance.name} ({instance.get_type_display()})",
             "objects": objects,
-            "is_paginated": True,
             "latest_amount": latest_amount,
             "history_cagr": history_cagr,
             "x": x,
@@ -2,6 +2,7 @@ from datetime import timedelta
 
 from django import forms
 from django.conf import settings
+from utils.constants import MAX_AMOUNT
 from utils.helpers import get_ist_datetime, default_date_format
 
 
@@ -17,6 +18,13 @@ class ExpenseForm(forms.Form):
         self.fields['timestamp'].initial = default_date_format(get_ist_datetime())
 
 
+class BulkExpenseForm(forms.Form):
+    """an expense of the bulk JSON api, limits match the models"""
+    amount = forms.IntegerField(min_value=0, max_value=MAX_AMOUNT)
+    remark = forms.CharField(required=False, max_length=30)
+    timestamp = forms.DateField(input_formats=settings.DATE_INPUT_FORMATS)
+
+
 class SelectDateRangeExpenseForm(forms.Form):
     remark = forms.CharField(required=False,
         widget=forms.TextInput(attrs={
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from utils.base_model import rebuild_monthly_rollups
+
+
+def build_rollups(apps, schema_editor):
+    Expense = apps.get_model("expense", "Expense")
+    ExpenseMonthlyRollup = apps.get_model("expense", "ExpenseMonthlyRollup")
+    rebuild_monthly_rollups(ExpenseMonthlyRollup, Expense.objects.all(), "remark_id")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expense', '0009_update_index_on_expense_model'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('last_modified_at', models.DateTimeField(auto_now=True, null=True)),
+                ('month', models.DateField(help_text='first day of the month')),
+                ('amount', models.BigIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('remark', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='monthly_rollups', to='expense.remark')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-month'], name='expense_exp_user_id_46ba76_idx')],
+                'unique_together': {('user', 'month', 'remark')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
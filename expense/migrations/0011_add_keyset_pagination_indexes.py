@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expense', '0010_add_monthly_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='expense_exp_user_id_cddd7c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['user', '-amount', '-id'], name='expense_exp_user_id_900a1d_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# on UPPER(name) as icontains/istartswith/iexact compile to
+# UPPER("name"::text) LIKE UPPER(%s) on postgres
+CREATE_INDEX = (
+    "CREATE INDEX IF NOT EXISTS expense_remark_name_trgm_idx "
+    "ON expense_remark USING gin (UPPER(name) gin_trgm_ops)"
+)
+DROP_INDEX = "DROP INDEX IF EXISTS expense_remark_name_trgm_idx"
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expense', '0011_add_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        # both are no-op on databases other than postgres i.e. sqlite
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -1,32 +1,39 @@
+from collections import defaultdict
 from datetime import date, timedelta
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Sum
-from django.db.models.signals import pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.utils import timezone
 
-from utils.base_model import BaseModel
-from utils.helpers import get_ist_datetime
+from utils.autocomplete import REMARKS
+from utils.base_model import (
+    BaseModel,
+    BaseMonthlyRollup,
+    LedgerQuerySet,
+    get_or_create_names,
+)
+from utils.expense_profile import ExpenseProfile
+from utils.helpers import (
+    bump_ledger_generation,
+    get_ist_datetime,
+    invalidate_year_expenses,
+)
+from utils.models import record_tombstone
 
 # Create your models here.
 
 
-class ExpenseManager(models.Manager):
+class ExpenseManager(models.Manager.from_queryset(LedgerQuerySet)):
     def all(self, user=None, *args, **kwargs):
-        return super(ExpenseManager, self).filter(user=user)
+        return self.for_user(user)
 
     def this_year(self, user=None, year=None, *args, **kwargs):
-        year = year if year else get_ist_datetime().year
-        qs = super(ExpenseManager, self).filter(user=user).filter(timestamp__year=year)
-        return qs
+        return self.for_user(user).in_year(year)
 
     def this_month(self, user=None, year=None, month=None, *args, **kwargs):
-        month = month if month else get_ist_datetime().month
-        qs = Expense.objects.this_year(user=user, year=year).filter(
-            timestamp__month=month
-        )
-        return qs
+        return self.for_user(user).in_month(year, month)
 
     def last_month(self, user=None, *args, **kwargs):
         today = get_ist_datetime().date()
@@ -38,11 +45,7 @@ class ExpenseManager(models.Manager):
         return qs
 
     def this_day(self, user=None, year=None, month=None, day=None, *args, **kwargs):
-        day = day if day else get_ist_datetime().day
-        qs = Expense.objects.this_month(user=user, year=year, month=month).filter(
-            timestamp__day=day
-        )
-        return qs
+        return self.for_user(user).on_day(year, month, day)
 
     def amount_sum(self, user=None, year=None, month=None, day=None, *args, **kwargs):
         total = {}
@@ -78,7 +81,13 @@ class Remark(BaseModel):
             "user",
             "name",
         )
-        indexes = [models.Index(fields=("user", "name"))]
+        # trigram index on name for search is created by migration
+        # 0012_add_remark_name_trigram_index on postgres only
+        indexes = [
+            models.Index(fields=("user", "name")),
+            # changes since last sync, see utils.sync
+            models.Index(fields=("user", "last_modified_at")),
+        ]
 
 
 class Expense(BaseModel):
@@ -109,6 +118,10 @@ class Expense(BaseModel):
                     "-created_at",
                 )
             ),
+            # keyset pagination of ExpenseList, see get_keyset_paginator_object
+            models.Index(fields=("user", "-timestamp", "-id")),
+            models.Index(fields=("user", "-amount", "-id")),
+            models.Index(fields=("user", "last_modified_at")),
         ]
         ordering = (
             "-timestamp",
@@ -116,9 +129,160 @@ class Expense(BaseModel):
         )
 
 
+class ExpenseMonthlyRollup(BaseMonthlyRollup):
+    """
+    monthly expense of a user per remark, maintained by Expense save/delete
+    hooks. use `rebuild_rollups` management command to recompute.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="expense_rollups",
+        on_delete=models.CASCADE,
+    )
+    remark = models.ForeignKey(
+        Remark,
+        null=True,
+        blank=True,
+        related_name="monthly_rollups",
+        on_delete=models.SET_NULL,
+    )
+
+    def __str__(self):
+        return "{} : {} : {}".format(self.remark, self.amount, self.month)
+
+    class Meta:
+        unique_together = (
+            "user",
+            "month",
+            "remark",
+        )
+        indexes = [models.Index(fields=("user", "-month"))]
+
+
 def preprocess_remark(instance, sender, *args, **kwargs):
     if instance.name:
         instance.name = instance.name.strip().lower()
 
 
 pre_save.connect(preprocess_remark, sender=Remark)
+
+
+def _remove_remark_autocomplete(instance, *args, **kwargs):
+    REMARKS.remove(instance.user_id, instance.name)
+
+
+post_delete.connect(_remove_remark_autocomplete, sender=Remark)
+
+
+def _fetch_expense_rollup_key(instance, *args, **kwargs):
+    instance._rollup_key = None
+    if not instance._state.adding:
+        instance._rollup_key = (
+            Expense.objects.filter(pk=instance.pk)
+            .values_list("user_id", "timestamp", "remark_id", "amount")
+            .first()
+        )
+
+
+def _update_expense_rollup(instance, *args, **kwargs):
+    old_key = getattr(instance, "_rollup_key", None)
+    with transaction.atomic():
+        if old_key:
+            user_id, timestamp, remark_id, amount = old_key
+            ExpenseMonthlyRollup.apply_delta(
+                user_id, timestamp, -amount, -1, remark_id=remark_id
+            )
+        ExpenseMonthlyRollup.apply_delta(
+            instance.user_id,
+            instance.timestamp,
+            instance.amount,
+            1,
+            remark_id=instance.remark_id,
+        )
+
+
+def _delete_expense_rollup(instance, *args, **kwargs):
+    ExpenseMonthlyRollup.apply_delta(
+        instance.user_id,
+        instance.timestamp,
+        -instance.amount,
+        -1,
+        remark_id=instance.remark_id,
+    )
+
+
+pre_save.connect(_fetch_expense_rollup_key, sender=Expense)
+post_save.connect(_update_expense_rollup, sender=Expense)
+post_delete.connect(_delete_expense_rollup, sender=Expense)
+
+
+def _invalidate_expense_cache(instance, *args, **kwargs):
+    invalidate_year_expenses(instance.user_id)
+    ExpenseProfile.invalidate(instance.user_id)
+    bump_ledger_generation(instance.user_id)
+
+
+post_save.connect(_invalidate_expense_cache, sender=Expense)
+post_delete.connect(_invalidate_expense_cache, sender=Expense)
+# renaming a remark or deleting it, which sets remark of its expenses
+# to null by update(), changes the reports too
+post_save.connect(_invalidate_expense_cache, sender=Remark)
+post_delete.connect(_invalidate_expense_cache, sender=Remark)
+post_delete.connect(record_tombstone, sender=Expense)
+post_delete.connect(record_tombstone, sender=Remark)
+
+
+def _invalidate_user_expenses(user_id):
+    invalidate_year_expenses(user_id)
+    ExpenseProfile.invalidate(user_id)
+
+
+def get_or_create_remarks(user, names):
+    """
+    {name: remark id} of the user's remarks, creating missing ones.
+    """
+    # pre_save is skipped by bulk_create, so names are preprocessed here
+    names = {name.strip().lower() for name in names}
+    return get_or_create_names(Remark, user, names)
+
+
+def bulk_create_expenses(user, rows, batch_size=1000):
+    """
+    creates expenses from dicts of amount, remark name and timestamp.
+    bulk_create skips the save signals, so rollups, caches and
+    autocomplete are updated here once for all the rows, rollups of
+    all the months and remarks of the rows in a few queries.
+    """
+    rows = list(rows)
+    remarks = get_or_create_remarks(user, (row["remark"] or "" for row in rows))
+    expenses = [
+        Expense(
+            user=user,
+            amount=row["amount"],
+            remark_id=remarks.get((row["remark"] or "").strip().lower()),
+            timestamp=row["timestamp"],
+        )
+        for row in rows
+    ]
+
+    deltas = defaultdict(lambda: [0, 0])
+    usage = defaultdict(int)
+    for expense in expenses:
+        month = date(expense.timestamp.year, expense.timestamp.month, 1)
+        delta = deltas[(month, expense.remark_id)]
+        delta[0] += expense.amount
+        delta[1] += 1
+        if expense.remark_id:
+            usage[expense.remark_id] += 1
+
+    with transaction.atomic():
+        Expense.objects.bulk_create(expenses, batch_size=batch_size)
+        ExpenseMonthlyRollup.apply_deltas(user.id, deltas, "remark_id")
+        bump_ledger_generation(user.id)
+        # after commit, else other requests may cache the old rows again
+        transaction.on_commit(lambda: _invalidate_user_expenses(user.id))
+
+    names = {remark_id: name for name, remark_id in remarks.items()}
+    for remark_id, count in usage.items():
+        REMARKS.record(user.id, names[remark_id], count)
+    return expenses
@@ -1,10 +1,26 @@
 import datetime
+import gzip
+import json
+from io import StringIO
+from unittest import mock, skipUnless
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from expense.models import Expense, Remark
+from expense.models import Expense, ExpenseMonthlyRollup, Remark, bulk_create_expenses
+from income.models import Income, SavingCalculation
+from utils import helpers
+from utils.autocomplete import REMARKS, get_redis
+from utils.constants import MAX_AMOUNT
+from utils.expense_profile import ExpenseProfile
 
 
 class AddExpenseViewTestCase(TestCase):
@@ -75,3 +91,1031 @@ class AddExpenseViewTestCase(TestCase):
             response.context['objects'],
             [], transform=lambda x: x
         )
+
+
+class MonthWiseExpenseViewTestCase(TestCase):
+    """
+    Test case for month and year wise expense views.
+    """
+
+    def setUp(self):
+        """
+        Creating expenses and incomes spread over different months.
+        """
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+
+        for month, amount in [(1, 100), (1, 200), (3, 400)]:
+            Expense.objects.create(
+                user=self.user,
+                amount=amount,
+                timestamp=datetime.date(2020, month, 10),
+            )
+        Income.objects.create(
+            user=self.user,
+            amount=1000,
+            timestamp=datetime.date(2020, 1, 1),
+        )
+
+    def test_bucket_aggregate_zero_fills_months(self):
+        """
+        Months without expenses are present with zero amount.
+        """
+        data = helpers.bucket_aggregate(
+            Expense.objects.all(user=self.user), 'month',
+            datetime.date(2020, 1, 1), datetime.date(2020, 4, 1),
+        )
+        self.assertEqual(list(data), [
+            datetime.date(2020, 4, 1),
+            datetime.date(2020, 3, 1),
+            datetime.date(2020, 2, 1),
+            datetime.date(2020, 1, 1),
+        ])
+        self.assertEqual(data[datetime.date(2020, 1, 1)], {'amount': 300, 'count': 2})
+        self.assertEqual(data[datetime.date(2020, 2, 1)], {'amount': 0, 'count': 0})
+        self.assertEqual(data[datetime.date(2020, 3, 1)], {'amount': 400, 'count': 1})
+
+    def test_month_wise_expense_data(self):
+        """
+        The month wise expense view contains monthly totals and EIR.
+        """
+        response = self.client.get(reverse('expense:month-wise-expense'), {'year': 2020})
+        data = {row['date']: row for row in response.context['data']}
+        self.assertEqual(len(data), 12)
+        self.assertEqual(data[datetime.date(2020, 1, 1)]['amount'], 300)
+        self.assertEqual(data[datetime.date(2020, 1, 1)]['month_eir'], 30)
+        self.assertEqual(data[datetime.date(2020, 2, 1)]['amount'], 0)
+        self.assertEqual(data[datetime.date(2020, 3, 1)]['amount'], 400)
+
+    def test_year_wise_expense_data(self):
+        """
+        The year wise expense view contains yearly totals.
+        """
+        data = {}
+        for page in range(1, 4):
+            response = self.client.get(reverse('expense:year-wise-expense'), {'page': page})
+            data.update({row['year']: row for row in response.context['data']})
+        self.assertEqual(data[2020]['amount'], 700)
+        self.assertEqual(data[2020]['year_eir'], 70)
+
+
+class DayWiseExpenseViewTestCase(TestCase):
+    """
+    Test case for day wise expense view.
+    """
+
+    def setUp(self):
+        """
+        Creating two expenses on each of 55 days.
+        """
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+
+        self.first_day = datetime.date(2020, 1, 1)
+        for days in range(55):
+            for amount in (100, 50):
+                Expense.objects.create(
+                    user=self.user,
+                    amount=amount,
+                    timestamp=self.first_day + datetime.timedelta(days=days),
+                )
+
+    def test_day_wise_expense_pages(self):
+        """
+        Pages move by "days before/after" cursors.
+        """
+        url = reverse('expense:day-wise-expense')
+        response = self.client.get(url)
+        data = response.context['data']
+        objects = response.context['objects']
+        self.assertEqual(len(data), 50)
+        self.assertEqual(data[0]['day'], self.first_day + datetime.timedelta(days=54))
+        self.assertEqual(data[0]['day_sum'], 150)
+        self.assertEqual(data[0]['count'], 2)
+        self.assertFalse(objects['has_previous'])
+        self.assertTrue(objects['has_next'])
+
+        response = self.client.get(f"{url}?{objects['next_query']}")
+        data = response.context['data']
+        objects = response.context['objects']
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[-1]['day'], self.first_day)
+        self.assertTrue(objects['has_previous'])
+        self.assertFalse(objects['has_next'])
+
+        response = self.client.get(f"{url}?{objects['previous_query']}")
+        data = response.context['data']
+        self.assertEqual(len(data), 50)
+        self.assertEqual(data[0]['day'], self.first_day + datetime.timedelta(days=54))
+        self.assertFalse(response.context['objects']['has_previous'])
+
+
+class ExpenseMonthlyRollupTestCase(TestCase):
+    """
+    Test case for expense monthly rollup maintenance.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.remark = Remark.objects.create(user=self.user, name='food')
+
+    def get_rollups(self):
+        return set(
+            ExpenseMonthlyRollup.objects.filter(user=self.user, count__gt=0)
+            .values_list('month', 'remark_id', 'amount', 'count')
+        )
+
+    def test_rollup_follows_save_and_delete(self):
+        """
+        Rollups are updated on expense create, update and delete.
+        """
+        expense = Expense.objects.create(
+            user=self.user, amount=100, timestamp=datetime.date(2020, 1, 10),
+        )
+        Expense.objects.create(
+            user=self.user, amount=50, timestamp=datetime.date(2020, 1, 20),
+        )
+        self.assertEqual(self.get_rollups(), {
+            (datetime.date(2020, 1, 1), None, 150, 2),
+        })
+
+        expense.amount = 300
+        expense.remark = self.remark
+        expense.timestamp = datetime.date(2020, 2, 5)
+        expense.save()
+        self.assertEqual(self.get_rollups(), {
+            (datetime.date(2020, 1, 1), None, 50, 1),
+            (datetime.date(2020, 2, 1), self.remark.id, 300, 1),
+        })
+
+        expense.delete()
+        self.assertEqual(self.get_rollups(), {
+            (datetime.date(2020, 1, 1), None, 50, 1),
+        })
+
+    def test_rebuild_rollups_command(self):
+        """
+        The rebuild_rollups command recomputes the same rollups.
+        """
+        for day, remark in [(1, None), (2, self.remark), (3, self.remark)]:
+            Expense.objects.create(
+                user=self.user, amount=day * 100, remark=remark,
+                timestamp=datetime.date(2020, 3, day),
+            )
+        rollups = self.get_rollups()
+        ExpenseMonthlyRollup.objects.all().delete()
+
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.get_rollups(), rollups)
+
+
+class RemarkWiseExpenseViewTestCase(TestCase):
+    """
+    Test case for remark wise expense view.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+
+        food = Remark.objects.create(user=self.user, name='food')
+        rent = Remark.objects.create(user=self.user, name='rent')
+        for amount, remark in [(100, food), (200, food), (1000, rent), (50, None)]:
+            Expense.objects.create(
+                user=self.user, amount=amount, remark=remark,
+                timestamp=datetime.date(2020, 1, 10),
+            )
+        Income.objects.create(
+            user=self.user, amount=2700, timestamp=datetime.date(2020, 1, 1),
+        )
+
+    def test_remark_wise_expense_data(self):
+        """
+        The remark wise view contains per remark totals in DESC order.
+        """
+        response = self.client.get(
+            reverse('expense:goto_year_expense', kwargs={'year': 2020})
+        )
+        self.assertEqual(response.context['total'], 1350)
+        self.assertEqual(response.context['count'], 3)
+        self.assertEqual(
+            [
+                (row['remark_name'], row['amount'], row['remark_count'], row['eir'])
+                for row in response.context['remarks']
+            ],
+            [('rent', 1000, 1, 37.04), ('food', 300, 2, 11.11), (None, 50, 1, 1.85)],
+        )
+        self.assertContains(response, 'Others')
+
+
+class FetchYearExpensesTestCase(TestCase):
+    """
+    Test case for yearly expenses used by average expense calculations.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        this_month = helpers.get_ist_datetime().date().replace(day=1)
+        self.last_month = this_month - datetime.timedelta(days=1)
+        for months_ago, amount in [(1, 100), (12, 200), (13, 400), (36, 800)]:
+            timestamp = this_month
+            for _ in range(months_ago):
+                timestamp = (timestamp - datetime.timedelta(days=1)).replace(day=1)
+            Expense.objects.create(user=self.user, amount=amount, timestamp=timestamp)
+        # current month is excluded
+        Expense.objects.create(user=self.user, amount=5000, timestamp=this_month)
+
+    def test_fetch_year_expenses(self):
+        """
+        Expenses are summed in blocks of 12 months from last month.
+        """
+        self.assertEqual(helpers.fetch_year_expenses(self.user), [300, 400, 800])
+        self.assertEqual(helpers.fetch_year_expenses(self.user, YEARS=1), [300])
+
+    def test_fetch_year_expenses_is_cached_till_expense_write(self):
+        """
+        Yearly expenses are cached and invalidated by expense writes.
+        """
+        helpers.fetch_year_expenses(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(helpers.fetch_year_expenses(self.user), [300, 400, 800])
+
+        Expense.objects.create(user=self.user, amount=50, timestamp=self.last_month)
+        self.assertEqual(helpers.fetch_year_expenses(self.user), [350, 400, 800])
+
+
+class ExpenseProfileTestCase(TestCase):
+    """
+    Test case for cached expense statistics of a user.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        this_month = helpers.get_ist_datetime().date().replace(day=1)
+        timestamp = this_month
+        for months_ago in range(1, 37):
+            timestamp = (timestamp - datetime.timedelta(days=1)).replace(day=1)
+            amount = 100 if months_ago <= 12 else 200 if months_ago <= 24 else 600
+            Expense.objects.create(user=self.user, amount=amount, timestamp=timestamp)
+        Income.objects.create(user=self.user, amount=20000, timestamp=this_month)
+
+    def test_expense_profile_statistics(self):
+        """
+        All the statistics are computed from yearly expenses.
+        """
+        profile = ExpenseProfile.get(self.user)
+        self.assertEqual(profile.year_expenses, [1200, 2400, 7200])
+        self.assertEqual(profile.mean, 3600)
+        self.assertEqual(profile.median, 2400)
+        self.assertEqual(profile.avg_expense('max'), 7200)
+        self.assertEqual(profile.avg_expense('min'), 1200)
+        self.assertEqual(profile.last_12m_expense, 1200)
+        self.assertEqual(profile.total_saved_amount, 9200)
+        self.assertEqual(profile.eir, 54)
+
+    def test_expense_profile_is_invalidated_on_write(self):
+        """
+        The cached profile is invalidated by expense and income writes.
+        """
+        ExpenseProfile.get(self.user)
+        with self.assertNumQueries(0):
+            ExpenseProfile.get(self.user)
+
+        Income.objects.create(
+            user=self.user, amount=10800, timestamp=datetime.date(2020, 1, 1)
+        )
+        self.assertEqual(ExpenseProfile.get(self.user).eir, 35.06)
+
+
+class ExpenseDateRangeTestCase(TestCase):
+    """
+    Test cases for date range filters of expense manager.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        for timestamp in ['2023-12-31', '2024-01-01', '2024-02-29', '2024-03-01', '2024-12-31', '2025-01-01']:
+            Expense.objects.create(
+                user=self.user,
+                amount=100,
+                timestamp=datetime.date.fromisoformat(timestamp),
+            )
+
+    def get_dates(self, qs):
+        return sorted(str(dt) for dt in qs.values_list('timestamp', flat=True))
+
+    def test_ranges_include_bucket_edges(self):
+        """
+        Year, month and day filters include both edges of the bucket.
+        """
+        self.assertEqual(
+            self.get_dates(Expense.objects.this_year(user=self.user, year=2024)),
+            ['2024-01-01', '2024-02-29', '2024-03-01', '2024-12-31'],
+        )
+        self.assertEqual(
+            self.get_dates(Expense.objects.this_month(user=self.user, year=2024, month=2)),
+            ['2024-02-29'],
+        )
+        self.assertEqual(
+            self.get_dates(Expense.objects.this_month(user=self.user, year=2024, month=12)),
+            ['2024-12-31'],
+        )
+        self.assertEqual(
+            self.get_dates(Expense.objects.this_day(user=self.user, year=2023, month=12, day=31)),
+            ['2023-12-31'],
+        )
+
+    def test_filters_are_chainable(self):
+        """
+        Filters chain with each other and compile to plain range lookups.
+        """
+        qs = Expense.objects.for_user(self.user).in_year(2024).in_month(2024, 3)
+        self.assertEqual(self.get_dates(qs), ['2024-03-01'])
+        self.assertNotIn('EXTRACT', str(qs.query).upper())
+        self.assertEqual(
+            self.get_dates(self.user.incomes.in_year(2024)), []
+        )
+
+
+class ExpenseListViewTestCase(TestCase):
+    """
+    Test cases for cursor paginated expense list.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+        today = helpers.get_ist_datetime().date()
+        # few expenses share a date to check tie break on id
+        for i in range(70):
+            Expense.objects.create(
+                user=self.user,
+                amount=(i * 37) % 100,
+                timestamp=today - datetime.timedelta(days=i // 3),
+            )
+
+    def get_page(self, query=''):
+        response = self.client.get(reverse('expense:expense_list') + '?' + query)
+        self.assertEqual(response.status_code, 200)
+        return response.context['objects']
+
+    def walk_pages(self, query=''):
+        pages = [self.get_page(query)]
+        while pages[-1].has_next:
+            pages.append(self.get_page(pages[-1].next_query))
+        return pages
+
+    def test_pages_cover_all_expenses_in_order(self):
+        """
+        Next cursors walk every expense exactly once in default order.
+        """
+        pages = self.walk_pages()
+        self.assertEqual([len(page) for page in pages], [30, 30, 10])
+        self.assertFalse(pages[0].has_previous)
+        ids = [expense.id for page in pages for expense in page]
+        expected = Expense.objects.all(user=self.user).order_by('-timestamp', '-id')
+        self.assertEqual(ids, [expense.id for expense in expected])
+
+        previous = self.get_page(pages[2].previous_query)
+        self.assertEqual(list(previous), list(pages[1]))
+        self.assertTrue(previous.has_previous)
+        self.assertTrue(previous.has_next)
+
+    def test_amount_sort(self):
+        """
+        Amount sort walks expenses in ascending order of amount.
+        """
+        pages = self.walk_pages('field=amount&order=')
+        ids = [expense.id for page in pages for expense in page]
+        expected = Expense.objects.all(user=self.user).order_by('amount', 'id')
+        self.assertEqual(ids, [expense.id for expense in expected])
+
+    def test_invalid_cursor_and_field(self):
+        """
+        Unknown sort fields and bad cursors fall back to the first page.
+        """
+        first = self.get_page()
+        self.assertEqual(list(self.get_page('cursor=garbage')), list(first))
+        self.assertEqual(list(self.get_page('field=user__password')), list(first))
+
+        # well formed cursor with values of the wrong type
+        for values in (['garbage', 1], [None, 1], [{}, 1]):
+            cursor = helpers.encode_cursor('next', values)
+            self.assertEqual(list(self.get_page(f'cursor={cursor}')), list(first))
+
+
+class GetRemarkViewTestCase(TestCase):
+    """
+    Test cases for remark autocomplete.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+        # keys outlive the rollback of other tests, which reuse user ids
+        REMARKS.invalidate(self.user.id)
+        today = helpers.get_ist_datetime().date()
+        for name, count in [('food', 3), ('fuel', 5), ('fast food', 1), ('rent', 2)]:
+            remark = Remark.objects.create(user=self.user, name=name)
+            for _ in range(count):
+                Expense.objects.create(user=self.user, remark=remark, amount=10, timestamp=today)
+
+    def tearDown(self):
+        REMARKS.invalidate(self.user.id)
+
+    def get_remarks(self, term):
+        response = self.client.get(reverse('expense:get_remark'), {'term': term})
+        return response.json()
+
+    def test_remarks_ranked_by_usage(self):
+        """
+        Short terms match start of remarks, longer terms anywhere,
+        most used remarks first.
+        """
+        self.assertEqual(self.get_remarks('f'), ['fuel', 'food', 'fast food'])
+        self.assertEqual(self.get_remarks('ood'), ['food', 'fast food'])
+        self.assertEqual(self.get_remarks('xyz'), [])
+
+    def test_deleted_remark_not_suggested(self):
+        """
+        Deleted remarks are removed from suggestions.
+        """
+        self.get_remarks('f')
+        Remark.objects.get(user=self.user, name='fuel').delete()
+        self.assertEqual(self.get_remarks('f'), ['food', 'fast food'])
+
+    @skipUnless(get_redis(), 'autocomplete is kept in redis only')
+    def test_remarks_ranked_from_bounded_candidates(self):
+        """
+        Most used remarks are suggested even if they are outside
+        the window of matches looked at.
+        """
+        with mock.patch.multiple(REMARKS, MAX_CANDIDATES=1, TOP_NAMES=2):
+            self.assertEqual(self.get_remarks('f'), ['fuel', 'food', 'fast food'])
+        with mock.patch.multiple(REMARKS, MAX_CANDIDATES=1, TOP_NAMES=1):
+            self.assertEqual(self.get_remarks('f'), ['fuel', 'fast food'])
+
+
+class SearchExpensesTestCase(TestCase):
+    """
+    Test cases for expense search tokens.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.today = helpers.get_ist_datetime().date()
+        food = Remark.objects.create(user=self.user, name='food')
+        fast_food = Remark.objects.create(user=self.user, name='fast food')
+        fuel = Remark.objects.create(user=self.user, name='fuel')
+        for remark, amount, days in [
+            (food, 100, 0), (fast_food, 600, 1), (fuel, 1000, 40), (None, 50, 0),
+        ]:
+            Expense.objects.create(
+                user=self.user,
+                remark=remark,
+                amount=amount,
+                timestamp=self.today - datetime.timedelta(days=days),
+            )
+
+    def search(self, q):
+        objects = helpers.search_expenses(Expense.objects.all(user=self.user), q)
+        return sorted(objects.values_list('amount', flat=True))
+
+    def test_remark_tokens(self):
+        """
+        Remark tokens match exactly, by prefix or anywhere.
+        """
+        self.assertEqual(self.search('"food"'), [100])
+        self.assertEqual(self.search('fa*'), [600])
+        self.assertEqual(self.search('f*'), [100, 600, 1000])
+        self.assertEqual(self.search('food'), [100, 600])
+        self.assertEqual(self.search('""'), [50])
+        self.assertEqual(self.search('"food", fuel'), [100, 1000])
+
+    def test_amount_and_date_tokens(self):
+        """
+        Amount and date tokens are AND-ed with remark tokens.
+        """
+        self.assertEqual(self.search('>500'), [600, 1000])
+        self.assertEqual(self.search('100..600'), [100, 600])
+        self.assertEqual(self.search('50, 1000'), [50, 1000])
+        self.assertEqual(self.search('food, >=600'), [600])
+        self.assertEqual(self.search('@today'), [50, 100])
+        self.assertEqual(self.search('@30d'), [50, 100, 600])
+        self.assertEqual(self.search('fu*, @30d'), [])
+        self.assertEqual(self.search('fa*, @30d'), [600])
+        this_month = Expense.objects.this_month(user=self.user)
+        self.assertEqual(
+            self.search(f'@{self.today.year}-{self.today.month:02}'),
+            sorted(this_month.values_list('amount', flat=True)),
+        )
+
+
+class GoToExpenseViewTestCase(TestCase):
+    """
+    Test cases for expenses of a particular month.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+        self.url = reverse('expense:goto_expense', kwargs={'year': 2020, 'month': 1})
+
+    def add_expenses(self, count):
+        for i in range(count):
+            remark, _ = Remark.objects.get_or_create(user=self.user, name=f'remark {i}')
+            Expense.objects.create(
+                user=self.user,
+                remark=remark,
+                amount=100,
+                timestamp=datetime.date(2020, 1, 1 + i % 28),
+            )
+
+    def get_response(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_totals_and_query_count(self):
+        """
+        Total and count come along with the page, remarks are fetched
+        with expenses.
+        """
+        self.add_expenses(2)
+        response, few_queries = self.get_response()
+        self.assertEqual(response.context['total'], 200)
+        self.assertEqual(response.context['count'], 2)
+
+        self.add_expenses(60)
+        response, many_queries = self.get_response()
+        self.assertEqual(response.context['total'], 6200)
+        self.assertEqual(response.context['count'], 62)
+        self.assertEqual(response.context['objects'].paginator.num_pages, 2)
+        self.assertEqual(few_queries, many_queries)
+
+
+class CachedAggregateTestCase(TestCase):
+    """
+    Test cases for aggregates cached by ledger generation.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+        self.today = helpers.get_ist_datetime().date()
+
+    def get_basic_info(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('expense:get-basic-info'))
+        return response.json(), len(queries)
+
+    def test_writes_invalidate_cached_aggregate(self):
+        """
+        Cached value is served till the next write of user's data.
+        """
+        calls = []
+
+        def fn():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(helpers.cached_aggregate(self.user, 'test', fn), 1)
+        self.assertEqual(helpers.cached_aggregate(self.user, 'test', fn), 1)
+
+        expense = Expense.objects.create(user=self.user, amount=100, timestamp=self.today)
+        self.assertEqual(helpers.cached_aggregate(self.user, 'test', fn), 2)
+        expense.delete()
+        self.assertEqual(helpers.cached_aggregate(self.user, 'test', fn), 3)
+        Income.objects.create(user=self.user, amount=100, timestamp=self.today)
+        self.assertEqual(helpers.cached_aggregate(self.user, 'test', fn), 4)
+        self.assertEqual(helpers.cached_aggregate(self.user, 'other', fn), 5)
+
+    def test_basic_info_served_from_cache(self):
+        """
+        Basic info is computed once and recomputed after a new expense.
+        """
+        Expense.objects.create(user=self.user, amount=100, timestamp=self.today)
+        data, first_queries = self.get_basic_info()
+        self.assertEqual(data['today_expense'], '100')
+
+        data, cached_queries = self.get_basic_info()
+        self.assertEqual(data['today_expense'], '100')
+        self.assertLess(cached_queries, first_queries)
+
+        Expense.objects.create(user=self.user, amount=50, timestamp=self.today)
+        data, _ = self.get_basic_info()
+        self.assertEqual(data['today_expense'], '150')
+
+    def test_basic_info_after_saving_settings(self):
+        """
+        Basic info is recomputed after saving calculation settings are updated.
+        """
+        SavingCalculation.objects.create(
+            user=self.user,
+            savings_fixed_amount=0,
+            savings_percentage=0,
+            amount_to_keep_in_bank=1000,
+        )
+        data, _ = self.get_basic_info()
+        self.assertEqual(data['spending_power'], '1,000')
+
+        response = self.client.post(reverse('income:savings-calculation-detail'), {
+            'amount_to_keep_in_bank': 5000,
+            'auto_fill_amount_to_keep_in_bank': 0,
+            'savings_fixed_amount': 0,
+            'savings_percentage': 0,
+            'amount_in_multiples_of': 100,
+        })
+        self.assertEqual(response.status_code, 200)
+        data, _ = self.get_basic_info()
+        self.assertEqual(data['spending_power'], '5,000')
+
+
+class ConditionalGetTestCase(TestCase):
+    """
+    Test cases for ETag based conditional GET of report pages.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+        self.today = helpers.get_ist_datetime().date()
+
+    def test_not_modified_till_next_write(self):
+        """
+        Pages respond 304 for the same ETag till user's data changes.
+        """
+        for url_name in ['expense:year-wise-expense', 'expense:get-basic-info', 'income:report']:
+            url = reverse(url_name)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            self.assertIn('no-cache', response['Cache-Control'])
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+            Expense.objects.create(user=self.user, amount=100, timestamp=self.today)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_not_modified_till_settings_saved(self):
+        """
+        Basic info responds 200 for an old ETag after saving calculation
+        settings are updated or a remark is deleted.
+        """
+        SavingCalculation.objects.create(
+            user=self.user,
+            savings_fixed_amount=0,
+            savings_percentage=0,
+            amount_to_keep_in_bank=1000,
+        )
+        url = reverse('expense:get-basic-info')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post(reverse('income:savings-calculation-detail'), {
+            'amount_to_keep_in_bank': 5000,
+            'auto_fill_amount_to_keep_in_bank': 0,
+            'savings_fixed_amount': 0,
+            'savings_percentage': 0,
+            'amount_in_multiples_of': 100,
+        })
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['spending_power'], '5,000')
+
+        etag = response['ETag']
+        Remark.objects.create(user=self.user, name='food').delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_differs_between_users(self):
+        """
+        Another user's page with the same data has a different ETag.
+        """
+        url = reverse('expense:year-wise-expense')
+        etag = self.client.get(url)['ETag']
+
+        other_user = get_user_model().objects.create_user(
+            username='other_user', password='asdfghjkl'
+        )
+        self.client.force_login(other_user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class FragmentCacheTestCase(TestCase):
+    """
+    Test cases for cached report tables.
+    """
+
+    def setUp(self):
+        cache.clear()
+        caches['fragments'].clear()
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+        self.today = helpers.get_ist_datetime().date()
+
+    def get_fragment(self, url):
+        version = f'{helpers.get_ledger_generation(self.user.id)}:{self.today}'
+        key = make_template_fragment_key('year-expense', [self.user.id, version, url])
+        return caches['fragments'].get(key)
+
+    def test_year_table_cached_per_ledger_version(self):
+        """
+        Year table is cached till the next write of user's data.
+        """
+        Expense.objects.create(user=self.user, amount=1234, timestamp=self.today)
+        url = reverse('expense:year-wise-expense')
+        self.assertIsNone(self.get_fragment(url))
+
+        self.client.get(url)
+        self.assertIn('1,234', self.get_fragment(url))
+
+        Expense.objects.create(user=self.user, amount=1000, timestamp=self.today)
+        self.assertIsNone(self.get_fragment(url))
+        self.assertContains(self.client.get(url), '2,234')
+
+
+class BulkAddExpenseViewTestCase(TestCase):
+    """
+    Test cases for bulk expense api.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+        self.url = reverse('expense:bulk_add_expense')
+
+    def post(self, expenses):
+        return self.client.post(
+            self.url, json.dumps({'expenses': expenses}), content_type='application/json'
+        )
+
+    def test_bulk_add(self):
+        """
+        Expenses are added with remarks resolved in bulk and rollups updated.
+        """
+        Remark.objects.create(user=self.user, name='food')
+        Expense.objects.create(
+            user=self.user, amount=50, timestamp=datetime.date(2024, 3, 1)
+        )
+        expenses = [
+            {'amount': 100, 'remark': 'Food', 'timestamp': '2024-03-01'},
+            {'amount': 200, 'remark': 'fuel ', 'timestamp': '02/03/2024'},
+            {'amount': 300, 'remark': 'fuel', 'timestamp': '2024-04-01'},
+            {'amount': 400, 'timestamp': '2024-03-05'},
+        ]
+        response = self.post(expenses)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'count': 4})
+
+        self.assertEqual(
+            sorted(Remark.objects.filter(user=self.user).values_list('name', flat=True)),
+            ['food', 'fuel'],
+        )
+        self.assertEqual(
+            Expense.objects.filter(user=self.user, remark__name='fuel').count(), 2
+        )
+        rollups = {
+            (row.month, row.remark.name if row.remark else None): (row.amount, row.count)
+            for row in ExpenseMonthlyRollup.objects.filter(user=self.user)
+        }
+        self.assertEqual(rollups, {
+            (datetime.date(2024, 3, 1), None): (450, 2),
+            (datetime.date(2024, 3, 1), 'food'): (100, 1),
+            (datetime.date(2024, 3, 1), 'fuel'): (200, 1),
+            (datetime.date(2024, 4, 1), 'fuel'): (300, 1),
+        })
+
+        # query count doesn't grow with number of expenses
+        with CaptureQueriesContext(connection) as queries:
+            self.post(expenses)
+        with CaptureQueriesContext(connection) as more_queries:
+            self.post(expenses * 10)
+        self.assertEqual(len(more_queries), len(queries))
+
+    def test_query_count_multi_month(self):
+        """
+        Query count doesn't grow with number of months and remarks of expenses,
+        with their rollups updated or created.
+        """
+        def get_expenses(months):
+            return [
+                {'amount': 100, 'remark': f'remark {i}', 'timestamp': f'2024-{month:02d}-01'}
+                for month in range(1, months + 1)
+                for i in range(3)
+            ]
+
+        self.post(get_expenses(1))
+        with CaptureQueriesContext(connection) as queries:
+            self.post(get_expenses(2))
+        with CaptureQueriesContext(connection) as more_queries:
+            self.post(get_expenses(12))
+        self.assertEqual(len(more_queries), len(queries))
+
+        rollups = ExpenseMonthlyRollup.objects.filter(user=self.user)
+        self.assertEqual(rollups.count(), 12 * 3)
+        self.assertEqual(
+            rollups.filter(month=datetime.date(2024, 1, 1)).aggregate(Sum('amount'), Sum('count')),
+            {'amount__sum': 900, 'count__sum': 9},
+        )
+        self.assertEqual(
+            rollups.filter(month=datetime.date(2024, 12, 1)).aggregate(Sum('amount'), Sum('count')),
+            {'amount__sum': 300, 'count__sum': 3},
+        )
+
+    def test_invalid_expense(self):
+        """
+        Nothing is added if any expense is invalid.
+        """
+        response = self.post([
+            {'amount': 100, 'remark': 'food', 'timestamp': '2024-03-01'},
+            {'amount': -1, 'remark': 'x' * 31, 'timestamp': 'yesterday'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            set(response.json()['errors']['1']), {'amount', 'remark', 'timestamp'}
+        )
+        self.assertFalse(Expense.objects.filter(user=self.user).exists())
+
+        response = self.client.post(self.url, 'null', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_amount_out_of_range(self):
+        """
+        Amounts larger than the column allows are rejected, not a db error.
+        """
+        response = self.post([
+            {'amount': MAX_AMOUNT + 1, 'remark': 'food', 'timestamp': '2024-03-01'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']['0']), {'amount'})
+        self.assertEqual(
+            self.post([{'amount': MAX_AMOUNT, 'timestamp': '2024-03-01'}]).status_code, 201
+        )
+
+    def test_caches_invalidated_on_commit(self):
+        """
+        Cached expenses are invalidated only once the expenses are committed.
+        """
+        with mock.patch('expense.models.invalidate_year_expenses') as invalidate:
+            with self.captureOnCommitCallbacks() as callbacks:
+                bulk_create_expenses(
+                    self.user,
+                    [{'amount': 100, 'remark': 'food', 'timestamp': datetime.date(2024, 3, 1)}],
+                )
+                invalidate.assert_not_called()
+            for callback in callbacks:
+                callback()
+        invalidate.assert_called_once_with(self.user.id)
+
+
+class ExportExpensesViewTestCase(TestCase):
+    """
+    Test cases for streaming expense export.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+        food = Remark.objects.create(user=self.user, name='food')
+        Expense.objects.create(
+            user=self.user, amount=100, remark=food, timestamp=datetime.date(2024, 3, 1)
+        )
+        Expense.objects.create(
+            user=self.user, amount=200, timestamp=datetime.date(2024, 3, 2)
+        )
+        Expense.objects.create(
+            user=self.user, amount=300, remark=food, timestamp=datetime.date(2024, 4, 1)
+        )
+        self.url = reverse('expense:export_expense')
+
+    def get_content(self, query):
+        response = self.client.get(self.url, query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_export(self):
+        """
+        CSV export has all the expenses, oldest first.
+        """
+        content = self.get_content({})
+        self.assertEqual(content.decode().splitlines(), [
+            'timestamp,amount,remark',
+            '2024-03-01,100,food',
+            '2024-03-02,200,',
+            '2024-04-01,300,food',
+        ])
+
+    def test_filtered_gzip_json_export(self):
+        """
+        Export is filtered like search and can be gzipped.
+        """
+        content = self.get_content({
+            'format': 'json', 'gzip': '1', 'remark': 'food',
+            'from_date': '01/03/2024', 'to_date': '31/03/2024',
+        })
+        self.assertEqual(
+            json.loads(gzip.decompress(content)),
+            [{'timestamp': '2024-03-01', 'amount': 100, 'remark': 'food'}],
+        )
+
+    def test_invalid_filter(self):
+        """
+        Invalid filters are rejected, not dropped to export everything.
+        """
+        response = self.client.get(self.url, {'from_date': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'from_date'})
+
+    def test_export_can_be_imported(self):
+        """
+        Exported CSV imports back as the same expenses.
+        """
+        content = self.get_content({})
+        other = get_user_model().objects.create_user(username='other_user')
+        self.client.force_login(other)
+        self.client.post(
+            reverse('expense:import_expense'),
+            {'file': SimpleUploadedFile('expenses.csv', content)},
+        )
+        self.assertEqual(
+            list(Expense.objects.filter(user=other).order_by('timestamp')
+                 .values_list('timestamp', 'amount', 'remark__name')),
+            list(Expense.objects.filter(user=self.user).order_by('timestamp')
+                 .values_list('timestamp', 'amount', 'remark__name')),
+        )
@@ -27,6 +27,9 @@ urlpatterns = [
         re_path(r'^months/$', views.MonthWiseExpense.as_view(), name='month-wise-expense'),
         re_path(r'^years/$', views.YearWiseExpense.as_view(), name='year-wise-expense'),
         re_path(r'^$', views.AddExpense.as_view(), name='add_expense'),
+        re_path(r'^bulk/$', views.BulkAddExpense.as_view(), name='bulk_add_expense'),
+        re_path(r'^import/$', views.ImportExpenseCSV.as_view(), name='import_expense'),
+        re_path(r'^export/$', views.ExportExpenses.as_view(), name='export_expense'),
 
         re_path(r'^basic-info/$', views.GetBasicInfo.as_view(), name='get-basic-info'),
         re_path(r'^latest-expenses/$', views.LatestExpenses.as_view(), name='get-latest-expenses'),
@@ -9,19 +9,24 @@ from django.http import (
     HttpResponseRedirect,
     Http404,
 )
+from django.utils.decorators import method_decorator
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.urls import reverse
 
-from .forms import ExpenseForm, SelectDateRangeExpenseForm
-from .models import Expense, Remark
+from .forms import BulkExpenseForm, ExpenseForm, SelectDateRangeExpenseForm
+from .models import Expense, Remark, bulk_create_expenses
 from income.models import SavingCalculation
 from utils import helpers
+from utils.autocomplete import REMARKS
 from utils.helpers import aggregate_sum, default_date_format
+from utils.ledger_export import LedgerExportView
+from utils.ledger_import import ExpenseCSVImport, LedgerCSVImportView
 from utils.constants import (
     BANK_AMOUNT_PCT,
     AVG_MONTH_DAYS,
+    BULK_EXPENSE_LIMIT,
 )
 # Create your views here.
 
@@ -57,21 +62,90 @@ class AddExpense(LoginRequiredMixin, View):
                 timestamp = timestamp,
                 remark=remark_object,
             )
+            if remark_object:
+                REMARKS.record(request.user.id, remark_object.name)
 
             return HttpResponse(status=200)
         else:
             return HttpResponse(status=400)
 
 
+class BulkAddExpense(LoginRequiredMixin, View):
+    """
+    adds a list of expenses i.e. a month of receipts in one request.
+    body is JSON: {"expenses": [{"amount": 100, "remark": "food",
+    "timestamp": "2024-03-01"}, ...]}, nothing is added if any is invalid.
+    """
+    form_class = BulkExpenseForm
+
+    def post(self, request, *args, **kwargs):
+        try:
+            expenses = json.loads(request.body)['expenses']
+        except (ValueError, TypeError, KeyError):
+            return self.error_response({'expenses': 'a list of expenses is required'})
+        if not isinstance(expenses, list) or not expenses:
+            return self.error_response({'expenses': 'a list of expenses is required'})
+        if len(expenses) > BULK_EXPENSE_LIMIT:
+            return self.error_response(
+                {'expenses': f'at most {BULK_EXPENSE_LIMIT} expenses are allowed'}
+            )
+
+        rows, errors = [], {}
+        for i, expense in enumerate(expenses):
+            form = self.form_class(expense if isinstance(expense, dict) else {})
+            if form.is_valid():
+                rows.append(form.cleaned_data)
+            else:
+                errors[i] = form.errors.get_json_data()
+        if errors:
+            return self.error_response(errors)
+
+        created = bulk_create_expenses(request.user, rows)
+        data = json.dumps({'count': len(created)})
+        return HttpResponse(data, status=201, content_type='application/json')
+
+    def error_response(self, errors):
+        data = json.dumps({'errors': errors})
+        return HttpResponse(data, status=400, content_type='application/json')
+
+
+class ImportExpenseCSV(LedgerCSVImportView):
+    """
+    imports expenses from CSV with amount, remark and timestamp columns.
+    """
+    import_class = ExpenseCSVImport
+
+
+class ExportExpenses(LedgerExportView):
+    """
+    streams expenses matching the search form as CSV or JSON.
+    """
+    model = Expense
+    name_field = 'remark'
+    form_class = SelectDateRangeExpenseForm
+    filename = 'expenses'
+
+    def filter_name(self, queryset, value):
+        return helpers.search_expenses(queryset, value)
+
+
+@method_decorator(helpers.ledger_condition, name='dispatch')
 class GetBasicInfo(LoginRequiredMixin, View):
 
     def get(self, request, *args, **kwargs):
         user = request.user
         today = helpers.get_ist_datetime().date()
+        data = helpers.cached_aggregate(
+            user, f'basic-info:{today}', lambda: self.get_data(user, today)
+        )
+        data = json.dumps(data)
+        return HttpResponse(data, content_type='application/json')
+
+    def get_data(self, user, today):
         data = dict()
 
         today_expense = aggregate_sum(Expense.objects.this_day(user=user))
-        this_month_expense = aggregate_sum(Expense.objects.this_month(user=user))
+        this_month_expense = aggregate_sum(user.expense_rollups.filter(month=today.replace(day=1)))
         
         data['today_expense'] = f"{today_expense:,}"
         data['this_month_expense'] = f"{this_month_expense:,}"
@@ -84,10 +158,10 @@ class GetBasicInfo(LoginRequiredMixin, View):
             bank_balance_date = None
         
         if not bank_balance:
-            incomes = user.incomes.exclude(amount=0)
-            last_income_date = incomes.dates('timestamp', 'month', order='DESC').first()
+            incomes = user.income_rollups.filter(amount__gt=0)
+            last_income_date = incomes.dates('month', 'month', order='DESC').first()
             if last_income_date:
-                last_income = incomes.filter(timestamp__year=last_income_date.year, timestamp__month=last_income_date.month)
+                last_income = incomes.filter(month=last_income_date)
                 bank_balance = aggregate_sum(last_income) * (BANK_AMOUNT_PCT/100)
                 bank_balance_date = last_income_date
         
@@ -101,14 +175,16 @@ class GetBasicInfo(LoginRequiredMixin, View):
         
         data['this_month_eir'] = this_month_eir
         data['spending_power'] = f"{int(spending_power):,}"
-        data = json.dumps(data)
-        return HttpResponse(data, content_type='application/json')
+        return data
 
 
+@method_decorator(helpers.ledger_condition, name='dispatch')
 class LatestExpenses(LoginRequiredMixin, View):
 
     def get(self, request, *args, **kwargs):
-        recent_expenses = Expense.objects.all(user=request.user).order_by(
+        recent_expenses = Expense.objects.all(user=request.user).select_related(
+                            'remark',
+                        ).order_by(
                             '-created_at', '-timestamp',
                         )[:10]
         data = []
@@ -169,8 +245,12 @@ class UpdateExpense(LoginRequiredMixin, View):
                 except:
                     rem = Remark.objects.create(user=request.user, name=remark)
             
+            old_remark = instance.remark
             instance.remark = rem
             instance.save()
+            if old_remark != rem:
+                REMARKS.record(request.user.id, old_remark and old_remark.name, -1)
+                REMARKS.record(request.user.id, rem and rem.name)
             messages.success(request, "Expense updated!")
             return HttpResponseRedirect(redirect if redirect else request.get_full_path())
         else:
@@ -180,16 +260,19 @@ class UpdateExpense(LoginRequiredMixin, View):
 
 class ExpenseList(LoginRequiredMixin, View):
     template_name = "expense_list.html"
+    # each sort is backed by (user, -field, -id) index of Expense
+    order_fields = ("timestamp", "amount")
 
     def get(self, request, *args, **kwargs):
-        objects_list = Expense.objects.all(user=request.user)
+        objects_list = Expense.objects.all(user=request.user).select_related("remark")
 
         order_field = request.GET.get("field")
-        if order_field:
-            ordering = request.GET.get("order", "") + order_field
-            objects_list = objects_list.order_by(ordering)
+        if order_field not in self.order_fields:
+            order_field = "timestamp"
+        order = "" if request.GET.get("order") == "" else "-"
+        ordering = (order + order_field, order + "id")
 
-        objects = helpers.get_paginator_object(request, objects_list, 30)
+        objects = helpers.get_keyset_paginator_object(request, objects_list, 30, ordering)
         
         # total = Expense.objects.amount_sum(user=request.user)
         # if objects_list:
@@ -200,6 +283,8 @@ class ExpenseList(LoginRequiredMixin, View):
         context = {
             "title": "Expenses",
             "objects": objects,
+            "field": order_field,
+            "order": order,
             # "total": total,
             # "first_date": first_date,
             # "expense_to_income_ratio": helpers.expense_to_income_ratio(request.user),
@@ -209,43 +294,89 @@ class ExpenseList(LoginRequiredMixin, View):
 
 
 class DayWiseExpense(LoginRequiredMixin, View):
+    """
+    day-wise expense paginated by "days before/after X" cursors
+    instead of OFFSET.
+    """
     template_name = "day-expense.html"
+    paginate_by = 50
+
+    def get_cursor(self, request, name):
+        try:
+            return date.fromisoformat(request.GET.get(name, ''))
+        except ValueError:
+            return None
+
+    def get_cursor_query(self, request, name, value):
+        query = request.GET.copy()
+        query.pop('before', None)
+        query.pop('after', None)
+        query.pop('page', None)
+        query[name] = value.isoformat()
+        return query.urlencode()
 
     def get(self, request, *args, **kwargs):
         context = {}
         date_str = ""
-        expense = request.user.expenses
+        expense = Expense.objects.all(user=request.user)
 
         year = int(request.GET.get('year', 0))
         month = int(request.GET.get('month', 0))
         if year or month:
             if year:
-                expense = expense.filter(timestamp__year=year)
+                expense = expense.in_year(year)
                 date_str = f": {year}"
             if month:
-                expense = expense.filter(timestamp__month=month)
+                expense = expense.in_month(year, month)
                 dt = date(year, month, 1)
                 date_str = f": {dt.strftime('%B %Y')}"
             
             context['total'] = expense.aggregate(Sum('amount'))['amount__sum'] or 0
 
-        days = expense.dates('timestamp', 'day', order='DESC')
-        days = helpers.get_paginator_object(request, days, 50)
+        days = expense.order_by().values('timestamp').annotate(
+            day_sum=Sum('amount'),
+            count=Count('pk'),
+        )
+        before = self.get_cursor(request, 'before')
+        after = self.get_cursor(request, 'after')
+
+        # fetching one extra row to know if there is one more page
+        if after:
+            days = list(days.filter(timestamp__gt=after).order_by('timestamp')[:self.paginate_by + 1])
+            has_previous = len(days) > self.paginate_by
+            has_next = True
+            days = days[:self.paginate_by][::-1]
+        else:
+            if before:
+                days = days.filter(timestamp__lt=before)
+            days = list(days.order_by('-timestamp')[:self.paginate_by + 1])
+            has_previous = before is not None
+            has_next = len(days) > self.paginate_by
+            days = days[:self.paginate_by]
 
         data = []
         for day in days:
-            day_sum = aggregate_sum(expense.filter(timestamp=day))
             data.append({
-                'day': day,
-                'day_sum': day_sum,
+                'day': day['timestamp'],
+                'day_sum': day['day_sum'],
+                'count': day['count'],
             })
-        
+
+        objects = {
+            'has_previous': has_previous and bool(data),
+            'has_next': has_next and bool(data),
+        }
+        if data:
+            objects['previous_query'] = self.get_cursor_query(request, 'after', data[0]['day'])
+            objects['next_query'] = self.get_cursor_query(request, 'before', data[-1]['day'])
+
         context['title'] = f'Day-Wise Expense{date_str}'
         context['data'] = data
-        context['objects'] = days
+        context['objects'] = objects
         return render(request, self.template_name, context)
 
 
+@method_decorator(helpers.ledger_condition, name='dispatch')
 class MonthWiseExpense(LoginRequiredMixin, View):
     template_name = "month-expense.html"
 
@@ -260,7 +391,7 @@ class MonthWiseExpense(LoginRequiredMixin, View):
         if year:
             year = int(year)
             total_months = now.month if now.year == year else 12
-            expenses = expenses.filter(timestamp__year=year)
+            expenses = expenses.in_year(year)
             context['total'] = expenses.aggregate(Sum('amount'))['amount__sum'] or 0
             context['monthly_average'] = context['total'] // total_months
             date_str = f": {year}"
@@ -280,12 +411,14 @@ class MonthWiseExpense(LoginRequiredMixin, View):
         dates = helpers.get_dates_list(first_date, latest_date, day=1)
         dates = helpers.get_paginator_object(request, dates, 12)
 
+        window = (dates[-1], dates[0])
+        month_expenses = helpers.bucket_aggregate(expenses, 'month', *window)
+        month_incomes = helpers.bucket_aggregate(user.incomes.all(), 'month', *window)
+
         data = []
         for dt in dates:
-            month_expense = Expense.objects.this_month(user=user, year=dt.year, month=dt.month)
-            amount = aggregate_sum(month_expense)
-            month_income = user.incomes.filter(timestamp__year=dt.year, timestamp__month=dt.month)
-            month_income_sum = aggregate_sum(month_income)
+            amount = month_expenses[dt]['amount']
+            month_income_sum = month_incomes[dt]['amount']
             month_expense_to_income_ratio = helpers.calculate_ratio(amount, month_income_sum)
             data.append({
                 'date': dt,
@@ -299,6 +432,7 @@ class MonthWiseExpense(LoginRequiredMixin, View):
         return render(request, self.template_name, context)
 
 
+@method_decorator(helpers.ledger_condition, name='dispatch')
 class YearWiseExpense(LoginRequiredMixin, View):
     """
     return all the year in which expenses are registered.
@@ -311,20 +445,35 @@ class YearWiseExpense(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         user = request.user
         now = helpers.get_ist_datetime()
-        expense_sum = user.expenses.aggregate(Sum('amount'))['amount__sum'] or 0
-        income_sum = user.incomes.aggregate(Sum('amount'))['amount__sum'] or 0
-        
         latest_date = now.date().replace(month=1, day=1)
-        first_date = user.expenses.dates('timestamp', 'year', order='ASC').first() or latest_date
+        first_date = helpers.cached_aggregate(
+            user, 'expense-first-year',
+            lambda: user.expenses.dates('timestamp', 'year', order='ASC').first(),
+        ) or latest_date
         dates = helpers.get_dates_list(first_date, latest_date, month=1, day=1)
         dates = helpers.get_paginator_object(request, dates, 5)
-        
+
+        self.context['data'] = helpers.cached_aggregate(
+            user, f'year-wise-expense:{dates[-1]}:{dates[0]}:{now.month}',
+            lambda: self.get_data(user, dates, now),
+        )
+        self.context['objects'] = dates
+        return render(request, self.template_name, self.context)
+
+    def get_data(self, user, dates, now):
+        expense_sum = aggregate_sum(user.expense_rollups)
+        income_sum = aggregate_sum(user.income_rollups)
+
+        window = (dates[-1], dates[0])
+        year_expenses = helpers.bucket_aggregate(Expense.objects.all(user=user), 'year', *window)
+        year_incomes = helpers.bucket_aggregate(user.incomes.all(), 'year', *window)
+
         data = []
         for date in dates:
             year = date.year
             total_months = now.month if now.year == year else 12
-            amount = aggregate_sum(Expense.objects.this_year(user=user, year=year))
-            year_income_sum = aggregate_sum(user.incomes.filter(timestamp__year=year))
+            amount = year_expenses[date]['amount']
+            year_income_sum = year_incomes[date]['amount']
             
             expense_ratio = helpers.calculate_ratio(amount, expense_sum)
             expense_to_income_ratio = helpers.calculate_ratio(amount, income_sum)
@@ -338,10 +487,7 @@ class YearWiseExpense(LoginRequiredMixin, View):
                 'eir': expense_to_income_ratio,
                 'expense_ratio': expense_ratio,
             })
-
-        self.context['data'] = data
-        self.context['objects'] = dates
-        return render(request, self.template_name, self.context)
+        return data
 
 
 class DateSearch(LoginRequiredMixin, View):
@@ -368,24 +514,20 @@ class DateSearch(LoginRequiredMixin, View):
             from_date = form.cleaned_data.get('from_date')
             to_date = form.cleaned_data.get('to_date')
             
+            objects = helpers.filter_date_range(objects, from_date, to_date)
             if from_date and to_date:
-                objects = objects.filter(timestamp__range=(from_date, to_date))
                 from_date_str = default_date_format(from_date)
                 to_date_str = default_date_format(to_date)
                 date_str = f': {from_date_str} to {to_date_str}'
             elif from_date or to_date:
                 the_date = from_date or to_date
-                objects = objects.filter(timestamp=the_date)
                 from_date_str = to_date_str = default_date_format(the_date)
                 date_str = f': {from_date_str}'
             
-            if remark == '""':
-                objects = objects.filter(remark__isnull=True)
-            elif remark:
-                objects = helpers.search_expense_remark(objects, remark)
+            if remark:
+                objects = helpers.search_expenses(objects, remark)
 
-            total = aggregate_sum(objects)
-            count = objects.count()
+            total, count = helpers.aggregate_sum_count(objects)
             try:
                 days = (to_date - from_date).days
                 months = days / AVG_MONTH_DAYS
@@ -394,7 +536,9 @@ class DateSearch(LoginRequiredMixin, View):
             except:
                 pass
 
-            context['objects'] = helpers.get_paginator_object(request, objects, 30)
+            context['objects'] = helpers.get_paginator_object(
+                request, objects.select_related('remark'), 30, count=count
+            )
             context['total'] = total
             context['count'] = count
 
@@ -444,9 +588,10 @@ class GoToExpense(LoginRequiredMixin, View):
             from_date = default_date_format(date(year, 1, 1))
             to_date = default_date_format(date(year, 12, 31))
 
-        total = objects.aggregate(Sum('amount'))['amount__sum'] or 0
-        count = objects.count()
-        objects = helpers.get_paginator_object(request, objects, 50)
+        total, count = helpers.aggregate_sum_count(objects)
+        objects = helpers.get_paginator_object(
+            request, objects.select_related('remark'), 50, count=count
+        )
 
         context = {
             "title": f"Expenses{date_str}",
@@ -484,12 +629,12 @@ class GoToRemarkWiseExpense(LoginRequiredMixin, View):
         
         if day:
             objects = Expense.objects.this_day(user=user, year=year, month=month, day=day)
-            incomes = incomes.filter(timestamp__year=year, timestamp__month=month, timestamp__day=day)
+            incomes = incomes.on_day(year, month, day)
             _day = date(year, month, day)
             date_str = f': {_day.strftime("%d %b %Y")}'
         elif month:
             objects = Expense.objects.this_month(user=user, year=year, month=month)
-            incomes = incomes.filter(timestamp__year=year, timestamp__month=month)
+            incomes = incomes.in_month(year, month)
             _month = date(year, month, 1)
             date_str = f': {_month.strftime("%b %Y")}'
             from_date = default_date_format(date(year, month, 1))
@@ -498,7 +643,7 @@ class GoToRemarkWiseExpense(LoginRequiredMixin, View):
             )
         elif year:
             objects = Expense.objects.this_year(user=user, year=year)
-            incomes = incomes.filter(timestamp__year=year)
+            incomes = incomes.in_year(year)
             date_str = f': {year}'
             from_date = default_date_format(date(year, 1, 1))
             to_date = default_date_format(date(year, 12, 31))
@@ -514,32 +659,24 @@ class GoToRemarkWiseExpense(LoginRequiredMixin, View):
                 to_date = default_date_format(_to_date)
                 date_str = f': {from_date} to {to_date}'
             if remark:
-                objects = helpers.search_expense_remark(objects, remark)
-
-        objects = objects.select_related('remark')
-        remarks = set()
-        for instance in objects:
-            remarks.add(instance.remark)
+                objects = helpers.search_expenses(objects, remark)
 
-        expense_sum = aggregate_sum(objects)
+        remark_rows, expense_sum = helpers.group_aggregate(objects, 'remark__name')
         income_sum = aggregate_sum(incomes)
 
         remark_data = []
-        for remark in remarks:
-            remark_filter = objects.filter(remark=remark)
-            amount = aggregate_sum(remark_filter)
+        for row in remark_rows:
+            amount = row['amount']
             expense_ratio = helpers.calculate_ratio(amount, expense_sum)
             expense_to_income_ratio = helpers.calculate_ratio(amount, income_sum)
             remark_data.append({
-                'remark': remark,
-                'remark_count': remark_filter.count(),
+                'remark_name': row['remark__name'],
+                'remark_count': row['count'],
                 'amount': amount,
                 'eir': expense_to_income_ratio,
                 'expense_ratio': expense_ratio,
             })
 
-        remark_data = sorted(remark_data, key=lambda x: x['amount'], reverse=True)
-
         context = {
             "title": f"Remark-Wise Expenses{date_str}",
             "remarks": remark_data,
@@ -559,16 +696,7 @@ class GetRemark(LoginRequiredMixin, View):
 
     def get(self, request, *args, **kwargs):
         term = request.GET.get('term', '').strip().lower()
-        remarks = request.user.remarks
-        if len(term) < 3:
-            remarks = remarks.filter(name__startswith=term)
-        else:
-            remarks = remarks.filter(name__icontains=term)
-        
-        remarks = remarks.annotate(count=Count('expenses'))\
-                    .order_by('-count', 'name')
-        results = [remark.name for remark in remarks[:10]]
-        data = json.dumps(results)
+        data = json.dumps(REMARKS.search(request.user, term))
 
         return HttpResponse(data, content_type='application/json')
 
@@ -18,10 +18,29 @@ def backup():
     management.call_command('dbbackup')
 
 
+@app.task(name="incremental-backup")
+def incremental_backup():
+    # full ledger backup once a week, rows changed since the last one otherwise
+    management.call_command('backup_ledger')
+
+
+@app.task(name="prune-tombstones")
+def prune_tombstones():
+    management.call_command('prune_tombstones')
+
+
 if not settings.DEBUG:
     app.conf.beat_schedule = {
         'backup-database-everynight': {
             'task': 'backup',
             'schedule': crontab(minute=0, hour=0),
         },
+        'backup-ledger-everynight': {
+            'task': 'incremental-backup',
+            'schedule': crontab(minute=30, hour=0),
+        },
+        'prune-tombstones-everyweek': {
+            'task': 'prune-tombstones',
+            'schedule': crontab(minute=0, hour=1, day_of_week=0),
+        },
     }
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
 import os
+import sys
 
 import dj_database_url
 from decouple import Csv, config
@@ -73,6 +74,7 @@ INSTALLED_APPS = FIRST_PARTY_APPS + THIRD_PARTY_APPS + DJANGO_DEFAULT_APPS
 
 
 MIDDLEWARE = [
+    "utils.middleware.SQLInstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -98,6 +100,7 @@ TEMPLATES = [
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
                 "utils.context_processors.constants",
+                "utils.context_processors.ledger_version",
             ],
         },
     },
@@ -188,11 +191,60 @@ CACHES = {
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         },
-    }
+    },
+    # rendered report tables, set CACHE_TEMPLATE_FRAGMENTS=0 to bypass
+    # i.e. while working on templates
+    "fragments": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": config("REDIS_LOCATION"),
+        "KEY_PREFIX": "fragments",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        },
+    },
 }
 
+if config("CACHE_TEMPLATE_FRAGMENTS", default="1") != "1":
+    CACHES["fragments"] = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 
+
+# per-request time, query count and db time, see utils.middleware
+# fraction of requests to count queries of, 0 to turn off.
+# slow requests are logged either way
+SQL_INSTRUMENTATION_SAMPLE_RATE = config(
+    "SQL_INSTRUMENTATION_SAMPLE_RATE", default=0.01, cast=float
+)
+# Server-Timing header of sampled requests, exposes internal timings to clients
+SQL_INSTRUMENTATION_SERVER_TIMING = config(
+    "SQL_INSTRUMENTATION_SERVER_TIMING", default=DEBUG, cast=bool
+)
+# requests slower than this are logged as warning
+SQL_INSTRUMENTATION_SLOW_MS = config(
+    "SQL_INSTRUMENTATION_SLOW_MS", default=500, cast=int
+)
+
+TESTING = len(sys.argv) > 1 and sys.argv[1] == "test"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+        },
+    },
+    "loggers": {
+        "utils.middleware": {
+            "handlers": ["console"],
+            # test client requests are often slow, keep test output readable
+            "level": "ERROR" if TESTING else "INFO",
+            "propagate": False,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -11,10 +11,12 @@ from django.conf import settings
 from django.conf.urls.static import static
 
 from expense import views
+from utils.sync import SyncView
 
 urlpatterns = [
     re_path('django-admin/', admin.site.urls),
     re_path(r'^account/', include('account.urls')),
+    re_path(r'^sync/$', SyncView.as_view(), name='sync'),
     re_path(r'^', include('expense.urls')),
     re_path(r'^income/', include('income.urls')),
 ]
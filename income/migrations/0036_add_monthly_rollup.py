@@ -0,0 +1,42 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from utils.base_model import rebuild_monthly_rollups
+
+
+def build_rollups(apps, schema_editor):
+    Income = apps.get_model("income", "Income")
+    IncomeMonthlyRollup = apps.get_model("income", "IncomeMonthlyRollup")
+    rebuild_monthly_rollups(IncomeMonthlyRollup, Income.objects.all(), "source_id")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('income', '0035_alter_savingcalculation_auto_fill_amount_to_keep_in_bank'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncomeMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('last_modified_at', models.DateTimeField(auto_now=True, null=True)),
+                ('month', models.DateField(help_text='first day of the month')),
+                ('amount', models.BigIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='monthly_rollups', to='income.source')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='income_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-month'], name='income_inco_user_id_320aed_idx')],
+                'unique_together': {('user', 'month', 'source')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
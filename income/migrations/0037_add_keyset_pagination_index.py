@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('income', '0036_add_monthly_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='income_inco_user_id_c09b83_idx'),
+        ),
+    ]
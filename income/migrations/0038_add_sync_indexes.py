@@ -0,0 +1,34 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Now
+
+
+def fill_last_modified_at(apps, schema_editor):
+    # sync pages by (last_modified_at, id), so it can't be NULL
+    for model_name in ('income', 'source'):
+        model = apps.get_model('income', model_name)
+        model.objects.filter(last_modified_at__isnull=True).update(
+            last_modified_at=Coalesce('created_at', Now())
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('income', '0037_add_keyset_pagination_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_last_modified_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['user', 'last_modified_at'], name='income_inco_user_id_d6f4b1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='source',
+            index=models.Index(fields=['user', 'last_modified_at'], name='income_sour_user_id_71c82b_idx'),
+        ),
+    ]
@@ -1,9 +1,14 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 from django.db.models.fields import related
+from django.db.models.signals import post_delete, post_save, pre_save
 
-from utils.base_model import BaseModel
+from utils.autocomplete import SOURCES
+from utils.base_model import BaseModel, BaseMonthlyRollup, LedgerQuerySet
+from utils.expense_profile import ExpenseProfile
 from utils.constants import AUTO_FILL_AMOUNT_CHOICES
+from utils.helpers import bump_ledger_generation
+from utils.models import record_tombstone
 
 User = get_user_model()
 
@@ -22,7 +27,11 @@ class Source(BaseModel):
             "user",
             "name",
         )
-        indexes = [models.Index(fields=("user", "name"))]
+        indexes = [
+            models.Index(fields=("user", "name")),
+            # changes since last sync, see utils.sync
+            models.Index(fields=("user", "last_modified_at")),
+        ]
 
 
 class Income(BaseModel):
@@ -33,6 +42,8 @@ class Income(BaseModel):
     )
     timestamp = models.DateField()
 
+    objects = LedgerQuerySet.as_manager()
+
     def __str__(self):
         return "{} : {}".format(self.user, self.source)
 
@@ -43,9 +54,100 @@ class Income(BaseModel):
         )
         indexes = [
             models.Index(fields=("user", "-timestamp", "-created_at")),
+            # keyset pagination of IncomeList, see get_keyset_paginator_object
+            models.Index(fields=("user", "-timestamp", "-id")),
+            models.Index(fields=("user", "last_modified_at")),
         ]
 
 
+class IncomeMonthlyRollup(BaseMonthlyRollup):
+    """
+    monthly income of a user per source, maintained by Income save/delete
+    hooks. use `rebuild_rollups` management command to recompute.
+    """
+    user = models.ForeignKey(
+        User, related_name="income_rollups", on_delete=models.CASCADE
+    )
+    source = models.ForeignKey(
+        Source,
+        blank=True,
+        null=True,
+        related_name="monthly_rollups",
+        on_delete=models.SET_NULL,
+    )
+
+    def __str__(self):
+        return "{} : {} : {}".format(self.source, self.amount, self.month)
+
+    class Meta:
+        unique_together = (
+            "user",
+            "month",
+            "source",
+        )
+        indexes = [models.Index(fields=("user", "-month"))]
+
+
+def _fetch_income_rollup_key(instance, *args, **kwargs):
+    instance._rollup_key = None
+    if not instance._state.adding:
+        instance._rollup_key = (
+            Income.objects.filter(pk=instance.pk)
+            .values_list("user_id", "timestamp", "source_id", "amount")
+            .first()
+        )
+
+
+def _update_income_rollup(instance, *args, **kwargs):
+    old_key = getattr(instance, "_rollup_key", None)
+    with transaction.atomic():
+        if old_key:
+            user_id, timestamp, source_id, amount = old_key
+            IncomeMonthlyRollup.apply_delta(
+                user_id, timestamp, -amount, -1, source_id=source_id
+            )
+        IncomeMonthlyRollup.apply_delta(
+            instance.user_id,
+            instance.timestamp,
+            instance.amount,
+            1,
+            source_id=instance.source_id,
+        )
+
+
+def _delete_income_rollup(instance, *args, **kwargs):
+    IncomeMonthlyRollup.apply_delta(
+        instance.user_id,
+        instance.timestamp,
+        -instance.amount,
+        -1,
+        source_id=instance.source_id,
+    )
+
+
+def _invalidate_income_cache(instance, *args, **kwargs):
+    ExpenseProfile.invalidate(instance.user_id)
+    bump_ledger_generation(instance.user_id)
+
+
+pre_save.connect(_fetch_income_rollup_key, sender=Income)
+post_save.connect(_update_income_rollup, sender=Income)
+post_delete.connect(_delete_income_rollup, sender=Income)
+post_save.connect(_invalidate_income_cache, sender=Income)
+post_delete.connect(_invalidate_income_cache, sender=Income)
+post_save.connect(_invalidate_income_cache, sender=Source)
+post_delete.connect(_invalidate_income_cache, sender=Source)
+post_delete.connect(record_tombstone, sender=Income)
+post_delete.connect(record_tombstone, sender=Source)
+
+
+def _remove_source_autocomplete(instance, *args, **kwargs):
+    SOURCES.remove(instance.user_id, instance.name)
+
+
+post_delete.connect(_remove_source_autocomplete, sender=Source)
+
+
 class SavingCalculation(BaseModel):
     user = models.OneToOneField(
         User, related_name="saving_calculation", on_delete=models.CASCADE
@@ -76,6 +178,15 @@ class SavingCalculation(BaseModel):
         return f"{self.user}"
 
 
+def _invalidate_saving_calculation_cache(instance, *args, **kwargs):
+    # bank balance of expense dashboard comes from saving calculation
+    bump_ledger_generation(instance.user_id)
+
+
+post_save.connect(_invalidate_saving_calculation_cache, sender=SavingCalculation)
+post_delete.connect(_invalidate_saving_calculation_cache, sender=SavingCalculation)
+
+
 class InvestmentEntity(BaseModel):
     saving_calculation = models.ForeignKey(
         SavingCalculation, related_name="investment_entity", on_delete=models.CASCADE
@@ -94,3 +205,13 @@ class InvestmentEntity(BaseModel):
             "saving_calculation",
             "name",
         )
+
+
+def _record_investment_entity_tombstone(instance, *args, **kwargs):
+    user_id = SavingCalculation.objects.values_list("user_id", flat=True).get(
+        pk=instance.saving_calculation_id
+    )
+    record_tombstone(instance, *args, user_id=user_id, **kwargs)
+
+
+post_delete.connect(_record_investment_entity_tombstone, sender=InvestmentEntity)
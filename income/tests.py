@@ -1,9 +1,11 @@
 import datetime
+import json
 
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.urls import reverse
 
+from expense.models import Expense
 from income.forms import IncomeForm
 from income.models import Income, Source
 from utils.helpers import default_date_format, get_ist_datetime
@@ -131,3 +133,79 @@ class IncomeViewTestCase(TestCase):
             user_income,
             transform=lambda x: x
         )
+
+    def test_export_filtered_by_source(self):
+        """
+        The income export has incomes of exactly the
+        source searched for, or with no source for `""`.
+        """
+        Income.objects.create(
+            user=self.user,
+            amount=500,
+            timestamp=datetime.datetime.now()
+        )
+        url = reverse('income:export-income') + '?format=json&source='
+        amounts = {
+            source: [row['amount'] for row in json.loads(b''.join(
+                self.client.get(url + source).streaming_content
+            ))]
+            for source in ['test_source', 'test', '""']
+        }
+        self.assertEqual(amounts, {'test_source': [2000], 'test': [], '""': [500]})
+
+
+class IncomeExpenseReportTestCase(TestCase):
+    """
+    Test cases for income vs expense report card views.
+    """
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+
+        for month in (1, 2, 5):
+            Income.objects.create(
+                user=self.user,
+                amount=1000,
+                timestamp=datetime.date(2020, month, 1)
+            )
+            Expense.objects.create(
+                user=self.user,
+                amount=month * 100,
+                timestamp=datetime.date(2020, month, 15)
+            )
+        Expense.objects.create(
+            user=self.user,
+            amount=400,
+            timestamp=datetime.date(2019, 12, 31)
+        )
+
+    def test_monthly_report_data(self):
+        """
+        The monthly report contains income and expense of each month.
+        """
+        response = self.client.get(reverse('income:yearly-report', kwargs={'year': 2020}))
+        data = {row['date']: row for row in response.context['data']}
+        self.assertEqual(len(data), 12)
+        self.assertEqual(data[datetime.date(2020, 2, 1)]['income_sum'], 1000)
+        self.assertEqual(data[datetime.date(2020, 2, 1)]['expense_sum'], 200)
+        self.assertEqual(data[datetime.date(2020, 3, 1)]['saved'], 0)
+        self.assertEqual(response.context['total']['expense_sum'], 800)
+        self.assertEqual(response.context['eir'], 26.67)
+
+    def test_yearly_report_data(self):
+        """
+        The yearly report contains income and expense of each year.
+        """
+        data = {}
+        for page in range(1, 4):
+            response = self.client.get(reverse('income:report'), {'page': page})
+            data.update({row['date'].year: row for row in response.context['data']})
+        self.assertEqual(data[2019]['income_sum'], 0)
+        self.assertEqual(data[2019]['expense_sum'], 400)
+        self.assertEqual(data[2020]['saved'], 2200)
+        self.assertEqual(response.context['eir'], 40)
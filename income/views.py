@@ -8,14 +8,16 @@ import markdown
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
-from django.db.models import Sum
 from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.generic import CreateView, DeleteView, ListView, UpdateView
 
 from utils import helpers
+from utils.autocomplete import SOURCES
 from utils.constants import (
     AVG_MONTH_DAYS,
     BANK_AMOUNT_PCT,
@@ -23,7 +25,15 @@ from utils.constants import (
     FIXED_SAVINGS_PCT,
     SHOW_INCOME_CALCULATOR_HOUR,
 )
-from utils.helpers import aggregate_sum, default_date_format, get_ist_datetime
+from utils.expense_profile import ExpenseProfile
+from utils.helpers import (
+    aggregate_sum,
+    bump_ledger_generation,
+    default_date_format,
+    get_ist_datetime,
+)
+from utils.ledger_export import LedgerExportView
+from utils.ledger_import import IncomeCSVImport, LedgerCSVImportView
 
 from .forms import (
     IncomeForm,
@@ -37,23 +47,37 @@ from .models import Income, InvestmentEntity, SavingCalculation, Source
 # Create your views here.
 
 
-class IncomeList(LoginRequiredMixin, ListView):
+class IncomeList(LoginRequiredMixin, View):
     template_name = "income_list.html"
     paginate_by = 15
-    context_object_name = "objects"
+    ordering = ("-timestamp", "-id")
+
+    def get(self, request, *args, **kwargs):
+        incomes = Income.objects.for_user(request.user).select_related("source")
+        context = {
+            "objects": helpers.get_keyset_paginator_object(
+                request, incomes, self.paginate_by, self.ordering
+            ),
+            "title": "Income List",
+        }
+        return render(request, self.template_name, context)
 
-    def get_queryset(self, *args, **kwargs):
-        qs = Income.objects.filter(user=self.request.user).order_by(
-            "-timestamp",
-            "-created_at",
-        )
-        return qs
 
-    def get_context_data(self, *args, **kwargs):
-        context = super().get_context_data(*args, **kwargs)
-        context["objects"] = context["page_obj"]
-        context["title"] = "Income List"
-        return context
+class ImportIncomeCSV(LedgerCSVImportView):
+    """
+    imports incomes from CSV with amount, source and timestamp columns.
+    """
+    import_class = IncomeCSVImport
+
+
+class ExportIncomes(LedgerExportView):
+    """
+    streams incomes matching the search form as CSV or JSON.
+    """
+    model = Income
+    name_field = "source"
+    form_class = SelectDateRangeIncomeForm
+    filename = "incomes"
 
 
 class IncomeAdd(LoginRequiredMixin, View):
@@ -86,6 +110,8 @@ class IncomeAdd(LoginRequiredMixin, View):
                 timestamp=timestamp,
                 source=source,
             )
+            if source:
+                SOURCES.record(request.user.id, source.name)
             messages.success(request, "Income added successfully!")
             return HttpResponse(status=201)
         else:
@@ -131,6 +157,7 @@ class IncomeUpdateView(LoginRequiredMixin, View):
             amount = form.cleaned_data["amount"]
             timestamp = form.cleaned_data["timestamp"]
             source_name = form.cleaned_data.get("source", "").strip()
+            old_source = income.source
             if source_name:
                 try:
                     source = Source.objects.get(user=request.user, name=source_name)
@@ -141,6 +168,9 @@ class IncomeUpdateView(LoginRequiredMixin, View):
             income.amount = amount
             income.timestamp = timestamp
             income.save()
+            if old_source != income.source:
+                SOURCES.record(request.user.id, old_source and old_source.name, -1)
+                SOURCES.record(request.user.id, income.source.name)
             messages.success(request, "Income updated!")
             return HttpResponseRedirect(
                 redirect if redirect else request.get_full_path()
@@ -169,11 +199,13 @@ class YearWiseIncome(LoginRequiredMixin, View):
         dates = helpers.get_dates_list(first_date, latest_date, month=1, day=1)
         dates = helpers.get_paginator_object(request, dates, page_size)
 
+        year_incomes = helpers.bucket_aggregate(incomes, "year", dates[-1], dates[0])
+
         data = []
         monthly_averages = []
         for dt in dates:
             total_months = now.month if dt.year == now.year else 12
-            amount = aggregate_sum(incomes.filter(timestamp__year=dt.year))
+            amount = year_incomes[dt]["amount"]
             avg_income = amount // total_months
             data.append((dt, amount, avg_income))
             monthly_averages.append(avg_income)
@@ -183,31 +215,26 @@ class YearWiseIncome(LoginRequiredMixin, View):
         return render(request, self.template_name, self.context)
 
 
+@method_decorator(helpers.ledger_condition, name="dispatch")
 class YearlyIncomeExpenseReport(LoginRequiredMixin, View):
     template_name = "report.html"
 
     def get(self, request, *args, **kwargs):
         user = request.user
-        incomes = user.incomes
-        expenses = user.expenses
+        year_sums = helpers.income_expense_aggregate(user, "year", count__gt=0)
 
         now = helpers.get_ist_datetime()
         latest_date = now.date().replace(month=1, day=1)
-        first_income_date = (
-            incomes.dates("timestamp", "year", order="ASC").first() or latest_date
-        )
-        first_expense_date = (
-            expenses.dates("timestamp", "year", order="ASC").first() or latest_date
-        )
-        first_date = min(first_income_date, first_expense_date)
+        first_date = min(year_sums, default=latest_date)
         dates = helpers.get_dates_list(first_date, latest_date, month=1, day=1)
 
         dates = helpers.get_paginator_object(request, dates, 5)
 
+        zero_sums = {"income_sum": 0, "expense_sum": 0}
         data = []
         for date in dates:
-            income_sum = aggregate_sum(incomes.filter(timestamp__year=date.year))
-            expense_sum = aggregate_sum(expenses.filter(timestamp__year=date.year))
+            income_sum = year_sums.get(date, zero_sums)["income_sum"]
+            expense_sum = year_sums.get(date, zero_sums)["expense_sum"]
             expense_ratio = helpers.calculate_ratio(expense_sum, income_sum)
 
             data.append(
@@ -220,24 +247,27 @@ class YearlyIncomeExpenseReport(LoginRequiredMixin, View):
                 }
             )
 
+        incomes_total = sum(sums["income_sum"] for sums in year_sums.values())
+        expenses_total = sum(sums["expense_sum"] for sums in year_sums.values())
+
         context = {
             "title": "Report Card",
             "now": helpers.get_ist_datetime(),
-            "eir": helpers.expense_to_income_ratio(user),
+            "eir": helpers.calculate_ratio(expenses_total, incomes_total),
             "data": data,
             "objects": dates,
         }
         return render(request, self.template_name, context)
 
 
+@method_decorator(helpers.ledger_condition, name="dispatch")
 class MonthlyIncomeExpenseReport(LoginRequiredMixin, View):
     template_name = "report.html"
 
     def get(self, request, *args, **kwargs):
         user = request.user
         year = int(kwargs["year"])
-        incomes = user.incomes.filter(timestamp__year=year)
-        expenses = user.expenses.filter(timestamp__year=year)
+        month_sums = helpers.income_expense_aggregate(user, "month", month__year=year)
 
         now = get_ist_datetime()
         if year == now.year:
@@ -248,10 +278,11 @@ class MonthlyIncomeExpenseReport(LoginRequiredMixin, View):
         first_date = date(year, 1, 1)
         dates = helpers.get_dates_list(first_date, latest_date, day=1)
 
+        zero_sums = {"income_sum": 0, "expense_sum": 0}
         data = []
         for dt in dates:
-            income_sum = aggregate_sum(incomes.filter(timestamp__month=dt.month))
-            expense_sum = aggregate_sum(expenses.filter(timestamp__month=dt.month))
+            income_sum = month_sums.get(dt, zero_sums)["income_sum"]
+            expense_sum = month_sums.get(dt, zero_sums)["expense_sum"]
             expense_ratio = helpers.calculate_ratio(expense_sum, income_sum)
 
             data.append(
@@ -264,8 +295,8 @@ class MonthlyIncomeExpenseReport(LoginRequiredMixin, View):
                 }
             )
 
-        incomes_total = aggregate_sum(incomes)
-        expenses_total = aggregate_sum(expenses)
+        incomes_total = sum(sums["income_sum"] for sums in month_sums.values())
+        expenses_total = sum(sums["expense_sum"] for sums in month_sums.values())
         saved_total = incomes_total - expenses_total
         eir = helpers.calculate_ratio(expenses_total, incomes_total)
 
@@ -311,9 +342,11 @@ class MonthWiseIncome(LoginRequiredMixin, View):
         if year:
             year = int(year)
             total_months = now.month if year == now.year else 12
-            incomes = incomes.filter(timestamp__year=year)
+            incomes = incomes.in_year(year)
             context["title"] = f"{context['title']}: {year}"
-            context["total"] = aggregate_sum(incomes)
+            context["total"] = helpers.cached_aggregate(
+                user, f"income-total:{year}", lambda: aggregate_sum(incomes)
+            )
             context["monthly_average"] = context["total"] // total_months
             alt_first_date = date(year, 1, 1)
             if year == now.year:
@@ -326,24 +359,28 @@ class MonthWiseIncome(LoginRequiredMixin, View):
 
         # doing this way to maintain continuity of months
         first_date = (
-            incomes.dates("timestamp", "month", order="ASC").first() or alt_first_date
+            helpers.cached_aggregate(
+                user,
+                f"income-first-month:{year}",
+                lambda: incomes.dates("timestamp", "month", order="ASC").first(),
+            )
+            or alt_first_date
         )
         dates = helpers.get_dates_list(first_date, latest_date, day=1)
         dates = helpers.get_paginator_object(request, dates, 12)
 
+        month_incomes = helpers.cached_aggregate(
+            user,
+            f"month-wise-income:{dates[-1]}:{dates[0]}",
+            lambda: helpers.bucket_aggregate(incomes, "month", dates[-1], dates[0]),
+        )
+
         data = []
         for dt in dates:
-            amount = (
-                incomes.filter(
-                    timestamp__year=dt.year,
-                    timestamp__month=dt.month,
-                ).aggregate(Sum("amount"))["amount__sum"]
-                or 0
-            )
             data.append(
                 {
                     "date": dt,
-                    "amount": amount,
+                    "amount": month_incomes[dt]["amount"],
                 }
             )
 
@@ -370,14 +407,14 @@ class GoToIncome(LoginRequiredMixin, View):
             date(year, month, calendar.monthrange(year, month)[1])
         )
 
-        incomes = request.user.incomes
-        incomes = incomes.filter(timestamp__year=year, timestamp__month=month)
+        incomes = request.user.incomes.in_month(year, month)
+        total, count = helpers.aggregate_sum_count(incomes)
 
         context = {
             "title": f"Income: {date_str}",
-            "objects": incomes,
-            "total": aggregate_sum(incomes),
-            "count": incomes.count(),
+            "objects": incomes.select_related("source"),
+            "total": total,
+            "count": count,
             "year": year,
             "month": month,
             "from_date": from_date,
@@ -389,12 +426,7 @@ class GoToIncome(LoginRequiredMixin, View):
 class SourceView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         term = request.GET.get("term", "").strip()
-        sources = Source.objects.filter(
-            user=request.user, name__icontains=term
-        ).values_list("name", flat=True)
-
-        result = [source for source in sources]
-        data = json.dumps(result)
+        data = json.dumps(SOURCES.search(request.user, term))
 
         return HttpResponse(data, content_type="application/json")
 
@@ -414,7 +446,7 @@ class SourceWiseIncome(LoginRequiredMixin, View):
         incomes = user.incomes
 
         if month and year:
-            objects = incomes.filter(timestamp__year=year, timestamp__month=month)
+            objects = incomes.in_month(year, month)
             _month = date(year, month, 1)
             date_str = f': {_month.strftime("%b %Y")}'
             from_date = default_date_format(_month)
@@ -422,7 +454,7 @@ class SourceWiseIncome(LoginRequiredMixin, View):
                 date(year, month, calendar.monthrange(year, month)[1])
             )
         elif year:
-            objects = incomes.filter(timestamp__year=year)
+            objects = incomes.in_year(year)
             date_str = f": {year}"
             from_date = default_date_format(date(year, 1, 1))
             to_date = default_date_format(date(year, 12, 31))
@@ -441,27 +473,18 @@ class SourceWiseIncome(LoginRequiredMixin, View):
         else:
             objects = incomes
 
-        objects = objects.select_related("source")
-        sources = set()
-        for instance in objects:
-            sources.add(instance.source)
-
-        income_sum = aggregate_sum(objects)
+        source_rows, income_sum = helpers.group_aggregate(objects, "source__name")
 
         source_data = []
-        for source in sources:
-            source_filter = objects.filter(source=source)
-            amount = aggregate_sum(source_filter)
+        for row in source_rows:
             source_data.append(
                 {
-                    "source": source,
-                    "source_count": source_filter.count(),
-                    "amount": amount,
+                    "source_name": row["source__name"],
+                    "source_count": row["count"],
+                    "amount": row["amount"],
                 }
             )
 
-        source_data = sorted(source_data, key=lambda x: x["amount"], reverse=True)
-
         context = {
             "title": f"Source-Wise Income{date_str}",
             "sources": source_data,
@@ -497,14 +520,13 @@ class IncomeDateSearch(LoginRequiredMixin, View):
             from_date = form.cleaned_data.get("from_date")
             to_date = form.cleaned_data.get("to_date")
 
+            objects = helpers.filter_date_range(objects, from_date, to_date)
             if from_date and to_date:
-                objects = objects.filter(timestamp__range=(from_date, to_date))
                 from_date_str = default_date_format(from_date)
                 to_date_str = default_date_format(to_date)
                 date_str = f": {from_date_str} to {to_date_str}"
             elif from_date or to_date:
                 the_date = from_date or to_date
-                objects = objects.filter(timestamp=the_date)
                 from_date_str = to_date_str = default_date_format(the_date)
                 date_str = f": {from_date_str}"
 
@@ -513,8 +535,7 @@ class IncomeDateSearch(LoginRequiredMixin, View):
             elif source:
                 objects = objects.filter(source__name=source)
 
-            total = aggregate_sum(objects)
-            count = objects.count()
+            total, count = helpers.aggregate_sum_count(objects)
             try:
                 days = (to_date - from_date).days
                 months = days / AVG_MONTH_DAYS
@@ -523,7 +544,9 @@ class IncomeDateSearch(LoginRequiredMixin, View):
             except:
                 pass
 
-            context["objects"] = helpers.get_paginator_object(request, objects, 15)
+            context["objects"] = helpers.get_paginator_object(
+                request, objects.select_related("source"), 15, count=count
+            )
             context["total"] = total
             context["count"] = count
 
@@ -572,14 +595,17 @@ class SavingCalculationDetailView(LoginRequiredMixin, View):
                 )
             else:
                 SavingCalculation.objects.filter(user=request.user).update(
-                    **cleaned_data
+                    **cleaned_data, last_modified_at=timezone.now()
                 )
 
             # updating investment entity
             for name, pct in inv_cleaned_data.items():
                 InvestmentEntity.objects.filter(
                     saving_calculation=instance, name=name
-                ).update(percentage=pct)
+                ).update(percentage=pct, last_modified_at=timezone.now())
+            # update() skips post_save, bank balance of expense dashboard
+            # comes from saving calculation
+            bump_ledger_generation(request.user.id)
             messages.success(request, "Savings settings saved successfully!")
         else:
             messages.warning(request, "There is some error, please check fields below")
@@ -681,14 +707,10 @@ class SavingsCalculatorView(LoginRequiredMixin, View):
 
         amounts = []
         for dt in months_list[:MONTHS]:
-            month_income = incomes.filter(
-                timestamp__year=dt.year, timestamp__month=dt.month
-            )
+            month_income = incomes.in_month(dt.year, dt.month)
             amounts.append(aggregate_sum(month_income))
 
-        curr_month = incomes.filter(
-            timestamp__year=today.year, timestamp__month=today.month
-        )
+        curr_month = incomes.in_month(today.year, today.month)
         curr_month_amount = aggregate_sum(curr_month)
 
         if amounts:
@@ -723,9 +745,7 @@ class SavingsCalculatorView(LoginRequiredMixin, View):
                 f'Recent Income: <span class="amount">{aggregate_sum(recent_incomes):,}</span>'
             )
 
-        month_income = user.incomes.filter(
-            timestamp__year=now.year, timestamp__month=now.month
-        )
+        month_income = user.incomes.in_month(now.year, now.month)
         month_income_sum = aggregate_sum(month_income)
         defaults_message.append(
             f'This month\'s total income: <span class="amount">{month_income_sum:,}</span>'
@@ -740,9 +760,10 @@ class SavingsCalculatorView(LoginRequiredMixin, View):
             initial_data["savings_percentage"] = savings.savings_percentage
             initial_data["amount_to_keep_in_bank"] = amount_to_keep_in_bank
 
-            avg_expense = self.return_in_multiples(helpers.cal_avg_expense(user))
+            expense_profile = ExpenseProfile.get(user)
+            avg_expense = self.return_in_multiples(expense_profile.mean)
             last_12m_expense = self.return_in_multiples(
-                helpers.cal_avg_expense(user, YEARS=1)
+                expense_profile.last_12m_expense
             )
             auto_fill_amount_to_keep_in_bank = savings.auto_fill_amount_to_keep_in_bank
 
@@ -0,0 +1,187 @@
+import heapq
+
+from django.core.cache import cache
+from django.db.models import Count
+from django_redis import get_redis_connection
+
+
+def get_redis():
+    """
+    redis connection of default cache, None if cache is not django-redis
+    """
+    try:
+        return get_redis_connection("default")
+    except NotImplementedError:
+        return None
+
+
+class Autocomplete:
+    """
+    Ranked autocomplete of a user's names i.e. remarks, kept in redis:
+
+    - `names`: sorted set of "lowercase name\\x00name" for prefix lookups
+    - `suffixes`: same for every suffix of the name, for substring lookups
+    - `usage`: sorted set of name scored by number of uses
+
+    all members of `names` and `suffixes` have score 0, so ZRANGEBYLEX
+    fetches matches in O(log n + m). to not rank all m matches on every
+    keystroke, a search looks at the TOP_NAMES most used names and at most
+    MAX_CANDIDATES matches, which is exact unless a term matches more than
+    MAX_CANDIDATES names and fewer than MAX_RESULTS of the top ones.
+    keys are built from the db on first lookup, updated by `record` and
+    `remove`, and rebuilt after CACHE_TIMEOUT to drop any drift i.e. uses
+    removed by deleting expenses. falls back to querying the db if cache
+    is not redis.
+    """
+    KEY = "autocomplete:{kind}:{user_id}:{part}"
+    PARTS = ("names", "suffixes", "usage", "built")
+    MAX_RESULTS = 10
+    MAX_CANDIDATES = 100
+    TOP_NAMES = 100
+    CACHE_TIMEOUT = 3600 * 24
+    # terms shorter than this match start of names only
+    MIN_SUBSTRING_LENGTH = 3
+
+    def __init__(self, kind, related_name, usage_related_name):
+        self.kind = kind
+        self.related_name = related_name
+        self.usage_related_name = usage_related_name
+
+    def get_keys(self, user_id):
+        return {
+            part: cache.make_key(
+                self.KEY.format(kind=self.kind, user_id=user_id, part=part)
+            )
+            for part in self.PARTS
+        }
+
+    def get_usage(self, user):
+        return getattr(user, self.related_name).annotate(
+            count=Count(self.usage_related_name)
+        )
+
+    def _get_members(self, name):
+        lower = name.lower()
+        return (
+            f"{lower}\x00{name}",
+            [f"{lower[i:]}\x00{name}" for i in range(len(lower))],
+        )
+
+    def _add_name(self, pipe, keys, name):
+        member, suffixes = self._get_members(name)
+        pipe.zadd(keys["names"], {member: 0})
+        pipe.zadd(keys["suffixes"], dict.fromkeys(suffixes, 0))
+
+    def build(self, conn, user):
+        keys = self.get_keys(user.id)
+        pipe = conn.pipeline()
+        pipe.delete(*keys.values())
+        for name, count in self.get_usage(user).values_list("name", "count"):
+            self._add_name(pipe, keys, name)
+            pipe.zadd(keys["usage"], {name: count})
+        pipe.set(keys["built"], 1, ex=self.CACHE_TIMEOUT)
+        for part in ("names", "suffixes", "usage"):
+            pipe.expire(keys[part], self.CACHE_TIMEOUT)
+        pipe.execute()
+
+    def record(self, user_id, name, count=1):
+        """
+        adds `count` uses of `name`, negative to remove uses.
+        nothing to do if keys are not built yet as build reads the db.
+        """
+        conn = get_redis()
+        if conn is None or not name:
+            return
+        keys = self.get_keys(user_id)
+        if not conn.exists(keys["built"]):
+            return
+        pipe = conn.pipeline()
+        self._add_name(pipe, keys, name)
+        pipe.zincrby(keys["usage"], count, name)
+        pipe.execute()
+
+    def remove(self, user_id, name):
+        """removes a deleted `name`"""
+        conn = get_redis()
+        if conn is None or not name:
+            return
+        keys = self.get_keys(user_id)
+        member, suffixes = self._get_members(name)
+        pipe = conn.pipeline()
+        pipe.zrem(keys["names"], member)
+        pipe.zrem(keys["suffixes"], *suffixes)
+        pipe.zrem(keys["usage"], name)
+        pipe.execute()
+
+    def invalidate(self, user_id):
+        conn = get_redis()
+        if conn is not None:
+            conn.delete(*self.get_keys(user_id).values())
+
+    def search(self, user, term):
+        """
+        names starting with `term`, or containing it if it's long enough,
+        most used first.
+        """
+        conn = get_redis()
+        if conn is None:
+            return self.search_db(user, term)
+
+        keys = self.get_keys(user.id)
+        if not conn.exists(keys["built"]):
+            self.build(conn, user)
+
+        lower = term.lower()
+        substring = len(term) >= self.MIN_SUBSTRING_LENGTH
+        part = "suffixes" if substring else "names"
+        pipe = conn.pipeline(transaction=False)
+        pipe.zrevrange(keys["usage"], 0, self.TOP_NAMES - 1, withscores=True)
+        pipe.zrangebylex(
+            keys[part],
+            b"[" + lower.encode(),
+            b"[" + lower.encode() + b"\xff",
+            start=0,
+            num=self.MAX_CANDIDATES,
+        )
+        top, members = pipe.execute()
+
+        scores = {}
+        for name, score in top:
+            name = name.decode()
+            position = name.lower().find(lower)
+            if position == 0 or (substring and position > 0):
+                scores[name] = score
+        # names outside the top ones are used less than all of them
+        if len(scores) < self.MAX_RESULTS:
+            names = [
+                name
+                for name in dict.fromkeys(
+                    member.decode().split("\x00", 1)[1] for member in members
+                )
+                if name not in scores
+            ]
+            pipe = conn.pipeline(transaction=False)
+            for name in names:
+                pipe.zscore(keys["usage"], name)
+            scores.update(zip(names, pipe.execute()))
+
+        ranked = heapq.nsmallest(
+            self.MAX_RESULTS, scores.items(), key=lambda x: (-(x[1] or 0), x[0])
+        )
+        return [name for name, _ in ranked]
+
+    def search_db(self, user, term):
+        names = self.get_usage(user)
+        if len(term) < self.MIN_SUBSTRING_LENGTH:
+            names = names.filter(name__istartswith=term)
+        else:
+            names = names.filter(name__icontains=term)
+        return list(
+            names.order_by("-count", "name").values_list("name", flat=True)[
+                :self.MAX_RESULTS
+            ]
+        )
+
+
+REMARKS = Autocomplete("remark", "remarks", "expenses")
+SOURCES = Autocomplete("source", "sources", "incomes")
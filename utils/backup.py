@@ -0,0 +1,396 @@
+import gzip
+import io
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from account.models import AccountName, AccountNameAmount, NetWorth
+from expense.models import Expense, ExpenseMonthlyRollup, Remark
+from income.models import (
+    Income,
+    IncomeMonthlyRollup,
+    InvestmentEntity,
+    SavingCalculation,
+    Source,
+)
+from utils.autocomplete import REMARKS, SOURCES
+from utils.base_model import rebuild_monthly_rollups
+from utils.constants import (
+    BACKUP_FULL_EVERY_DAYS,
+    BACKUP_OVERLAP,
+    TOMBSTONE_RETENTION_DAYS,
+)
+from utils.expense_profile import ExpenseProfile
+from utils.helpers import bump_ledger_generation, invalidate_year_expenses
+from utils.ledger_export import gzip_stream
+from utils.models import Tombstone, restoring
+
+User = get_user_model()
+
+# in restore order, parents before children and tombstones before the
+# rows they may conflict with i.e. a remark re-created with the same name.
+# rollups and networth_amount of accounts are rebuilt by restore
+BACKUP_MODELS = [
+    User,
+    Tombstone,
+    Remark,
+    Source,
+    AccountName,
+    SavingCalculation,
+    Expense,
+    Income,
+    AccountNameAmount,
+    NetWorth,
+    InvestmentEntity,
+]
+BACKUP_DIR = "ledger"
+NAME_FORMAT = "%Y%m%d%H%M%S%f"
+CHUNK_SIZE = 2000
+
+
+def get_storage():
+    """storage of database backups, see DBBACKUP_STORAGE"""
+    return import_string(settings.DBBACKUP_STORAGE)(**settings.DBBACKUP_STORAGE_OPTIONS)
+
+
+def list_backups(storage):
+    """names of ledger backups in `storage`, oldest first"""
+    try:
+        _, files = storage.listdir(BACKUP_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        f"{BACKUP_DIR}/{name}"
+        for name in files
+        if name.startswith("ledger-") and name.endswith(".jsonl.gz")
+    )
+
+
+def parse_backup_name(name):
+    """(until, kind) of a backup name"""
+    _, until, kind = name.rsplit("/", 1)[-1].split(".", 1)[0].split("-")
+    until = datetime.strptime(until, NAME_FORMAT).replace(tzinfo=dt_timezone.utc)
+    return until, kind
+
+
+def _encode(value):
+    # DjangoJSONEncoder truncates microseconds, restored timestamps
+    # must be exact for sync cursors
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _model_totals(model):
+    aggregates = {"count": Count("pk")}
+    if any(field.name == "amount" for field in model._meta.concrete_fields):
+        aggregates["amount"] = Sum("amount")
+    totals = model.objects.order_by().aggregate(**aggregates)
+    if "amount" in totals:
+        totals["amount"] = totals["amount"] or 0
+    return totals
+
+
+def create_backup(storage=None, full=None, overlap=BACKUP_OVERLAP):
+    """
+    writes rows changed since the last backup, with their tombstones, as
+    gzipped JSON lines to `storage`. every BACKUP_FULL_EVERY_DAYS days,
+    or when `full`, all the rows are written instead. users are always
+    written in full, they have no last_modified_at.
+
+    first line is the header, each model is a line of its name and
+    fields followed by its rows as arrays, the last line has row count
+    and amount of every model to verify a restore with.
+    rows modified `overlap` seconds before the last backup are written
+    again, as they may not have been committed then.
+
+    the file is compressed and uploaded in chunks while rows are read,
+    so neither memory nor local disk holds the whole backup.
+    """
+    storage = storage or get_storage()
+    backups = list_backups(storage)
+    fulls = [until for until, kind in map(parse_backup_name, backups) if kind == "full"]
+    now = timezone.now()
+    if full is None:
+        full = not fulls or now - fulls[-1] >= timedelta(days=BACKUP_FULL_EVERY_DAYS)
+
+    since = None
+    if not full:
+        since = parse_backup_name(backups[-1])[0] - timedelta(seconds=overlap)
+
+    start = time.perf_counter()
+    # before the snapshot, rows modified in between are written again
+    # by the next backup
+    until = timezone.now()
+    kind = "full" if full else "incremental"
+    name = f"{BACKUP_DIR}/ledger-{until:{NAME_FORMAT}}-{kind}.jsonl.gz"
+    header = {
+        "kind": kind,
+        "since": since and since.isoformat(),
+        "until": until.isoformat(),
+    }
+    result = {"rows": 0}
+    chunks = _backup_chunks(header, since, result)
+    file = _ChunksFile(gzip_stream(chunks))
+    try:
+        name = storage.save(name, File(file, name))
+    except BaseException:
+        # restore can't read a truncated backup
+        if storage.exists(name):
+            storage.delete(name)
+        raise
+    finally:
+        chunks.close()
+    return {
+        "name": name,
+        "kind": kind,
+        "rows": result["rows"],
+        "size": file.size,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+class _ChunksFile(io.RawIOBase):
+    """
+    read only, unseekable file of the bytes of `chunks`,
+    for storages to upload as they're generated.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.pending = b""
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.chunks, None)
+            if self.pending is None:
+                self.pending = b""
+                return 0
+        length = min(len(buffer), len(self.pending))
+        buffer[:length] = self.pending[:length]
+        self.pending = self.pending[length:]
+        self.size += length
+        return length
+
+
+def _backup_chunks(header, since, result):
+    with _snapshot():
+        yield json.dumps(header) + "\n"
+        totals = {}
+        for model in BACKUP_MODELS:
+            yield from _model_chunks(model, since, result)
+            # pruned tombstones aren't deleted by later backups,
+            # so their count can't be verified
+            if model is not Tombstone:
+                totals[model._meta.label_lower] = _model_totals(model)
+        yield json.dumps({"totals": totals}) + "\n"
+
+
+@contextmanager
+def _snapshot():
+    """
+    transaction reading a consistent snapshot of all the tables on postgres,
+    where concurrent writes can't be seen till its end.
+    """
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if connection.vendor == "postgresql" and outermost:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        yield
+
+
+def _model_chunks(model, since, result):
+    fields = [field.attname for field in model._meta.concrete_fields]
+    queryset = model.objects.order_by("pk")
+    if since is not None and "last_modified_at" in fields:
+        queryset = queryset.filter(last_modified_at__gt=since)
+    yield json.dumps({"model": model._meta.label_lower, "fields": fields}) + "\n"
+    lines = []
+    for row in queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+        lines.append(json.dumps(row, default=_encode, separators=(",", ":")))
+        result["rows"] += 1
+        if len(lines) >= CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def restore_backups(storage=None, until=None, verify=True):
+    """
+    restores the latest full backup and the incremental ones after it,
+    till the backup named `until` if given, into an empty database.
+    rows are upserted by id with their timestamps, deleted rows are
+    deleted by their tombstones, then rollups are rebuilt.
+
+    with `verify`, row count and amount of every model are compared with
+    the last backup and nothing is restored on mismatch, or if it has no
+    totals. raises ValueError if there's nothing to restore or
+    verification fails.
+    """
+    storage = storage or get_storage()
+    backups = list_backups(storage)
+    if until:
+        backups = [name for name in backups if name <= until]
+    fulls = [i for i, name in enumerate(backups) if parse_backup_name(name)[1] == "full"]
+    if not fulls:
+        raise ValueError("no full backup to restore from")
+    if User.objects.exists():
+        raise ValueError("restore needs an empty database")
+    chain = backups[fulls[-1]:]
+
+    rows = 0
+    with transaction.atomic(), _keep_timestamps():
+        for name in chain:
+            replay = _BackupReplay()
+            replay.run(storage, name)
+            rows += replay.count
+        User.objects.exclude(pk__in=replay.user_ids).delete()
+        # pruned since the full backup, see prune_tombstones
+        until = parse_backup_name(chain[-1])[0]
+        Tombstone.objects.filter(
+            last_modified_at__lt=until - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+        ).delete()
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), BACKUP_MODELS):
+                cursor.execute(sql)
+
+        rebuild_monthly_rollups(
+            ExpenseMonthlyRollup, Expense.objects.order_by(), "remark_id"
+        )
+        rebuild_monthly_rollups(
+            IncomeMonthlyRollup, Income.objects.order_by(), "source_id"
+        )
+        AccountName.objects.update_networth_amount()
+
+        if verify:
+            if not replay.totals:
+                raise ValueError(
+                    f"{chain[-1]} has no totals to verify with, it may be truncated"
+                )
+            errors = []
+            for label, expected in replay.totals.items():
+                actual = _model_totals(_get_model(label))
+                if actual != expected:
+                    errors.append(f"{label}: expected {expected}, restored {actual}")
+            if errors:
+                raise ValueError("restore verification failed: " + "; ".join(errors))
+
+    for user_id in replay.user_ids:
+        invalidate_year_expenses(user_id)
+        ExpenseProfile.invalidate(user_id)
+        REMARKS.invalidate(user_id)
+        SOURCES.invalidate(user_id)
+        bump_ledger_generation(user_id)
+    return {"backups": chain, "rows": rows}
+
+
+def _get_model(label):
+    return next(model for model in BACKUP_MODELS if model._meta.label_lower == label)
+
+
+@contextmanager
+def _keep_timestamps():
+    """
+    turns off auto_now of backed up models, so restored rows keep their
+    created_at and last_modified_at. fields are shared by the process,
+    only meant for restore command.
+    """
+    fields = [
+        model._meta.get_field(name)
+        for model in BACKUP_MODELS
+        for name in ("created_at", "last_modified_at")
+        if any(field.name == name for field in model._meta.concrete_fields)
+    ]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class _BackupReplay:
+    """applies the rows of one backup file"""
+    BATCH_SIZE = 1000
+
+    def __init__(self):
+        self.count = 0
+        self.totals = {}
+        self.user_ids = []
+        self.model = None
+        self.fields = None
+
+    def run(self, storage, name):
+        with storage.open(name, "rb") as file, gzip.GzipFile(fileobj=file) as gz:
+            lines = io.TextIOWrapper(gz, encoding="utf-8")
+            next(lines)  # header
+            batch = []
+            for line in lines:
+                value = json.loads(line)
+                if isinstance(value, list):
+                    batch.append(value)
+                    if len(batch) >= self.BATCH_SIZE:
+                        self.apply(batch)
+                        batch = []
+                    continue
+                self.apply(batch)
+                batch = []
+                if "model" in value:
+                    self.model = _get_model(value["model"])
+                    self.fields = value["fields"]
+                else:
+                    self.totals = value["totals"]
+            self.apply(batch)
+
+    def apply(self, batch):
+        if not batch:
+            return
+        if self.model is User:
+            self.user_ids.extend(row[self.fields.index("id")] for row in batch)
+        elif self.model is Tombstone:
+            self.delete(batch)
+
+        pk = self.model._meta.pk
+        self.model.objects.bulk_create(
+            [self.model(**dict(zip(self.fields, row))) for row in batch],
+            update_conflicts=True,
+            unique_fields=[pk.name],
+            update_fields=[
+                self.model._meta.get_field(field).name
+                for field in self.fields
+                if field != pk.attname
+            ],
+        )
+        self.count += len(batch)
+
+    def delete(self, batch):
+        model_field = self.fields.index("model")
+        object_id_field = self.fields.index("object_id")
+        deleted = defaultdict(list)
+        for row in batch:
+            deleted[row[model_field]].append(row[object_id_field])
+
+        models = {model._meta.model_name: model for model in BACKUP_MODELS}
+        with restoring():
+            for model_name, ids in deleted.items():
+                models[model_name].objects.filter(pk__in=ids).delete()
@@ -1,4 +1,11 @@
-from django.db import models
+from datetime import date
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Subquery, Sum
+from django.db.models.functions import TruncMonth
+
+from utils.helpers import get_ist_datetime, get_next_bucket_start
+
 
 class BaseModel(models.Model):
     created_at = models.DateTimeField(null=True, blank=True, auto_now_add=True)
@@ -6,3 +13,183 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class LedgerQuerySet(models.QuerySet):
+    """
+    chainable user and date filters for models with `user` and `timestamp`
+    i.e. Expense.objects.for_user(user).in_month(2024, 3)
+
+    dates are filtered as half-open ranges (timestamp >= start AND
+    timestamp < end) instead of __year/__month/__day lookups, which compile
+    to EXTRACT() and can't seek the (user, -timestamp) index.
+    year, month and day default to today's in IST.
+    """
+    date_field = "timestamp"
+
+    def for_user(self, user):
+        return self.filter(user=user)
+
+    def in_range(self, start, end):
+        """
+        rows with date in [start, end)
+        """
+        return self.filter(
+            **{f"{self.date_field}__gte": start, f"{self.date_field}__lt": end}
+        )
+
+    def in_year(self, year=None):
+        start = date(year or get_ist_datetime().year, 1, 1)
+        return self.in_range(start, get_next_bucket_start(start, "year"))
+
+    def in_month(self, year=None, month=None):
+        today = get_ist_datetime()
+        start = date(year or today.year, month or today.month, 1)
+        return self.in_range(start, get_next_bucket_start(start, "month"))
+
+    def on_day(self, year=None, month=None, day=None):
+        today = get_ist_datetime()
+        start = date(year or today.year, month or today.month, day or today.day)
+        return self.in_range(start, get_next_bucket_start(start, "day"))
+
+
+class BaseMonthlyRollup(BaseModel):
+    """
+    sum and count of a user's rows for a month, subclasses add
+    `user` and the grouping fields i.e. remark or source.
+    """
+    month = models.DateField(help_text="first day of the month")
+    amount = models.BigIntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def apply_delta(cls, user_id, timestamp, amount, count, **keys):
+        """
+        atomically adds amount and count to the month's rollup row
+        using F() expressions, creating the row if required.
+        """
+        month = date(timestamp.year, timestamp.month, 1)
+        rows = cls.objects.filter(user_id=user_id, month=month, **keys)
+        # rows with NULL keys are not unique, so update only one of them
+        row = rows.filter(pk=Subquery(rows.values("pk")[:1]))
+        updated = row.update(amount=F("amount") + amount, count=F("count") + count)
+
+        # nothing to subtract from i.e. rollup row is already deleted in cascade
+        if updated or count <= 0:
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    user_id=user_id, month=month, amount=amount, count=count, **keys
+                )
+        except IntegrityError:
+            # created by a concurrent request in the meantime
+            row.update(amount=F("amount") + amount, count=F("count") + count)
+
+    @classmethod
+    def apply_deltas(cls, user_id, deltas, key_field):
+        """
+        `apply_delta` of {(month, key): (amount, count)} i.e. of rows added
+        in bulk, in a constant number of queries whatever the number of
+        months and keys. `key_field` is the attname of the key i.e. remark_id.
+        """
+        if not deltas:
+            return
+        rows = cls.objects.filter(
+            user_id=user_id, month__in={month for month, _ in deltas}
+        ).order_by("pk")
+        pks = {}
+        # rows with NULL keys are not unique, so update only one of them
+        for pk, month, key in rows.values_list("pk", "month", key_field):
+            pks.setdefault((month, key), pk)
+
+        updated, created = [], []
+        for (month, key), (amount, count) in deltas.items():
+            if (month, key) in pks:
+                updated.append(cls(
+                    pk=pks[(month, key)],
+                    amount=F("amount") + amount,
+                    count=F("count") + count,
+                ))
+            elif count > 0:
+                created.append(cls(
+                    user_id=user_id, month=month, amount=amount, count=count,
+                    **{key_field: key},
+                ))
+        if updated:
+            cls.objects.bulk_update(updated, ["amount", "count"])
+        if not created:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create(created)
+        except IntegrityError:
+            # some created by a concurrent request in the meantime
+            for row in created:
+                cls.apply_delta(
+                    user_id, row.month, row.amount, row.count,
+                    **{key_field: getattr(row, key_field)},
+                )
+
+
+def rebuild_monthly_rollups(rollup_model, queryset, key_field, user_ids=None, batch_size=1000):
+    """
+    recomputes rollup rows from scratch using a single grouped query,
+    for all the users if `user_ids` is not provided.
+    note: works with historical models too, so can be used in migrations.
+    """
+    rollups = rollup_model.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+
+    rows = (
+        queryset.order_by()
+        .annotate(month=TruncMonth("timestamp"))
+        .values("user_id", "month", key_field)
+        .annotate(amount_sum=Sum("amount"), row_count=Count("pk"))
+    )
+
+    with transaction.atomic():
+        rollups.delete()
+
+        objs = []
+        for row in rows.iterator():
+            objs.append(
+                rollup_model(
+                    user_id=row["user_id"],
+                    month=row["month"],
+                    amount=row["amount_sum"],
+                    count=row["row_count"],
+                    **{key_field: row[key_field]},
+                )
+            )
+            if len(objs) >= batch_size:
+                rollup_model.objects.bulk_create(objs)
+                objs = []
+        rollup_model.objects.bulk_create(objs)
+
+
+def get_or_create_names(model, user, names):
+    """
+    {name: id} of the user's `model` rows i.e. remarks with these names,
+    creating missing ones, in at most three queries whatever the number
+    of names. names must already be as they are saved.
+    """
+    names = set(names) - {""}
+    if not names:
+        return {}
+    rows = model.objects.filter(user=user, name__in=names)
+    ids = dict(rows.values_list("name", "id"))
+    missing = names - ids.keys()
+    if missing:
+        # conflicts are rows created by a concurrent request
+        model.objects.bulk_create(
+            [model(user=user, name=name) for name in missing], ignore_conflicts=True
+        )
+        ids.update(rows.filter(name__in=missing).values_list("name", "id"))
+    return ids
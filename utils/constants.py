@@ -5,8 +5,31 @@ AVG_MONTH_DAYS = 365 / 12
 
 SHOW_INCOME_CALCULATOR_HOUR = 48
 
+# cached report tables, see `fragments` cache in settings
+FRAGMENT_CACHE_TIMEOUT = 3600 * 24
+
 DEFAULT_AMOUNT_IN_MULTIPLES_OF = 100
 
+# max expenses in a request to bulk expense api
+BULK_EXPENSE_LIMIT = 1000
+
+# largest amount of expense and income, PositiveIntegerField's range on postgres
+MAX_AMOUNT = 2147483647
+
+# max rows of each model in a sync response
+SYNC_PAGE_SIZE = 1000
+# seconds of changes sent again by sync, as rows committed late can
+# have last_modified_at older than the rows already sent
+SYNC_OVERLAP = 300
+# days tombstones are kept for, sync cursors older than this expire
+TOMBSTONE_RETENTION_DAYS = 90
+
+# days between full ledger backups, incremental ones in between
+BACKUP_FULL_EVERY_DAYS = 7
+# seconds of changes backed up again by the next incremental backup,
+# same reason as SYNC_OVERLAP
+BACKUP_OVERLAP = 300
+
 AUTO_FILL_AMOUNT_CHOICES = [
     (0, "No"),
     (1, "Auto from income"),
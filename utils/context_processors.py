@@ -1,5 +1,20 @@
 from .constants import *
+from .helpers import get_ist_datetime, get_ledger_generation
 
 
 def constants(request):
     return {"constants": {k: v for k, v in globals().items() if k.isupper()}}
+
+
+def ledger_version(request):
+    """
+    version of user's ledger data for keys of cached template fragments,
+    fetched only if a template uses it.
+    """
+    def version():
+        if not request.user.is_authenticated:
+            return ""
+        generation = get_ledger_generation(request.user.id)
+        return f"{generation}:{get_ist_datetime().date()}"
+
+    return {"ledger_version": version}
@@ -0,0 +1,60 @@
+import statistics
+
+from django.core.cache import cache
+
+from .helpers import aggregate_sum, calculate_ratio, fetch_year_expenses, get_ist_datetime
+
+
+class ExpenseProfile:
+    """
+    Expense statistics of a user computed together once and cached
+    till the next expense or income write.
+    """
+    CACHE_KEY = "expense-profile:{user_id}"
+    CACHE_TIMEOUT = 3600 * 24
+    YEARS = 3
+    METHODS = {
+        "mean": statistics.mean,
+        "median": statistics.median,
+        "max": max,
+        "min": min,
+    }
+
+    def __init__(self, year_expenses, expense_sum, income_sum):
+        self.year_expenses = year_expenses
+        self.expense_sum = expense_sum
+        self.income_sum = income_sum
+
+        for method, method_func in self.METHODS.items():
+            value = int(method_func(year_expenses)) if year_expenses else 0
+            setattr(self, method, value)
+
+        self.last_12m_expense = year_expenses[0] if year_expenses else 0
+        self.total_saved_amount = income_sum - expense_sum
+        self.eir = calculate_ratio(expense_sum, income_sum)
+
+    def avg_expense(self, method="mean"):
+        if method not in self.METHODS:
+            raise ValueError("Invalid value provided for 'method' arg")
+        return getattr(self, method)
+
+    @classmethod
+    def get(cls, user):
+        this_month = get_ist_datetime().date().replace(day=1)
+        cache_key = cls.CACHE_KEY.format(user_id=user.id)
+        cached = cache.get(cache_key)
+        # yearly expenses move with the month
+        if cached and cached["month"] == this_month:
+            return cls(**cached["data"])
+
+        data = {
+            "year_expenses": fetch_year_expenses(user, YEARS=cls.YEARS),
+            "expense_sum": aggregate_sum(user.expense_rollups),
+            "income_sum": aggregate_sum(user.income_rollups),
+        }
+        cache.set(cache_key, {"month": this_month, "data": data}, cls.CACHE_TIMEOUT)
+        return cls(**data)
+
+    @classmethod
+    def invalidate(cls, user_id):
+        cache.delete(cls.CACHE_KEY.format(user_id=user_id))
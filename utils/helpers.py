@@ -1,12 +1,25 @@
+import base64
+import hashlib
+import json
+import re
 import statistics
-from datetime import timedelta
+import time
+from datetime import date, timedelta
 from functools import lru_cache
 
 import pytz
 from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.db.models import Q, Sum
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import BigIntegerField, Count, Q, Sum, Value
+from django.db.models.functions import TruncDay, TruncMonth, TruncYear
 from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
 
 def get_ist_datetime(dt=None):
@@ -32,6 +45,31 @@ def aggregate_sum(queryset, field_name='amount'):
     return queryset.aggregate(Sum(field_name))[field_name + '__sum'] or 0
 
 
+def aggregate_sum_count(queryset, field_name='amount'):
+    """
+    returns (sum, count) of queryset using a single query
+    """
+    result = queryset.aggregate(total=Sum(field_name), count=Count('pk'))
+    return result['total'] or 0, result['count']
+
+
+def group_aggregate(queryset, field_name, sum_field='amount'):
+    """
+    Returns sum and count of `sum_field` grouped by `field_name`
+    along with grand total, using a single GROUP BY query.
+    i.e. ([{'remark__name': 'food', 'amount': 1200, 'count': 4}, ...], 1200)
+    rows are in DESC order of amount
+    """
+    rows = list(
+        queryset.order_by()
+        .values(field_name)
+        .annotate(amount=Sum(sum_field), count=Count('pk'))
+        .order_by('-amount', field_name)
+    )
+    total = sum(row['amount'] or 0 for row in rows)
+    return rows, total
+
+
 def calculate_ratio(amount, total):
     if total > 0:
         ratio = (amount/total) * 100
@@ -40,13 +78,18 @@ def calculate_ratio(amount, total):
 
 
 def expense_to_income_ratio(user):
-    expense_sum = user.expenses.aggregate(Sum('amount'))['amount__sum'] or 0
-    income_sum = user.incomes.aggregate(Sum('amount'))['amount__sum'] or 0
+    expense_sum = aggregate_sum(user.expense_rollups)
+    income_sum = aggregate_sum(user.income_rollups)
     return calculate_ratio(expense_sum, income_sum)
 
 
-def get_paginator_object(request, queryset, paginate_by):
+def get_paginator_object(request, queryset, paginate_by, count=None):
+    """
+    pass `count` if it's already known to skip paginator's COUNT(*)
+    """
     paginator = Paginator(queryset, paginate_by)
+    if count is not None:
+        paginator.count = count
     page = request.GET.get('page')
     try:
         objects = paginator.page(page)
@@ -58,22 +101,202 @@ def get_paginator_object(request, queryset, paginate_by):
     return objects
 
 
+class KeysetPage(list):
+    """
+    a page of `get_keyset_paginator_object`, renders with cursor_paginator.html
+    """
+    has_previous = has_next = False
+    previous_query = next_query = ""
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, fields):
+    """
+    returns (direction, values) with values converted by model `fields`,
+    or None if token is not valid
+    """
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, values = json.loads(payload)
+    except (ValueError, TypeError):
+        return None
+    if direction not in ('next', 'previous') or not isinstance(values, list) or len(values) != len(fields):
+        return None
+    try:
+        values = [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValidationError, TypeError, ValueError):
+        return None
+    # ordering fields aren't nullable, None can't be compared
+    if None in values:
+        return None
+    return direction, values
+
+
+def _keyset_filter(ordering, values, reverse=False):
+    """
+    rows after `values` in `ordering` i.e. for ('-timestamp', '-id'):
+    timestamp < v0 OR (timestamp = v0 AND id < v1)
+    """
+    filter_Q = Q()
+    for i in reversed(range(len(ordering))):
+        field = ordering[i].lstrip('-')
+        lookup = 'lt' if ordering[i].startswith('-') != reverse else 'gt'
+        equal_Q = Q(**{ordering[j].lstrip('-'): values[j] for j in range(i)})
+        filter_Q = (equal_Q & Q(**{f'{field}__{lookup}': values[i]})) | filter_Q
+    return filter_Q
+
+
+def get_keyset_paginator_object(request, queryset, paginate_by, ordering):
+    """
+    paginates with opaque `?cursor=` tokens which seek past the last
+    row of a page instead of OFFSET and COUNT(*), so every page costs
+    the same. `ordering` must be unique i.e. end with 'id' and should
+    be backed by an index.
+    """
+    fields = [field.lstrip('-') for field in ordering]
+    cursor = decode_cursor(
+        request.GET.get('cursor', ''),
+        [queryset.model._meta.get_field(field) for field in fields],
+    )
+    direction, values = cursor if cursor else ('next', None)
+    reverse = direction == 'previous'
+
+    if reverse:
+        queryset = queryset.order_by(*[
+            field[1:] if field.startswith('-') else f'-{field}' for field in ordering
+        ])
+    else:
+        queryset = queryset.order_by(*ordering)
+    if values is not None:
+        queryset = queryset.filter(_keyset_filter(ordering, values, reverse))
+
+    # fetching one extra row to know if there is one more page
+    rows = list(queryset[:paginate_by + 1])
+    has_more = len(rows) > paginate_by
+    rows = rows[:paginate_by]
+    if reverse:
+        rows.reverse()
+
+    page = KeysetPage(rows)
+    if not rows:
+        return page
+    page.has_previous = has_more if reverse else values is not None
+    page.has_next = True if reverse else has_more
+
+    query = request.GET.copy()
+    query.pop('page', None)
+    for name, row in (('previous', rows[0]), ('next', rows[-1])):
+        query['cursor'] = encode_cursor(name, [getattr(row, field) for field in fields])
+        setattr(page, f'{name}_query', query.urlencode())
+    return page
+
+
 def default_date_format(dt):
     return dt.strftime(settings.DEFAULT_DATE_FORMAT)
     
 
-def search_expense_remark(queryset, q):
-    filter_Q = Q(amount__iexact=q)
-    queries = [x.strip() for x in q.split(',')]
+SEARCH_AMOUNT_RE = re.compile(r'^(?P<op>>=|<=|>|<)?\s*(?P<amount>\d+)$')
+SEARCH_AMOUNT_RANGE_RE = re.compile(r'^(?P<start>\d+)\s*\.\.\s*(?P<end>\d+)$')
+SEARCH_AMOUNT_LOOKUPS = {None: 'exact', '>': 'gt', '>=': 'gte', '<': 'lt', '<=': 'lte'}
+SEARCH_DAYS_RE = re.compile(r'^@(?P<days>\d+)d$')
+SEARCH_MONTH_RE = re.compile(r'^@(?P<year>\d{4})(-(?P<month>\d{1,2}))?$')
 
-    for query in queries:
-        if query.count('"') == 2 and (query[0] == '"' and query[-1] == '"'):
-            query = query.strip('"')
-            filter_Q |= Q(remark__name__iexact=query)
-        else:
-            filter_Q |= Q(remark__name__icontains=query)
-    
-    queryset = queryset.filter(filter_Q).distinct()
+
+def compile_search_date(token):
+    """
+    returns [start, end) dates of a date shortcut i.e. @today, @yesterday,
+    @7d (last 7 days), @month, @year, @2024, @2024-03, None if invalid
+    """
+    today = get_ist_datetime().date()
+    if token == '@today':
+        return today, today + timedelta(days=1)
+    if token == '@yesterday':
+        return today - timedelta(days=1), today
+    if token in ('@month', '@year'):
+        start = get_bucket_start(today, token[1:])
+        return start, get_next_bucket_start(start, token[1:])
+
+    match = SEARCH_DAYS_RE.match(token)
+    if match:
+        return today - timedelta(days=int(match['days']) - 1), today + timedelta(days=1)
+
+    match = SEARCH_MONTH_RE.match(token)
+    if match:
+        bucket = 'month' if match['month'] else 'year'
+        try:
+            start = date(int(match['year']), int(match['month'] or 1), 1)
+        except ValueError:
+            return None
+        return start, get_next_bucket_start(start, bucket)
+    return None
+
+
+def compile_search_token(token):
+    """
+    returns (kind, Q) of a search token, kind is one of remark, amount or date
+    """
+    if token == '""':
+        return 'remark', Q(remark__isnull=True)
+    if len(token) > 2 and token[0] == '"' and token[-1] == '"':
+        return 'remark', Q(remark__name__iexact=token[1:-1])
+    if len(token) > 1 and token[-1] == '*':
+        return 'remark', Q(remark__name__istartswith=token[:-1])
+
+    match = SEARCH_AMOUNT_RANGE_RE.match(token)
+    if match:
+        return 'amount', Q(amount__range=(int(match['start']), int(match['end'])))
+    match = SEARCH_AMOUNT_RE.match(token)
+    if match:
+        lookup = SEARCH_AMOUNT_LOOKUPS[match['op']]
+        return 'amount', Q(**{f'amount__{lookup}': int(match['amount'])})
+
+    if token.startswith('@'):
+        dates = compile_search_date(token)
+        if dates:
+            return 'date', Q(timestamp__gte=dates[0], timestamp__lt=dates[1])
+
+    return 'remark', Q(remark__name__icontains=token)
+
+
+def search_expenses(queryset, q):
+    """
+    filters expenses by comma separated search tokens:
+
+    - "food": remark is exactly food, "" for no remark
+    - foo*: remark starts with foo
+    - food: remark contains food
+    - 500, >500, >=500, <500, <=500, 500..1000: amount
+    - @today, @yesterday, @7d, @month, @year, @2024, @2024-03: date
+
+    tokens of the same kind are OR-ed, different kinds are AND-ed
+    i.e. "food, fuel, >500, @30d". remark lookups use trigram index
+    on remark name (postgres), amount uses (user, -amount, -id) index.
+    """
+    filters = {}
+    for token in q.split(','):
+        token = token.strip()
+        if token:
+            kind, filter_Q = compile_search_token(token)
+            filters[kind] = filters.get(kind, Q()) | filter_Q
+
+    for filter_Q in filters.values():
+        queryset = queryset.filter(filter_Q)
+    return queryset
+
+
+def filter_date_range(queryset, from_date=None, to_date=None):
+    """
+    rows between from_date and to_date (both inclusive),
+    or on the date if only one of them is provided.
+    """
+    if from_date and to_date:
+        return queryset.filter(timestamp__range=(from_date, to_date))
+    if from_date or to_date:
+        return queryset.filter(timestamp=from_date or to_date)
     return queryset
 
 
@@ -95,6 +318,113 @@ def get_dates_list(first_date, latest_date, *, month=None, day=None, daydelta=-1
     return dates
 
 
+BUCKET_TRUNC_FUNCTIONS = {
+    "day": TruncDay,
+    "month": TruncMonth,
+    "year": TruncYear,
+}
+
+
+def get_bucket_start(dt, bucket):
+    if bucket == "year":
+        return dt.replace(month=1, day=1)
+    if bucket == "month":
+        return dt.replace(day=1)
+    return dt
+
+
+def get_next_bucket_start(dt, bucket):
+    dt = get_bucket_start(dt, bucket)
+    if bucket == "year":
+        return dt.replace(year=dt.year + 1)
+    if bucket == "month":
+        return (dt + timedelta(days=32)).replace(day=1)
+    return dt + timedelta(days=1)
+
+
+def get_bucket_dates_list(first_date, latest_date, bucket):
+    """result is in DESC order"""
+    first_date = get_bucket_start(first_date, bucket)
+    latest_date = get_bucket_start(latest_date, bucket)
+    if bucket == "year":
+        return get_dates_list(first_date, latest_date, month=1, day=1)
+    if bucket == "month":
+        return get_dates_list(first_date, latest_date, day=1)
+    return get_dates_list(first_date, latest_date)
+
+
+def bucket_aggregate(queryset, bucket, first_date, latest_date, *,
+                     date_field='timestamp', field_name='amount', count_field=None):
+    """
+    Returns sum and count of every day, month or year `bucket` between
+    first_date and latest_date using a single GROUP BY query,
+    buckets with no rows are zero filled.
+    pass `count_field` to sum it instead of counting rows i.e. for rollups.
+    i.e. {date(2024, 3, 1): {'amount': 1200, 'count': 4}, ...}
+    result is in DESC order
+    """
+    if bucket not in BUCKET_TRUNC_FUNCTIONS:
+        raise ValueError("Invalid value provided for 'bucket' arg")
+
+    trunc_func = BUCKET_TRUNC_FUNCTIONS[bucket]
+    rows = (
+        queryset.filter(**{
+            f'{date_field}__gte': get_bucket_start(first_date, bucket),
+            f'{date_field}__lt': get_next_bucket_start(latest_date, bucket),
+        })
+        .order_by()
+        .annotate(bucket=trunc_func(date_field))
+        .values('bucket')
+        .annotate(
+            amount=Sum(field_name),
+            count=Sum(count_field) if count_field else Count('pk'),
+        )
+    )
+    sums = {row['bucket']: row for row in rows}
+
+    data = {}
+    for dt in get_bucket_dates_list(first_date, latest_date, bucket):
+        row = sums.get(dt)
+        data[dt] = {
+            'amount': (row['amount'] or 0) if row else 0,
+            'count': (row['count'] or 0) if row else 0,
+        }
+    return data
+
+
+def income_expense_aggregate(user, bucket, **filters):
+    """
+    Returns income and expense sum of every month or year `bucket` from
+    user's monthly rollups using a single UNION ALL query.
+    `filters` are applied on both rollup tables i.e. month__year=2024
+    i.e. {date(2024, 1, 1): {'income_sum': 5000, 'expense_sum': 1200}, ...}
+    """
+    if bucket not in ("month", "year"):
+        raise ValueError("Invalid value provided for 'bucket' arg")
+
+    trunc_func = BUCKET_TRUNC_FUNCTIONS[bucket]
+    zero = Value(0, output_field=BigIntegerField())
+
+    def grouped(queryset, **sums):
+        return (
+            queryset.filter(**filters)
+            .order_by()
+            .annotate(bucket=trunc_func('month'))
+            .values('bucket')
+            .annotate(**sums)
+        )
+
+    expenses = grouped(user.expense_rollups, income_sum=zero, expense_sum=Sum('amount'))
+    incomes = grouped(user.income_rollups, income_sum=Sum('amount'), expense_sum=zero)
+
+    data = {}
+    for row in expenses.union(incomes, all=True):
+        sums = data.setdefault(row['bucket'], {'income_sum': 0, 'expense_sum': 0})
+        sums['income_sum'] += row['income_sum'] or 0
+        sums['expense_sum'] += row['expense_sum'] or 0
+    return data
+
+
 def calculate_cagr(final_amount, start_amount, years):
     networth_cagr = 0
     if years:
@@ -110,15 +440,117 @@ def calculate_cagr(final_amount, start_amount, years):
     return networth_cagr
 
 
+LEDGER_GENERATION_KEY = "ledger-generation:{user_id}"
+CACHED_AGGREGATE_KEY = "aggregate:{user_id}:{generation}:{key}"
+CACHED_AGGREGATE_TIMEOUT = 3600 * 24
+CACHE_MISS = object()
+
+
+def get_ledger_generation(user_id):
+    """
+    version of a user's expense, income and net worth data, changes
+    on every write. starts from current time (not 0) so a counter lost
+    by eviction can't come back to a generation already used.
+    """
+    key = LEDGER_GENERATION_KEY.format(user_id=user_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def _incr_ledger_generation(user_id):
+    key = LEDGER_GENERATION_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def bump_ledger_generation(user_id):
+    """
+    invalidates everything cached by `cached_aggregate` for the user.
+    bumped again on commit, as values computed by other requests before
+    the write is committed may have been cached with the new generation.
+    """
+    _incr_ledger_generation(user_id)
+    transaction.on_commit(lambda: _incr_ledger_generation(user_id))
+
+
+def cached_aggregate(user, key, fn, timeout=CACHED_AGGREGATE_TIMEOUT):
+    """
+    returns fn() cached till the user's next expense, income or net worth
+    write. `key` must contain everything the result depends on other
+    than the user's data i.e. today's date or page.
+    """
+    cache_key = CACHED_AGGREGATE_KEY.format(
+        user_id=user.id, generation=get_ledger_generation(user.id), key=key
+    )
+    result = cache.get(cache_key, CACHE_MISS)
+    if result is CACHE_MISS:
+        result = fn()
+        cache.set(cache_key, result, timeout)
+    return result
+
+
+def ledger_etag(request, *args, **kwargs):
+    """
+    ETag of pages which change only with user's ledger data and date.
+    session is part of it as pages embed csrf token, which changes
+    on login. None (no ETag) if there are messages to show.
+    """
+    if not request.user.is_authenticated or len(messages.get_messages(request)):
+        return None
+    version = ":".join([
+        str(request.user.id),
+        str(get_ledger_generation(request.user.id)),
+        str(get_ist_datetime().date()),
+        request.session.session_key or "",
+    ])
+    return hashlib.md5(version.encode()).hexdigest()
+
+
+def ledger_condition(view_func):
+    """
+    conditional GET for views using `ledger_etag`, responds with
+    304 Not Modified if the page in browser's cache is still valid.
+    """
+    view_func = condition(etag_func=ledger_etag)(view_func)
+    return cache_control(private=True, no_cache=True)(view_func)
+
+
+YEAR_EXPENSES_CACHE_KEY = "year-expenses:{user_id}"
+
+
+def invalidate_year_expenses(user_id):
+    cache.delete(YEAR_EXPENSES_CACHE_KEY.format(user_id=user_id))
+
+
 def fetch_year_expenses(user, *, YEARS=3):
     """
-    Returns yearly expenses
+    Returns yearly expenses of last YEARS years (excluding current month),
+    cached per user till the next expense write.
     """
     this_month = get_ist_datetime().date().replace(day=1)
+    cache_key = YEAR_EXPENSES_CACHE_KEY.format(user_id=user.id)
+    cached = cache.get(cache_key) or {}
+    if (this_month, YEARS) in cached:
+        return cached[(this_month, YEARS)]
+
     first_month = this_month.replace(year=this_month.year - YEARS)
     latest_month = (this_month - timedelta(days=1)).replace(day=1)
 
-    first_expense = user.expenses.dates('timestamp', 'month', order='ASC').first()
+    # rollups are at most a few rows per month, so fetching whole
+    # history also gives the first expense month in the same query
+    month_expenses = dict(
+        user.expense_rollups.filter(count__gt=0, month__lt=this_month)
+        .order_by()
+        .values('month')
+        .annotate(amount=Sum('amount'))
+        .values_list('month', 'amount')
+    )
+    first_expense = min(month_expenses, default=None)
     if first_expense:
         if first_expense > first_month:
             first_month = first_expense
@@ -130,14 +562,14 @@ def fetch_year_expenses(user, *, YEARS=3):
     year_expenses = []
 
     for i in range(0, year):
-        expenses = 0
         from_range = i * 12
         to_range = (i + 1) * 12
-        for dt in months[from_range:to_range]:
-            expense = user.expenses.filter(timestamp__year=dt.year, timestamp__month=dt.month)
-            expenses += aggregate_sum(expense)
-        year_expenses.append(expenses)
+        year_expenses.append(
+            sum(month_expenses.get(dt, 0) for dt in months[from_range:to_range])
+        )
 
+    cached[(this_month, YEARS)] = year_expenses
+    cache.set(cache_key, cached, 3600 * 24)
     return year_expenses
 
 
@@ -0,0 +1,230 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import date, datetime
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views import View
+
+from expense.models import Expense, ExpenseMonthlyRollup, Remark
+from income.models import Income, IncomeMonthlyRollup, Source
+from utils.autocomplete import REMARKS, SOURCES
+from utils.base_model import get_or_create_names
+from utils.constants import MAX_AMOUNT
+from utils.expense_profile import ExpenseProfile
+from utils.helpers import bump_ledger_generation, invalidate_year_expenses
+
+
+class LedgerCSVImport:
+    """
+    Imports a user's expenses or incomes from CSV with columns
+    amount, timestamp and the name column i.e. remark.
+
+    rows are read from the file one chunk at a time, names of a chunk are
+    mapped to the user's rows in one query and the chunk is inserted with
+    COPY on postgres, bulk_create otherwise. invalid rows are skipped and
+    reported, everything else is imported in a single transaction.
+    save signals are skipped, so rollups and caches are updated at the end.
+    """
+    model = None
+    name_model = None
+    name_field = None
+    rollup_model = None
+    autocomplete = None
+    CHUNK_SIZE = 10000
+    # only these many errors are reported, all of them are counted
+    MAX_ERRORS = 100
+    REQUIRED_COLUMNS = ("amount", "timestamp")
+
+    def __init__(self, user, progress=None):
+        self.user = user
+        self.progress = progress
+        self.count = 0
+        self.error_count = 0
+        self.errors = []
+        self.max_name_length = self.name_model._meta.get_field("name").max_length
+        self.columns = [
+            self.model._meta.get_field(name).column
+            for name in (
+                "user", "amount", self.name_field, "timestamp",
+                "created_at", "last_modified_at",
+            )
+        ]
+
+    def normalize_name(self, name):
+        return name.strip()
+
+    def parse_date(self, value):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            pass
+        for date_format in settings.DATE_INPUT_FORMATS:
+            try:
+                return datetime.strptime(value, date_format).date()
+            except ValueError:
+                pass
+        raise ValueError(f"invalid timestamp {value!r}")
+
+    def parse_row(self, row):
+        try:
+            amount = int((row["amount"] or "").replace(",", ""))
+        except ValueError:
+            raise ValueError(f"invalid amount {row['amount']!r}")
+        if amount < 0:
+            raise ValueError("amount can't be negative")
+        if amount > MAX_AMOUNT:
+            raise ValueError(f"amount can't be more than {MAX_AMOUNT}")
+        timestamp = self.parse_date((row["timestamp"] or "").strip())
+        name = self.normalize_name(row.get(self.name_field) or "")
+        if len(name) > self.max_name_length:
+            raise ValueError(
+                f"{self.name_field} is longer than {self.max_name_length} characters"
+            )
+        return amount, name, timestamp
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def run(self, file):
+        """
+        imports rows of the text `file`, raises ValueError if it's not a
+        valid CSV or required columns are missing.
+        """
+        reader = csv.DictReader(file)
+        try:
+            missing = set(self.REQUIRED_COLUMNS) - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(f"missing columns: {', '.join(sorted(missing))}")
+
+            deltas = defaultdict(lambda: [0, 0])
+            with transaction.atomic():
+                chunk = []
+                for row in reader:
+                    try:
+                        chunk.append(self.parse_row(row))
+                    except ValueError as e:
+                        self.add_error(reader.line_num, str(e))
+                    if len(chunk) >= self.CHUNK_SIZE:
+                        self.insert(chunk, deltas)
+                        chunk = []
+                if chunk:
+                    self.insert(chunk, deltas)
+
+                self.rollup_model.apply_deltas(
+                    self.user.id, deltas, f"{self.name_field}_id"
+                )
+                # after commit, else other requests may cache the old rows again
+                transaction.on_commit(self.invalidate)
+        except csv.Error as e:
+            raise ValueError(f"line {reader.line_num}: {e}")
+        self.autocomplete.invalidate(self.user.id)
+        return self
+
+    def insert(self, chunk, deltas):
+        ids = get_or_create_names(
+            self.name_model, self.user, {name for _, name, _ in chunk}
+        )
+        now = timezone.now()
+        rows = []
+        for amount, name, timestamp in chunk:
+            name_id = ids.get(name)
+            rows.append((self.user.id, amount, name_id, timestamp, now, now))
+            delta = deltas[(timestamp.replace(day=1), name_id)]
+            delta[0] += amount
+            delta[1] += 1
+
+        if connection.vendor == "postgresql":
+            self.copy(rows)
+        else:
+            self.model.objects.bulk_create(
+                [self.model(**dict(zip(self.columns, row))) for row in rows],
+                batch_size=1000,
+            )
+        self.count += len(rows)
+        if self.progress:
+            self.progress(self)
+
+    def copy(self, rows):
+        quote_name = connection.ops.quote_name
+        sql = "COPY {} ({}) FROM STDIN".format(
+            quote_name(self.model._meta.db_table),
+            ", ".join(quote_name(column) for column in self.columns),
+        )
+        with connection.cursor() as cursor:
+            with cursor.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+
+    def invalidate(self):
+        ExpenseProfile.invalidate(self.user.id)
+        bump_ledger_generation(self.user.id)
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+class ExpenseCSVImport(LedgerCSVImport):
+    model = Expense
+    name_model = Remark
+    name_field = "remark"
+    rollup_model = ExpenseMonthlyRollup
+    autocomplete = REMARKS
+
+    def normalize_name(self, name):
+        # same as remark's pre_save, which bulk inserts skip
+        return name.strip().lower()
+
+    def invalidate(self):
+        super().invalidate()
+        invalidate_year_expenses(self.user.id)
+
+
+class IncomeCSVImport(LedgerCSVImport):
+    model = Income
+    name_model = Source
+    name_field = "source"
+    rollup_model = IncomeMonthlyRollup
+    autocomplete = SOURCES
+
+
+CSV_IMPORTS = {
+    "expense": ExpenseCSVImport,
+    "income": IncomeCSVImport,
+}
+
+
+class LedgerCSVImportView(LoginRequiredMixin, View):
+    """
+    imports CSV uploaded as `file`, responds with the number of
+    imported rows and errors of the skipped ones.
+    """
+    import_class = None
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get("file")
+        if not upload:
+            return self.error_response("a CSV file is required")
+        # uploads are read in chunks, large ones from a temporary file
+        file = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+        try:
+            result = self.import_class(request.user).run(file)
+        except ValueError as e:
+            return self.error_response(str(e))
+        data = json.dumps(result.as_dict())
+        return HttpResponse(data, content_type="application/json")
+
+    def error_response(self, error):
+        data = json.dumps({"error": error})
+        return HttpResponse(data, status=400, content_type="application/json")
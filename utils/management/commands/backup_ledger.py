@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from utils.backup import create_backup
+
+
+class Command(BaseCommand):
+    help = (
+        "Backs up ledger rows changed since the last backup, all of them once "
+        "a week, as gzipped JSON lines to DBBACKUP_STORAGE. see `restore_ledger`"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true", help="back up all the rows"
+        )
+
+    def handle(self, *args, **options):
+        result = create_backup(full=options["full"] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['kind'].capitalize()} backup {result['name']}: "
+            f"{result['rows']} rows, {result['size']} bytes in {result['seconds']}s"
+        ))
@@ -0,0 +1,97 @@
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from expense.models import Expense
+from utils.backup import create_backup
+from utils.helpers import get_ist_datetime
+from utils.management.commands.benchmark_views import get_git_revision
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares time and size of a full ledger backup, an incremental one "
+        "after --changes expenses are updated or deleted, and `dbbackup`. "
+        "changes are rolled back, backups are written to a temporary directory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--changes", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="JSON file to write results to")
+
+    def handle(self, *args, **options):
+        expense_ids = list(Expense.objects.order_by("pk").values_list("pk", flat=True))
+        if not expense_ids:
+            raise CommandError("no expenses to back up, run `generate_data` first")
+
+        with tempfile.TemporaryDirectory() as location:
+            storage = FileSystemStorage(location=location)
+            full = create_backup(storage, full=True)
+            self.stdout.write(self.format("full", full))
+            incremental = self.incremental_backup(storage, expense_ids, options)
+            self.stdout.write(self.format("incremental", incremental))
+            dbbackup = self.dbbackup(location)
+            if "error" not in dbbackup:
+                self.stdout.write(self.format("dbbackup", dbbackup))
+
+        results = {
+            "meta": {
+                "git_revision": get_git_revision(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "expenses": len(expense_ids),
+                "changes": options["changes"],
+                "date": str(get_ist_datetime().date()),
+            },
+            "full": full,
+            "incremental": incremental,
+            "dbbackup": dbbackup,
+        }
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def incremental_backup(self, storage, expense_ids, options):
+        rng = random.Random(options["seed"])
+        changed = rng.sample(expense_ids, min(options["changes"], len(expense_ids)))
+        with transaction.atomic():
+            # through save and delete, as the views do, for signals and tombstones
+            for i, expense in enumerate(Expense.objects.filter(pk__in=changed)):
+                if i % 4:
+                    expense.amount += 1
+                    expense.save()
+                else:
+                    expense.delete()
+            # no overlap, rows of full backup may have just been generated
+            result = create_backup(storage, full=False, overlap=0)
+            transaction.set_rollback(True)
+        return result
+
+    def dbbackup(self, location):
+        path = os.path.join(location, "dbbackup.gz")
+        start = time.perf_counter()
+        try:
+            call_command("dbbackup", compress=True, output_path=path, quiet=True)
+        except Exception as e:
+            # i.e. pg_dump isn't installed
+            return {"error": str(e)}
+        return {
+            "size": os.path.getsize(path),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+
+    def format(self, name, result):
+        return f"{name}: {result.get('rows', '-')} rows, {result['size']} bytes in {result['seconds']}s"
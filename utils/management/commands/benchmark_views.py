@@ -0,0 +1,159 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from utils.expense_profile import ExpenseProfile
+from utils.helpers import (
+    bump_ledger_generation,
+    get_ist_datetime,
+    invalidate_year_expenses,
+)
+
+
+def get_views(today):
+    """(name, url) of hot views to benchmark"""
+    return [
+        ("basic-info", reverse("expense:get-basic-info")),
+        ("expense-list", reverse("expense:expense_list")),
+        ("expense-search", reverse("expense:search") + "?remark=food"),
+        ("month-wise-expense", reverse("expense:month-wise-expense")),
+        ("year-wise-expense", reverse("expense:year-wise-expense")),
+        (
+            "remark-wise-expense",
+            reverse(
+                "expense:remark_monthly_expense",
+                kwargs={"year": today.year, "month": today.month},
+            ),
+        ),
+        ("all-remark-wise-expense", reverse("expense:all_remark_expenses")),
+        ("income-expense-report", reverse("income:report")),
+        ("networth-dashboard", reverse("account:networth-dashboard")),
+        ("savings-calculator", reverse("income:savings-calculator")),
+    ]
+
+
+def get_git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+class Command(BaseCommand):
+    help = (
+        "Times hot views and counts their queries for users generated by "
+        "`generate_data`, cold i.e. right after a write and warm i.e. cached. "
+        "Results are written as JSON to compare between commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--username",
+            nargs="*",
+            help="users to benchmark, users with --prefix by default",
+        )
+        parser.add_argument("--prefix", default="bench")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--view", nargs="*", help="only benchmark these views")
+        parser.add_argument("--output", help="JSON file to write results to")
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by("id")
+        if options["username"]:
+            users = users.filter(username__in=options["username"])
+        else:
+            users = users.filter(username__startswith=f"{options['prefix']}-")
+        if not users:
+            raise CommandError("no users to benchmark, run `generate_data` first")
+
+        today = get_ist_datetime().date()
+        views = get_views(today)
+        if options["view"]:
+            views = [view for view in views if view[0] in options["view"]]
+
+        host = next((h for h in settings.ALLOWED_HOSTS if h != "*"), "localhost")
+        client = Client(HTTP_HOST=host.lstrip("."))
+        results = {
+            "meta": {
+                "git_revision": get_git_revision(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "repeat": options["repeat"],
+                "date": str(today),
+            },
+            "users": {},
+        }
+        for user in users:
+            client.force_login(user)
+            expenses = user.expenses.count()
+            self.stdout.write(f"{user.username} ({expenses} expenses)")
+            results["users"][user.username] = {
+                "expenses": expenses,
+                "views": {
+                    name: self.benchmark(client, user, name, url, options["repeat"])
+                    for name, url in views
+                },
+            }
+            client.logout()
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def request(self, client, url):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(url)
+            duration = (time.perf_counter() - start) * 1000
+        if response.status_code != 200:
+            raise CommandError(f"{url} responded with {response.status_code}")
+        return duration, len(queries)
+
+    def invalidate(self, user):
+        bump_ledger_generation(user.id)
+        invalidate_year_expenses(user.id)
+        ExpenseProfile.invalidate(user.id)
+
+    def benchmark(self, client, user, name, url, repeat):
+        cold_ms, cold_queries = [], []
+        for _ in range(repeat):
+            self.invalidate(user)
+            duration, queries = self.request(client, url)
+            cold_ms.append(duration)
+            cold_queries.append(queries)
+
+        warm_ms, warm_queries = [], []
+        for _ in range(repeat):
+            duration, queries = self.request(client, url)
+            warm_ms.append(duration)
+            warm_queries.append(queries)
+
+        result = {
+            "url": url,
+            "cold_ms": round(statistics.median(cold_ms), 2),
+            "cold_queries": max(cold_queries),
+            "warm_ms": round(statistics.median(warm_ms), 2),
+            "warm_queries": max(warm_queries),
+        }
+        self.stdout.write(
+            f"  {name}: cold {result['cold_ms']}ms/{result['cold_queries']}q, "
+            f"warm {result['warm_ms']}ms/{result['warm_queries']}q"
+        )
+        return result
@@ -0,0 +1,185 @@
+import random
+from datetime import date, timedelta
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from account.models import AccountName, AccountNameAmount, NetWorth, rebuild_networth
+from expense.models import Expense, ExpenseMonthlyRollup, Remark
+from income.models import Income, IncomeMonthlyRollup, SavingCalculation, Source
+from utils.autocomplete import REMARKS, SOURCES
+from utils.base_model import rebuild_monthly_rollups
+from utils.expense_profile import ExpenseProfile
+from utils.helpers import (
+    bump_ledger_generation,
+    get_dates_list,
+    get_ist_datetime,
+    invalidate_year_expenses,
+)
+
+REMARK_WORDS = [
+    "food", "fuel", "rent", "grocery", "milk", "fruits", "vegetables",
+    "electricity", "internet", "mobile", "medicine", "doctor", "movie",
+    "books", "clothes", "shoes", "gift", "travel", "taxi", "bus", "train",
+    "flight", "hotel", "gym", "insurance", "repair", "furniture", "snacks",
+    "coffee", "tea", "lunch", "dinner", "breakfast", "party", "donation",
+    "stationery", "toys", "games", "music", "haircut", "laundry", "water",
+    "gas", "maintenance", "parking", "toll", "subscription", "course",
+    "school", "pets",
+]
+SOURCES_NAMES = ["salary", "bonus", "interest", "dividend", "freelance"]
+# (name, type, starting balance), type 0 is liability
+ACCOUNTS = [
+    ("bank", 1, 200000),
+    ("fixed deposit", 1, 500000),
+    ("mutual funds", 1, 300000),
+    ("stocks", 1, 150000),
+    ("home loan", 0, 2500000),
+    ("credit card", 0, 30000),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates deterministic users with expenses, incomes, remarks, sources, "
+        "accounts and net worth history, one user per --expenses size "
+        "i.e. bench-1000. used by `benchmark_views`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--expenses",
+            nargs="+",
+            type=int,
+            default=[1000],
+            help="number of expenses of each generated user",
+        )
+        parser.add_argument("--years", type=int, default=3)
+        parser.add_argument(
+            "--months", type=int, help="months of data till this month, instead of --years"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="bench")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        usernames = [f"{options['prefix']}-{size}" for size in options["expenses"]]
+        existing = User.objects.filter(username__in=usernames).values_list(
+            "username", flat=True
+        )
+        if existing:
+            raise CommandError(
+                f"users already exist: {', '.join(existing)}, use another --prefix"
+            )
+
+        for size, username in zip(options["expenses"], usernames):
+            rng = random.Random(f"{options['seed']}:{size}")
+            with transaction.atomic():
+                user = User.objects.create_user(username=username, password=username)
+                self.generate(
+                    user, rng, size, self.get_first_date(options), options["batch_size"]
+                )
+            self.stdout.write(f"{username}: {size} expenses generated")
+        self.stdout.write(self.style.SUCCESS("Data generated successfully!"))
+
+    def bulk_create(self, model, objs, batch_size):
+        objs = iter(objs)
+        while batch := list(islice(objs, batch_size)):
+            model.objects.bulk_create(batch)
+
+    def get_first_date(self, options):
+        today = get_ist_datetime().date()
+        if options["months"]:
+            year, month = divmod(today.year * 12 + today.month - options["months"], 12)
+            return date(year, month + 1, 1)
+        return today.replace(year=today.year - options["years"]) + timedelta(days=1)
+
+    def generate(self, user, rng, size, first_date, batch_size):
+        today = get_ist_datetime().date()
+        days = (today - first_date).days + 1
+        months = get_dates_list(first_date, today, day=1)[::-1]
+
+        remarks = Remark.objects.bulk_create(
+            [Remark(user=user, name=name) for name in REMARK_WORDS]
+        )
+        # few remarks are used far more than others
+        remark_weights = [1 / (i + 1) for i in range(len(remarks))]
+        self.bulk_create(
+            Expense,
+            (
+                Expense(
+                    user=user,
+                    amount=max(1, int(rng.lognormvariate(5.5, 1.2))),
+                    remark=(
+                        rng.choices(remarks, remark_weights)[0]
+                        if rng.random() > 0.05
+                        else None
+                    ),
+                    timestamp=first_date + timedelta(days=rng.randrange(days)),
+                )
+                for _ in range(size)
+            ),
+            batch_size,
+        )
+
+        sources = Source.objects.bulk_create(
+            [Source(user=user, name=name) for name in SOURCES_NAMES]
+        )
+        incomes = []
+        for month in months:
+            incomes.append(
+                Income(user=user, amount=rng.randint(80, 120) * 1000,
+                       source=sources[0], timestamp=month)
+            )
+            if rng.random() < 0.3:
+                incomes.append(
+                    Income(user=user, amount=rng.randint(1, 50) * 1000,
+                           source=rng.choice(sources[1:]),
+                           timestamp=month + timedelta(days=rng.randrange(28)))
+                )
+        self.bulk_create(Income, incomes, batch_size)
+
+        accounts = AccountName.objects.bulk_create(
+            [AccountName(user=user, name=name, type=type) for name, type, _ in ACCOUNTS]
+        )
+        amounts = []
+        networth = {month: 0 for month in months}
+        for account, (_, type, balance) in zip(accounts, ACCOUNTS):
+            for month in months:
+                balance = max(0, int(balance * rng.uniform(0.97, 1.05)))
+                amounts.append(
+                    AccountNameAmount(account_name=account, amount=balance, date=month)
+                )
+                networth[month] += balance if type else -balance
+        self.bulk_create(AccountNameAmount, amounts, batch_size)
+        self.bulk_create(
+            NetWorth,
+            (NetWorth(user=user, amount=amount, date=month)
+             for month, amount in networth.items()),
+            batch_size,
+        )
+
+        SavingCalculation.objects.create(
+            user=user,
+            savings_fixed_amount=10000,
+            savings_percentage=50,
+            amount_to_keep_in_bank=40000,
+            auto_fill_amount_to_keep_in_bank=9,
+        )
+
+        # bulk_create skips save signals, doing their work here
+        rebuild_monthly_rollups(
+            ExpenseMonthlyRollup, Expense.objects.order_by(), "remark_id", [user.id]
+        )
+        rebuild_monthly_rollups(
+            IncomeMonthlyRollup, Income.objects.order_by(), "source_id", [user.id]
+        )
+        rebuild_networth(user)
+        invalidate_year_expenses(user.id)
+        ExpenseProfile.invalidate(user.id)
+        REMARKS.invalidate(user.id)
+        SOURCES.invalidate(user.id)
+        bump_ledger_generation(user.id)
@@ -0,0 +1,47 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.ledger_import import CSV_IMPORTS
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports a user's expenses or incomes from CSV with amount, timestamp "
+        "and remark or source columns. invalid rows are skipped and reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file, - for stdin")
+        parser.add_argument("--username", required=True)
+        parser.add_argument("--kind", choices=CSV_IMPORTS, default="expense")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["username"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"user {options['username']} does not exist")
+
+        importer = CSV_IMPORTS[options["kind"]](user, progress=self.progress)
+        try:
+            if options["path"] == "-":
+                importer.run(sys.stdin)
+            else:
+                with open(options["path"], encoding="utf-8-sig", newline="") as f:
+                    importer.run(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        for error in importer.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if importer.error_count > len(importer.errors):
+            self.stderr.write(
+                f"... {importer.error_count - len(importer.errors)} more errors"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {importer.count} rows, skipped {importer.error_count} invalid rows"
+        ))
+
+    def progress(self, importer):
+        self.stdout.write(f"{importer.count} rows imported")
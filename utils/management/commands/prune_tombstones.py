@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from utils.constants import TOMBSTONE_RETENTION_DAYS
+from utils.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes tombstones older than TOMBSTONE_RETENTION_DAYS, sync cursors "
+        "older than that have expired and need a full sync anyway."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=TOMBSTONE_RETENTION_DAYS)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        count, _ = Tombstone.objects.filter(last_modified_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} tombstones"))
@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from expense.models import Expense, ExpenseMonthlyRollup
+from income.models import Income, IncomeMonthlyRollup
+from utils.base_model import rebuild_monthly_rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes monthly expense and income rollup tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--username",
+            nargs="*",
+            help="only rebuild rollups of these users, all users by default",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options["username"]:
+            user_ids = list(
+                get_user_model()
+                .objects.filter(username__in=options["username"])
+                .values_list("id", flat=True)
+            )
+
+        rebuild_monthly_rollups(
+            ExpenseMonthlyRollup, Expense.objects.order_by(), "remark_id", user_ids
+        )
+        rebuild_monthly_rollups(
+            IncomeMonthlyRollup, Income.objects.order_by(), "source_id", user_ids
+        )
+        self.stdout.write(self.style.SUCCESS("Rollups rebuilt successfully!"))
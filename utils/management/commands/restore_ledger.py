@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.backup import restore_backups
+
+
+class Command(BaseCommand):
+    help = (
+        "Restores the latest full ledger backup and the incremental ones after "
+        "it into an empty database, verifying row counts and amounts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--until", help="name of the last backup to restore, latest by default"
+        )
+        parser.add_argument(
+            "--no-verify", action="store_true", help="skip verification of restored rows"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            result = restore_backups(
+                until=options["until"], verify=not options["no_verify"]
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        for name in result["backups"]:
+            self.stdout.write(f"restored {name}")
+        self.stdout.write(self.style.SUCCESS(f"Restored {result['rows']} rows"))
@@ -0,0 +1,132 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """
+    execute wrapper counting queries and their time on a db connection.
+    statements are counted by their SQL with placeholders, so the same
+    statement with different params is a duplicate i.e. N+1 queries.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values() if count > 1)
+
+    def most_duplicated(self):
+        sql, count = self.statements.most_common(1)[0] if self.statements else ("", 0)
+        return sql if count > 1 else ""
+
+
+class SQLInstrumentationMiddleware:
+    """
+    times every request, those slower than SQL_INSTRUMENTATION_SLOW_MS
+    are logged as warning with view name. queries, db time and duplicate
+    statements are counted for a sample of requests only, logged along
+    with the most duplicated statement if slow, and sent as
+    `Server-Timing` header if SQL_INSTRUMENTATION_SERVER_TIMING is on.
+    streamed responses are timed till the body is fully sent.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.SQL_INSTRUMENTATION_SAMPLE_RATE
+        self.slow_ms = settings.SQL_INSTRUMENTATION_SLOW_MS
+        self.server_timing = settings.SQL_INSTRUMENTATION_SERVER_TIMING
+
+    def __call__(self, request):
+        stats = QueryStats() if random.random() < self.sample_rate else None
+        start = time.perf_counter()
+        with self.instrument(stats):
+            response = self.get_response(request)
+
+        if stats is not None and self.server_timing:
+            total_ms = (time.perf_counter() - start) * 1000
+            db_ms = stats.duration * 1000
+            # streamed body isn't counted, headers are sent before it
+            response["Server-Timing"] = ", ".join([
+                f'db;dur={db_ms:.1f};desc="{stats.count} queries, {stats.duplicates} duplicate"',
+                f"total;dur={total_ms:.1f}",
+            ])
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, stats, start, response.streaming_content
+            )
+        else:
+            self.log(request, response, stats, start)
+        return response
+
+    @contextmanager
+    def instrument(self, stats):
+        """counts queries in `stats`, if the request is sampled"""
+        # connections are per thread (greenlet under gevent), so wrappers
+        # only see this request's queries
+        with ExitStack() as stack:
+            if stats is not None:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+            yield
+
+    def stream(self, request, response, stats, start, content):
+        """
+        streamed body i.e. exports runs its queries after the view has
+        returned, so they're counted while it's iterated and logged at its end.
+        """
+        try:
+            with self.instrument(stats):
+                yield from content
+        finally:
+            self.log(request, response, stats, start)
+
+    def log(self, request, response, stats, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        slow = total_ms >= self.slow_ms
+        if not slow and stats is None:
+            return
+
+        match = request.resolver_match
+        data = {
+            "view": match.view_name if match else "",
+            "method": request.method,
+            "status": response.status_code,
+        }
+        if stats is not None:
+            data.update({
+                "queries": stats.count,
+                "duplicates": stats.duplicates,
+                "db_ms": round(stats.duration * 1000, 1),
+            })
+        data["total_ms"] = round(total_ms, 1)
+        if slow and stats is not None:
+            data["duplicated_sql"] = stats.most_duplicated()
+        logger.log(
+            logging.WARNING if slow else logging.INFO,
+            " ".join(
+                f"{key}={json.dumps(value) if isinstance(value, str) else value}"
+                for key, value in data.items()
+            ),
+            extra={"sql_stats": data},
+        )
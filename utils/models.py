@@ -0,0 +1,64 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth import get_user_model
+from django.db import models
+
+from utils.base_model import BaseModel
+
+User = get_user_model()
+
+_restoring = ContextVar("restoring", default=False)
+
+# Create your models here.
+
+
+class Tombstone(BaseModel):
+    """
+    a deleted row of a synced model, so sync clients and incremental
+    backups can delete it too. `model` is the model name i.e. expense,
+    same as in sync response.
+    """
+    user = models.ForeignKey(User, related_name="tombstones", on_delete=models.CASCADE)
+    model = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.model}: {self.object_id}"
+
+    class Meta:
+        indexes = [models.Index(fields=("user", "last_modified_at"))]
+
+
+def record_tombstone(instance, *args, user_id=None, **kwargs):
+    """
+    post_delete receiver of synced and backed up models, pass `user_id`
+    if the model has no `user`.
+    """
+    # user is being deleted, their tombstones too
+    origin = kwargs.get("origin")
+    if getattr(origin, "model", type(origin)) is User or is_restoring():
+        return
+    Tombstone.objects.create(
+        user_id=user_id or instance.user_id,
+        model=instance._meta.model_name,
+        object_id=instance.pk,
+    )
+
+
+@contextmanager
+def restoring():
+    """
+    deletes replayed by restore in this block don't record tombstones,
+    which are restored as they were, nor update net worth, which
+    restore rebuilds.
+    """
+    token = _restoring.set(True)
+    try:
+        yield
+    finally:
+        _restoring.reset(token)
+
+
+def is_restoring():
+    return _restoring.get()
@@ -0,0 +1,141 @@
+import json
+from datetime import datetime, timedelta
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views import View
+
+from account.models import AccountName, AccountNameAmount
+from expense.models import Expense, Remark
+from income.models import Income, Source
+from utils.constants import SYNC_OVERLAP, SYNC_PAGE_SIZE, TOMBSTONE_RETENTION_DAYS
+from utils.models import Tombstone
+
+# model: (user lookup, fields sent)
+SYNC_MODELS = {
+    Remark: ("user", ("name",)),
+    Source: ("user", ("name",)),
+    AccountName: ("user", ("name", "type")),
+    Expense: ("user", ("amount", "remark_id", "timestamp", "created_at")),
+    Income: ("user", ("amount", "source_id", "timestamp", "created_at")),
+    AccountNameAmount: ("account_name__user", ("account_name_id", "amount", "date")),
+    Tombstone: ("user", ("model", "object_id")),
+}
+CURSOR_SALT = "utils.sync"
+# start of overlap of the first page, while paging
+REWIND_KEY = "_rewind"
+
+
+class SyncView(LoginRequiredMixin, View):
+    """
+    rows of the user's synced models changed since `?since=<cursor>`,
+    all the rows without it, along with the next cursor:
+
+        {"changes": {"expense": [...], ...}, "cursor": "...", "has_more": false}
+
+    each model is paged by (last_modified_at, id), call again with the
+    cursor while `has_more`. deleted rows come as tombstones, with model
+    name and object_id. deleting a remark or source sets it to NULL on
+    expenses or incomes without changing their last_modified_at, clients
+    should do the same on its tombstone.
+
+    rows committed late can have last_modified_at older than rows already
+    sent, so once all the pages are sent the cursor goes back SYNC_OVERLAP
+    seconds from the first page, and the next sync sends those changes
+    again i.e. rows imported just before. this re-sending is expected,
+    clients must apply changes idempotently i.e. upsert by id.
+    tombstones are kept for TOMBSTONE_RETENTION_DAYS, older cursors are
+    rejected with 410 and clients must sync again without a cursor.
+    """
+
+    def decode_cursor(self, token):
+        data = signing.loads(
+            token, salt=CURSOR_SALT, max_age=timedelta(days=TOMBSTONE_RETENTION_DAYS)
+        )
+        rewind = data.pop(REWIND_KEY, None)
+        positions = {
+            model: (datetime.fromisoformat(last_modified_at), pk)
+            for model, (last_modified_at, pk) in data.items()
+        }
+        return positions, rewind and datetime.fromisoformat(rewind)
+
+    def encode_cursor(self, positions, rewind=None):
+        data = {
+            model: [last_modified_at.isoformat(), pk]
+            for model, (last_modified_at, pk) in positions.items()
+        }
+        if rewind:
+            data[REWIND_KEY] = rewind.isoformat()
+        return signing.dumps(data, salt=CURSOR_SALT, compress=True)
+
+    def get_changes(self, user, model, position):
+        user_lookup, fields = SYNC_MODELS[model]
+        queryset = model.objects.filter(**{user_lookup: user})
+        if model is Tombstone:
+            # other models i.e. InvestmentEntity have tombstones for backups
+            queryset = queryset.filter(
+                model__in=[model._meta.model_name for model in SYNC_MODELS]
+            )
+        if position:
+            last_modified_at, pk = position
+            queryset = queryset.filter(
+                Q(last_modified_at__gt=last_modified_at)
+                | Q(last_modified_at=last_modified_at, pk__gt=pk)
+            )
+        return list(
+            queryset.order_by("last_modified_at", "pk").values(
+                "id", "last_modified_at", *fields
+            )[:SYNC_PAGE_SIZE + 1]
+        )
+
+    def error_response(self, error, status):
+        data = json.dumps({"error": error})
+        return HttpResponse(data, status=status, content_type="application/json")
+
+    def get(self, request, *args, **kwargs):
+        positions, rewind = {}, None
+        if request.GET.get("since"):
+            try:
+                positions, rewind = self.decode_cursor(request.GET["since"])
+            except signing.SignatureExpired:
+                return self.error_response("cursor expired, sync without it", 410)
+            except (signing.BadSignature, AttributeError, TypeError, ValueError):
+                return self.error_response("invalid cursor", 400)
+
+        # rows modified after this may not be committed yet, earliest of
+        # the pages of this sync
+        overlap_start = timezone.now() - timedelta(seconds=SYNC_OVERLAP)
+        rewind = min(rewind, overlap_start) if rewind else overlap_start
+        changes = {}
+        has_more = False
+        for model in SYNC_MODELS:
+            name = model._meta.model_name
+            rows = self.get_changes(request.user, model, positions.get(name))
+            if len(rows) > SYNC_PAGE_SIZE:
+                rows = rows[:SYNC_PAGE_SIZE]
+                has_more = True
+            if rows:
+                positions[name] = (rows[-1]["last_modified_at"], rows[-1]["id"])
+            changes[name] = rows
+
+        if has_more:
+            # models already sent go back only after the last page,
+            # else they'd be sent again on every page
+            cursor = self.encode_cursor(positions, rewind)
+        else:
+            cursor = self.encode_cursor({
+                model._meta.model_name: min(
+                    positions.get(model._meta.model_name, (rewind, 0)), (rewind, 0)
+                )
+                for model in SYNC_MODELS
+            })
+
+        data = json.dumps(
+            {"changes": changes, "cursor": cursor, "has_more": has_more},
+            cls=DjangoJSONEncoder,
+        )
+        return HttpResponse(data, content_type="application/json")
@@ -0,0 +1,765 @@
+import datetime
+import gzip
+import json
+import os
+import re
+import tempfile
+import time
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, resolve, reverse
+from django.utils import timezone
+
+from account.models import AccountName, AccountNameAmount, NetWorth
+from expense.models import Expense, ExpenseMonthlyRollup, Remark
+from income.models import (
+    Income,
+    IncomeMonthlyRollup,
+    InvestmentEntity,
+    SavingCalculation,
+    Source,
+)
+from utils.backup import create_backup, list_backups, restore_backups
+from utils.constants import TOMBSTONE_RETENTION_DAYS
+from utils.expense_profile import ExpenseProfile
+from utils.helpers import bump_ledger_generation, get_ist_datetime, invalidate_year_expenses
+from utils.ledger_import import ExpenseCSVImport, IncomeCSVImport
+from utils.middleware import SQLInstrumentationMiddleware
+from utils.models import Tombstone
+
+# Create your tests here.
+
+
+class SQLInstrumentationMiddlewareTestCase(TestCase):
+    """
+    Test cases for per-request SQL instrumentation.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+
+    def get_response(self, request):
+        # same statement three times, as in an N+1 loop
+        for _ in range(3):
+            Expense.objects.filter(user=self.user).first()
+        return HttpResponse()
+
+    def test_server_timing_and_log(self):
+        """
+        Sampled requests get Server-Timing header and a log line.
+        """
+        request = RequestFactory().get('/')
+        with override_settings(
+            SQL_INSTRUMENTATION_SAMPLE_RATE=1,
+            SQL_INSTRUMENTATION_SLOW_MS=0,
+            SQL_INSTRUMENTATION_SERVER_TIMING=True,
+        ):
+            middleware = SQLInstrumentationMiddleware(self.get_response)
+        with self.assertLogs('utils.middleware', 'WARNING') as logs:
+            response = middleware(request)
+        self.assertIn('3 queries, 2 duplicate', response['Server-Timing'])
+        self.assertIn('queries=3 duplicates=2', logs.output[0])
+        self.assertIn('duplicated_sql="SELECT', logs.output[0])
+
+    def test_not_sampled(self):
+        """
+        Queries of requests out of sample are not counted,
+        nothing is logged unless they're slow.
+        """
+        with override_settings(
+            SQL_INSTRUMENTATION_SAMPLE_RATE=0, SQL_INSTRUMENTATION_SERVER_TIMING=True
+        ):
+            middleware = SQLInstrumentationMiddleware(self.get_response)
+        with self.assertNoLogs('utils.middleware', 'INFO'):
+            response = middleware(RequestFactory().get('/'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_slow_not_sampled(self):
+        """
+        Slow requests are logged as warning even out of sample.
+        """
+        with override_settings(
+            SQL_INSTRUMENTATION_SAMPLE_RATE=0, SQL_INSTRUMENTATION_SLOW_MS=0
+        ):
+            middleware = SQLInstrumentationMiddleware(self.get_response)
+        with self.assertLogs('utils.middleware', 'WARNING') as logs:
+            middleware(RequestFactory().get('/'))
+        self.assertIn('status=200 total_ms=', logs.output[0])
+        self.assertNotIn('queries=', logs.output[0])
+
+    def test_streaming_response(self):
+        """
+        Queries of a streamed body are counted and logged at its end.
+        """
+        def get_response(request):
+            def content():
+                for _ in range(2):
+                    Expense.objects.filter(user=self.user).first()
+                    yield b'x'
+            return StreamingHttpResponse(content())
+
+        with override_settings(SQL_INSTRUMENTATION_SAMPLE_RATE=1):
+            middleware = SQLInstrumentationMiddleware(get_response)
+        with self.assertLogs('utils.middleware', 'INFO') as logs:
+            response = middleware(RequestFactory().get('/'))
+            self.assertEqual(logs.output, [])
+            self.assertEqual(b''.join(response.streaming_content), b'xx')
+        self.assertIn('queries=2 duplicates=1', logs.output[0])
+
+    def test_server_timing_off(self):
+        """
+        Server-Timing header is only sent when turned on, log line always.
+        """
+        with override_settings(
+            SQL_INSTRUMENTATION_SAMPLE_RATE=1, SQL_INSTRUMENTATION_SERVER_TIMING=False
+        ):
+            middleware = SQLInstrumentationMiddleware(self.get_response)
+        with self.assertLogs('utils.middleware', 'INFO') as logs:
+            response = middleware(RequestFactory().get('/'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertIn('queries=3', logs.output[0])
+
+
+class GenerateDataCommandTestCase(TestCase):
+    """
+    Test cases for synthetic data generation and view benchmarks.
+    """
+
+    def generate(self, prefix='test'):
+        call_command(
+            'generate_data', expenses=[200], years=1, prefix=prefix, stdout=StringIO()
+        )
+        return get_user_model().objects.get(username=f'{prefix}-200')
+
+    def test_generate_data(self):
+        """
+        Generated data is deterministic and rollups are built.
+        """
+        user = self.generate()
+        expenses = Expense.objects.filter(user=user)
+        self.assertEqual(expenses.count(), 200)
+        self.assertEqual(
+            ExpenseMonthlyRollup.objects.filter(user=user).aggregate(Sum('amount')),
+            expenses.aggregate(Sum('amount')),
+        )
+        self.assertTrue(AccountName.objects.filter(user=user).exists())
+        self.assertTrue(NetWorth.objects.filter(user=user).exists())
+
+        other = self.generate(prefix='other')
+        self.assertEqual(
+            list(expenses.order_by('id').values_list('amount', 'timestamp')),
+            list(
+                Expense.objects.filter(user=other)
+                .order_by('id')
+                .values_list('amount', 'timestamp')
+            ),
+        )
+
+    def test_benchmark_views(self):
+        """
+        Benchmark writes timings and query counts of every view.
+        """
+        self.generate()
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'results.json')
+            call_command(
+                'benchmark_views', prefix='test', repeat=1, output=output, stdout=StringIO()
+            )
+            with open(output) as f:
+                results = json.load(f)
+        views = results['users']['test-200']['views']
+        self.assertIn('networth-dashboard', views)
+        # search form's field, so the search is actually filtered
+        self.assertTrue(views['expense-search']['url'].endswith('?remark=food'))
+        for result in views.values():
+            self.assertGreater(result['cold_queries'], 0)
+            self.assertLessEqual(result['warm_queries'], result['cold_queries'])
+
+
+class QueryCountTestCase(TestCase):
+    """
+    Every view makes the same number of queries for a user with two
+    months of data and a user with years of it, so N+1 queries i.e. a
+    query per month or per account fail here. pages of the small user
+    have fewer rows than the large user's full pages of 12 months.
+    """
+    APPS = ('expense', 'income', 'account')
+    # don't need a logged in user, nor depend on user's data, or POST only
+    SKIP = (
+        'account:register', 'account:login', 'account:logout',
+        'expense:bulk_add_expense', 'expense:import_expense', 'income:import-income',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.small = cls.generate('small', expenses=20, extra=1, months=2)
+        cls.large = cls.generate('large', expenses=600, extra=5, years=4)
+
+    @classmethod
+    def generate(cls, prefix, expenses, extra, **span):
+        call_command(
+            'generate_data', expenses=[expenses], prefix=prefix, stdout=StringIO(), **span
+        )
+        user = get_user_model().objects.get(username=f'{prefix}-{expenses}')
+        # day views of both users have expenses to list
+        Expense.objects.create(
+            user=user, amount=100, remark=user.remarks.first(),
+            timestamp=get_ist_datetime().date(),
+        )
+        for i in range(extra):
+            # only entities with 0 percentage can be deleted
+            InvestmentEntity.objects.create(
+                saving_calculation=user.saving_calculation, name=f'fund {i}', percentage=0
+            )
+            account = AccountName.objects.create(user=user, name=f'wallet {i}', type=1)
+            for month in range(1, 13):
+                account.amounts.create(amount=1000 * month, date=datetime.date(2020, month, 1))
+        return user
+
+    def get_urls(self, user):
+        today = get_ist_datetime().date()
+        year, month, day = today.year, today.month, today.day
+        account = AccountName.objects.filter(user=user).first()
+        expense = Expense.objects.filter(user=user).first()
+        income = Income.objects.filter(user=user).first()
+        investment = InvestmentEntity.objects.filter(
+            saving_calculation__user=user
+        ).first()
+        return [
+            reverse('expense:update_expense', kwargs={'id': expense.id}),
+            reverse('expense:search') + '?remark=food',
+            reverse('expense:all_remark_expenses'),
+            reverse('expense:goto_expense', kwargs={'year': year}),
+            reverse('expense:goto_year_expense', kwargs={'year': year}),
+            reverse('expense:goto_expense', kwargs={'year': year, 'month': month}),
+            reverse('expense:remark_monthly_expense', kwargs={'year': year, 'month': month}),
+            reverse('expense:goto_expense', kwargs={'year': year, 'month': month, 'day': day}),
+            reverse('expense:goto_day_expense', kwargs={'year': year, 'month': month, 'day': day}),
+            reverse('expense:get_remark') + '?term=foo',
+            reverse('expense:expense_list'),
+            reverse('expense:day-wise-expense'),
+            reverse('expense:month-wise-expense'),
+            reverse('expense:year-wise-expense'),
+            reverse('expense:add_expense'),
+            reverse('expense:export_expense') + '?remark=food&gzip=1',
+            reverse('expense:get-basic-info'),
+            reverse('expense:get-latest-expenses'),
+            reverse('income:income-list'),
+            reverse('income:year-income-list'),
+            reverse('income:month-income-list'),
+            reverse('income:goto-income-list', kwargs={'year': year, 'month': month}),
+            reverse('income:add-income'),
+            reverse('income:export-income') + '?format=json',
+            reverse('income:get-source') + '?term=sal',
+            reverse('income:source-wise'),
+            reverse('income:update-income', kwargs={'pk': income.pk}),
+            reverse('income:search') + '?source=salary',
+            reverse('income:report'),
+            reverse('income:yearly-report', kwargs={'year': year}),
+            reverse('income:savings-calculation-detail'),
+            reverse('income:savings-calculator'),
+            reverse('income:investment-entity-create'),
+            reverse('income:investment-entity-list'),
+            reverse('income:investment-entity-update', kwargs={'pk': investment.pk}),
+            reverse('income:investment-entity-delete', kwargs={'pk': investment.pk}),
+            reverse('account:change-password'),
+            reverse('account:networth-dashboard'),
+            reverse('account:networth-x'),
+            reverse('account:networth-history'),
+            reverse('account:account-name-list'),
+            reverse('account:account-name-create'),
+            reverse('account:account-name-update', kwargs={'pk': account.pk}),
+            reverse('account:account-name-delete', kwargs={'pk': account.pk}),
+            reverse('account:account-name-amount', kwargs={'pk': account.pk}),
+            reverse('account:account-name-amount-history', kwargs={'pk': account.pk}),
+        ]
+
+    def count_queries(self, user, url):
+        # cold caches, as right after a write
+        bump_ledger_generation(user.id)
+        invalidate_year_expenses(user.id)
+        ExpenseProfile.invalidate(user.id)
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def test_all_views_covered(self):
+        """
+        A view added to the apps' urls needs a url here.
+        """
+        routes = set()
+        for resolver in get_resolver().url_patterns:
+            if isinstance(resolver, URLResolver) and resolver.app_name in self.APPS:
+                for pattern in resolver.url_patterns:
+                    if f'{resolver.app_name}:{pattern.name}' not in self.SKIP:
+                        routes.add(str(resolver.pattern) + str(pattern.pattern).lstrip('^'))
+        covered = {resolve(url.split('?')[0]).route for url in self.get_urls(self.small)}
+        self.assertEqual(routes - covered, set())
+
+    def test_query_count_independent_of_data_size(self):
+        """
+        Same number of queries for small and large data.
+        """
+        for small_url, large_url in zip(self.get_urls(self.small), self.get_urls(self.large)):
+            with self.subTest(url=small_url):
+                self.assertEqual(
+                    self.count_queries(self.small, small_url),
+                    self.count_queries(self.large, large_url),
+                )
+
+
+class CSVImportTestCase(TestCase):
+    """
+    Test cases for CSV import of expenses and incomes.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+
+    def test_import_expenses(self):
+        """
+        Valid rows are imported with existing remarks, invalid ones reported.
+        """
+        remark = Remark.objects.create(user=self.user, name='food')
+        content = (
+            'amount,remark,timestamp\n'
+            '100,Food,2024-03-01\n'
+            '"1,200",rent,01/03/2024\n'
+            'abc,food,2024-03-02\n'
+            '50,,2024-04-10\n'
+            '10,food,31/02/2024\n'
+            '2147483648,food,2024-03-03\n'
+        )
+        upload = SimpleUploadedFile('expenses.csv', content.encode())
+        response = self.client.post(reverse('expense:import_expense'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([error['line'] for error in data['errors']], [4, 6, 7])
+
+        self.assertEqual(Expense.objects.filter(user=self.user, remark=remark).count(), 1)
+        self.assertEqual(
+            Expense.objects.get(user=self.user, remark__name='rent').amount, 1200
+        )
+        self.assertEqual(
+            dict(
+                ExpenseMonthlyRollup.objects.filter(user=self.user)
+                .values_list('month')
+                .annotate(Sum('amount'))
+            ),
+            {datetime.date(2024, 3, 1): 1300, datetime.date(2024, 4, 1): 50},
+        )
+
+    def test_import_incomes_command(self):
+        """
+        Command imports incomes in chunks, reporting progress.
+        """
+        content = 'amount,source,timestamp\n' + ''.join(
+            f'{i},salary,2024-0{i % 3 + 1}-01\n' for i in range(1, 26)
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write(content)
+            f.flush()
+            stdout = StringIO()
+            with mock.patch.object(IncomeCSVImport, 'CHUNK_SIZE', 10):
+                call_command(
+                    'import_csv', f.name, username='test_user', kind='income',
+                    stdout=stdout,
+                )
+        self.assertIn('20 rows imported', stdout.getvalue())
+        self.assertIn('Imported 25 rows', stdout.getvalue())
+        self.assertEqual(Source.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(
+            IncomeMonthlyRollup.objects.filter(user=self.user).aggregate(Sum('amount')),
+            {'amount__sum': sum(range(1, 26))},
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY is only used on postgres')
+    def test_import_with_copy(self):
+        """
+        Rows are inserted with COPY on postgres, with remarks and timestamps.
+        """
+        content = 'amount,remark,timestamp\n' + ''.join(
+            f'{i},{"food" if i % 2 else ""},2024-03-{i:02d}\n' for i in range(1, 26)
+        )
+        with mock.patch.object(
+            ExpenseCSVImport, 'copy', autospec=True, side_effect=ExpenseCSVImport.copy
+        ) as copy, mock.patch.object(ExpenseCSVImport, 'CHUNK_SIZE', 10):
+            importer = ExpenseCSVImport(self.user).run(StringIO(content))
+        self.assertEqual(copy.call_count, 3)
+        self.assertEqual(importer.count, 25)
+        expenses = Expense.objects.filter(user=self.user)
+        self.assertEqual(
+            list(expenses.order_by('timestamp').values_list('amount', 'remark__name', 'timestamp')),
+            [
+                (i, 'food' if i % 2 else None, datetime.date(2024, 3, i))
+                for i in range(1, 26)
+            ],
+        )
+        self.assertFalse(expenses.filter(created_at=None).exists())
+
+    def test_copy_columns_match_rows(self):
+        """
+        COPY lists every column of the table in the order of the
+        values of the rows written, checked by inserting the written
+        rows by the listed columns.
+        """
+        content = 'amount,remark,timestamp\n' + ''.join(
+            f'{i},{"food" if i % 2 else ""},2024-03-{i:02d}\n' for i in range(1, 26)
+        )
+        fake_connection = mock.MagicMock(vendor='postgresql', ops=connection.ops)
+        copy = fake_connection.cursor.return_value.__enter__.return_value.copy
+        write_row = copy.return_value.__enter__.return_value.write_row
+        with mock.patch('utils.ledger_import.connection', fake_connection), \
+                mock.patch.object(ExpenseCSVImport, 'CHUNK_SIZE', 10):
+            ExpenseCSVImport(self.user).run(StringIO(content))
+        self.assertEqual(copy.call_count, 3)
+        self.assertEqual(write_row.call_count, 25)
+
+        table = connection.ops.quote_name(Expense._meta.db_table)
+        match = re.fullmatch(
+            rf'COPY {re.escape(table)} \((.+)\) FROM STDIN', copy.call_args.args[0]
+        )
+        columns = [column.strip('"') for column in match.group(1).split(', ')]
+        fields = {field.column: field.attname for field in Expense._meta.concrete_fields}
+        self.assertEqual(set(fields) - set(columns), {'id'})
+
+        Expense.objects.bulk_create(
+            Expense(**{fields[column]: value for column, value in zip(columns, call.args[0])})
+            for call in write_row.call_args_list
+        )
+        expenses = Expense.objects.filter(user=self.user)
+        self.assertEqual(
+            list(expenses.order_by('timestamp').values_list('amount', 'remark__name', 'timestamp')),
+            [
+                (i, 'food' if i % 2 else None, datetime.date(2024, 3, i))
+                for i in range(1, 26)
+            ],
+        )
+        self.assertFalse(expenses.filter(created_at=None).exists())
+
+    def test_missing_columns(self):
+        """
+        CSV without required columns is rejected.
+        """
+        upload = SimpleUploadedFile('incomes.csv', b'amount,source\n100,salary\n')
+        response = self.client.post(reverse('income:import-income'), {'file': upload})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'missing columns: timestamp'})
+
+
+class SyncViewTestCase(TestCase):
+    """
+    Test cases for delta sync api.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.client.force_login(self.user)
+        self.remark = Remark.objects.create(user=self.user, name='food')
+        self.expense = Expense.objects.create(
+            user=self.user, amount=100, remark=self.remark,
+            timestamp=datetime.date(2024, 3, 1),
+        )
+        self.account = AccountName.objects.create(user=self.user, name='bank', type=1)
+        AccountNameAmount.objects.create(
+            account_name=self.account, amount=1000, date=datetime.date(2024, 3, 1)
+        )
+
+    def sync(self, cursor=None):
+        params = {'since': cursor} if cursor else {}
+        response = self.client.get(reverse('sync'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, data, model):
+        return [row['id'] for row in data['changes'][model]]
+
+    def test_full_and_delta_sync(self):
+        """
+        First sync has all the rows, next one only changed and deleted rows.
+        """
+        data = self.sync()
+        self.assertEqual(self.ids(data, 'expense'), [self.expense.id])
+        self.assertEqual(self.ids(data, 'remark'), [self.remark.id])
+        self.assertEqual(len(data['changes']['accountnameamount']), 1)
+        self.assertFalse(data['has_more'])
+
+        # rows of the overlap window are sent again
+        self.assertEqual(self.ids(self.sync(data['cursor']), 'expense'), [self.expense.id])
+
+        with mock.patch('utils.sync.SYNC_OVERLAP', 0):
+            cursor = self.sync()['cursor']
+            self.expense.amount = 200
+            self.expense.save()
+            new_expense = Expense.objects.create(
+                user=self.user, amount=50, timestamp=datetime.date(2024, 3, 2)
+            )
+            self.account.delete()
+            data = self.sync(cursor)
+
+        self.assertEqual(
+            [(row['id'], row['amount']) for row in data['changes']['expense']],
+            [(self.expense.id, 200), (new_expense.id, 50)],
+        )
+        self.assertEqual(data['changes']['remark'], [])
+        self.assertEqual(
+            sorted(row['model'] for row in data['changes']['tombstone']),
+            ['accountname', 'accountnameamount'],
+        )
+
+    def test_paging(self):
+        """
+        Rows are paged with the cursor while has_more.
+        """
+        for amount in range(3):
+            Expense.objects.create(
+                user=self.user, amount=amount, timestamp=datetime.date(2024, 3, 1)
+            )
+        ids = []
+        cursor = None
+        with mock.patch('utils.sync.SYNC_PAGE_SIZE', 2), \
+                mock.patch('utils.sync.SYNC_OVERLAP', 0):
+            while True:
+                data = self.sync(cursor)
+                ids += self.ids(data, 'expense')
+                cursor = data['cursor']
+                if not data['has_more']:
+                    break
+        expenses = Expense.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(ids, list(expenses.values_list('id', flat=True)))
+
+    def test_paging_doesnt_resend_other_models(self):
+        """
+        Models already sent aren't sent again on next pages, only after
+        the last one.
+        """
+        for amount in range(3):
+            Expense.objects.create(
+                user=self.user, amount=amount, timestamp=datetime.date(2024, 3, 1)
+            )
+        with mock.patch('utils.sync.SYNC_PAGE_SIZE', 2):
+            first = self.sync()
+            self.assertTrue(first['has_more'])
+            self.assertEqual(self.ids(first, 'remark'), [self.remark.id])
+            second = self.sync(first['cursor'])
+            self.assertFalse(second['has_more'])
+            self.assertEqual(second['changes']['remark'], [])
+            self.assertEqual(len(second['changes']['expense']), 2)
+            # overlap is sent again once all the pages are sent
+            self.assertEqual(self.ids(self.sync(second['cursor']), 'remark'), [self.remark.id])
+
+    def test_expired_cursor(self):
+        """
+        Cursors older than tombstone retention need a full sync.
+        """
+        cursor = self.sync()['cursor']
+        later = time.time() + (TOMBSTONE_RETENTION_DAYS + 1) * 24 * 3600
+        # signing's clock only, sessions expire by the real one
+        with mock.patch('django.core.signing.time', mock.Mock(time=lambda: later)):
+            response = self.client.get(reverse('sync'), {'since': cursor})
+        self.assertEqual(response.status_code, 410)
+
+    def test_prune_tombstones(self):
+        """
+        Tombstones older than retention are deleted.
+        """
+        self.expense.delete()
+        self.remark.delete()
+        Tombstone.objects.filter(model='expense').update(
+            last_modified_at=timezone.now() - datetime.timedelta(days=TOMBSTONE_RETENTION_DAYS + 1)
+        )
+        call_command('prune_tombstones', stdout=StringIO())
+        self.assertEqual(
+            list(Tombstone.objects.values_list('model', flat=True)), ['remark']
+        )
+
+    def test_user_deletion(self):
+        """
+        No tombstones are created when user is deleted.
+        """
+        self.user.delete()
+        self.assertFalse(Tombstone.objects.exists())
+
+    def test_invalid_cursor(self):
+        """
+        Tampered cursor is rejected.
+        """
+        response = self.client.get(reverse('sync'), {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class LedgerBackupTestCase(TestCase):
+    """
+    Test cases for incremental ledger backups and their restore.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='test_user',
+            email='test_user@gmail.com',
+            password='asdfghjkl'
+        )
+        self.remark = Remark.objects.create(user=self.user, name='food')
+        self.expense = Expense.objects.create(
+            user=self.user, amount=100, remark=self.remark,
+            timestamp=datetime.date(2024, 3, 1),
+        )
+        Income.objects.create(
+            user=self.user, amount=5000, timestamp=datetime.date(2024, 3, 1)
+        )
+        self.account = AccountName.objects.create(user=self.user, name='bank', type=1)
+        AccountNameAmount.objects.create(
+            account_name=self.account, amount=1000, date=datetime.date(2024, 3, 1)
+        )
+        saving_calculation = SavingCalculation.objects.create(
+            user=self.user, savings_fixed_amount=0, savings_percentage=50,
+            amount_to_keep_in_bank=1000,
+        )
+        self.entity = InvestmentEntity.objects.create(
+            saving_calculation=saving_calculation, name='index fund', percentage=100
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.storage = FileSystemStorage(location=tmp.name)
+
+    def snapshot(self):
+        models = (
+            Remark, Expense, Income, AccountName, AccountNameAmount, NetWorth,
+            InvestmentEntity, Tombstone,
+        )
+        rows = {model: list(model.objects.order_by('pk').values()) for model in models}
+        # rollups are rebuilt, only their totals are the same
+        rows[ExpenseMonthlyRollup] = ExpenseMonthlyRollup.objects.aggregate(
+            Sum('amount'), Sum('count')
+        )
+        return rows
+
+    def test_incremental_backup_and_restore(self):
+        """
+        Restore of full and incremental backups has the rows as they were.
+        """
+        full = create_backup(self.storage)
+        self.assertEqual(full['kind'], 'full')
+
+        self.expense.amount = 200
+        self.expense.save()
+        Expense.objects.create(
+            user=self.user, amount=50, timestamp=datetime.date(2024, 3, 2)
+        )
+        # re-created with the same name after delete
+        self.remark.delete()
+        Remark.objects.create(user=self.user, name='food')
+        self.account.delete()
+        self.entity.delete()
+        incremental = create_backup(self.storage, overlap=0)
+        self.assertEqual(incremental['kind'], 'incremental')
+        # user, tombstones, expenses, remark and today's net worth
+        self.assertEqual(incremental['rows'], 1 + 4 + 2 + 1 + 1)
+
+        expected = self.snapshot()
+        self.user.delete()
+        result = restore_backups(self.storage)
+        self.assertEqual(result['backups'], [full['name'], incremental['name']])
+        self.assertEqual(self.snapshot(), expected)
+        self.assertTrue(
+            self.client.login(username='test_user', password='asdfghjkl')
+        )
+
+        # restore needs an empty database
+        with self.assertRaises(ValueError):
+            restore_backups(self.storage)
+
+    def test_restore_verification(self):
+        """
+        Nothing is restored if rows don't match totals of the backup.
+        """
+        name = create_backup(self.storage)['name']
+        with self.storage.open(name) as f:
+            lines = gzip.decompress(f.read()).decode().splitlines()
+        totals = json.loads(lines[-1])
+        totals['totals']['expense.expense']['amount'] += 1
+        lines[-1] = json.dumps(totals)
+        self.storage.delete(name)
+        self.storage.save(name, ContentFile(gzip.compress('\n'.join(lines).encode())))
+
+        self.user.delete()
+        with self.assertRaisesRegex(ValueError, 'expense.expense'):
+            restore_backups(self.storage)
+        self.assertFalse(get_user_model().objects.exists())
+        self.assertFalse(Expense.objects.exists())
+
+    def test_restore_without_totals(self):
+        """
+        Truncated backup without totals isn't restored unverified.
+        """
+        name = create_backup(self.storage)['name']
+        with self.storage.open(name) as f:
+            lines = gzip.decompress(f.read()).decode().splitlines()
+        self.storage.delete(name)
+        self.storage.save(name, ContentFile(gzip.compress('\n'.join(lines[:-1]).encode())))
+
+        self.user.delete()
+        with self.assertRaisesRegex(ValueError, 'no totals'):
+            restore_backups(self.storage)
+        self.assertFalse(get_user_model().objects.exists())
+
+    def test_failed_backup_removed(self):
+        """
+        Backup is uploaded while rows are read, the partly
+        written file is removed if reading fails.
+        """
+        with mock.patch(
+            'utils.backup._model_totals', side_effect=[{'count': 1}, RuntimeError]
+        ), self.assertRaises(RuntimeError):
+            create_backup(self.storage)
+        self.assertEqual(list_backups(self.storage), [])
+
+        result = create_backup(self.storage)
+        self.assertEqual(list_backups(self.storage), [result['name']])
+        self.assertEqual(result['size'], self.storage.size(result['name']))
+
+    def test_backup_commands(self):
+        """
+        Backup command writes a full backup first, incremental ones after.
+        """
+        with self.settings(
+            DBBACKUP_STORAGE='django.core.files.storage.FileSystemStorage',
+            DBBACKUP_STORAGE_OPTIONS={'location': self.storage.location},
+        ):
+            call_command('backup_ledger', stdout=StringIO())
+            call_command('backup_ledger', stdout=StringIO())
+            self.user.delete()
+            out = StringIO()
+            call_command('restore_ledger', stdout=out)
+        self.assertIn('full', out.getvalue())
+        self.assertIn('incremental', out.getvalue())
+        self.assertEqual(Expense.objects.get().amount, 100)